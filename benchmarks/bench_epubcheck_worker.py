@@ -0,0 +1,107 @@
+"""
+Compara o EPubCheck com uma JVM por livro (java -jar) e com o worker persistente.
+Gera N EPUBs mínimos em um diretório temporário e mede o tempo total de cada modo.
+
+Uso: python benchmarks/bench_epubcheck_worker.py [quantidade]
+"""
+import sys
+import time
+import zipfile
+import tempfile
+import subprocess
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import Config
+from modules.epubcheck_worker import EpubCheckWorker
+
+CONTAINER = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>
+</container>"""
+
+OPF = """<?xml version="1.0" encoding="UTF-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="uid">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:identifier id="uid">urn:uuid:bench-{n}</dc:identifier>
+    <dc:title>Livro {n}</dc:title>
+    <dc:language>pt-BR</dc:language>
+    <meta property="dcterms:modified">2025-01-01T00:00:00Z</meta>
+  </metadata>
+  <manifest>
+    <item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>
+    <item id="c1" href="cap1.xhtml" media-type="application/xhtml+xml"/>
+  </manifest>
+  <spine><itemref idref="c1"/></spine>
+</package>"""
+
+NAV = """<?xml version="1.0" encoding="UTF-8"?>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">
+<head><title>Sumário</title></head>
+<body><nav epub:type="toc"><ol><li><a href="cap1.xhtml">Capítulo 1</a></li></ol></nav></body>
+</html>"""
+
+CHAPTER = """<?xml version="1.0" encoding="UTF-8"?>
+<html xmlns="http://www.w3.org/1999/xhtml">
+<head><title>Capítulo 1</title></head>
+<body><h1>Capítulo 1</h1><p>Texto do livro {n}.</p></body>
+</html>"""
+
+
+def build_epub(path, n):
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        z.writestr("META-INF/container.xml", CONTAINER, compress_type=zipfile.ZIP_DEFLATED)
+        z.writestr("OEBPS/content.opf", OPF.format(n=n), compress_type=zipfile.ZIP_DEFLATED)
+        z.writestr("OEBPS/nav.xhtml", NAV, compress_type=zipfile.ZIP_DEFLATED)
+        z.writestr("OEBPS/cap1.xhtml", CHAPTER.format(n=n), compress_type=zipfile.ZIP_DEFLATED)
+
+
+def run_cold(epubs, out_dir):
+    start = time.perf_counter()
+    for epub in epubs:
+        out = out_dir / f"{epub.stem}_cold.json"
+        subprocess.run(["java", "-jar", Config.EPUBCHECK_JAR, str(epub), "--json", str(out)],
+                       check=False, capture_output=True)
+    return time.perf_counter() - start
+
+
+def run_warm(epubs, out_dir):
+    worker = EpubCheckWorker()
+    start = time.perf_counter()
+    if not worker.start():
+        raise RuntimeError("Worker EPubCheck não iniciou (verifique Java 11+ e EPUBCHECK_JAR).")
+    failures = 0
+    for epub in epubs:
+        out = out_dir / f"{epub.stem}_warm.json"
+        if not worker.check(epub, out):
+            failures += 1
+    elapsed = time.perf_counter() - start
+    worker.stop()
+    return elapsed, failures
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp)
+        epubs = []
+        for n in range(count):
+            path = tmp_path / f"livro_{n:03d}.epub"
+            build_epub(path, n)
+            epubs.append(path)
+
+        cold = run_cold(epubs, tmp_path)
+        warm, failures = run_warm(epubs, tmp_path)
+
+    print(f"EPUBs:              {count}")
+    print(f"JVM por livro:      {cold:.2f}s ({cold / count:.3f}s/livro)")
+    print(f"Worker persistente: {warm:.2f}s ({warm / count:.3f}s/livro, inclui inicialização)")
+    print(f"Ganho:              {cold / warm:.1f}x" if warm else "Ganho: n/a")
+    if failures:
+        print(f"Falhas no worker:   {failures}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark do verificador de links externos sem acesso à rede.
+
+1. Sobe o servidor simulado (link_stub_server) com latência configurável;
+2. Testa uma mistura de URLs (200, 404, 500, redirecionamentos, 429 com Retry-After,
+   HEAD 405 e corpos lentos) gravando uma fita;
+3. Reproduz a fita com e sem a latência gravada.
+
+Para cada rodada mostra tempo total, URLs/s, p50/p95 por URL, requisições e bytes.
+Falha (código 1) se o servidor observar mais requisições simultâneas que os tetos
+configurados ou se a reprodução divergir da gravação.
+
+Todas as URLs do servidor simulado ficam no mesmo host, então o limite de req/s por host
+dominaria o resultado; o benchmark usa um limite próprio (terceiro argumento, padrão 50).
+
+Uso: python benchmarks/bench_link_checker.py [quantidade_de_urls] [latência] [req/s por host]
+     ex.: python benchmarks/bench_link_checker.py 300 lognormal:40:0.5 50
+"""
+import sys
+import time
+import asyncio
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from config import Config
+from modules.link_validator import _probe_urls
+from link_stub_server import StubServer
+
+
+def build_urls(base, count):
+    """Mistura aproximada do que aparece nos livros: maioria 200, alguns quebrados e lentos."""
+    routes = ["ok"] * 10 + ["status/404", "status/500", "redirect/2", "ratelimit/1", "nohead", "slow/256"]
+    return [f"{base}/{routes[i % len(routes)]}/{i}" for i in range(count)]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def run_round(label, urls, cassette, mode, latency=True):
+    Config.LINK_CASSETTE = str(cassette)
+    Config.LINK_CASSETTE_MODE = mode
+    Config.LINK_CASSETTE_LATENCY = latency
+    start = time.perf_counter()
+    results, stats = asyncio.run(_probe_urls(urls))
+    wall = time.perf_counter() - start
+    elapsed = [r["elapsed"] for r in results]
+    print(f"{label:<28} {wall:7.2f}s  {len(urls) / wall:7.1f} URLs/s  "
+          f"p50 {percentile(elapsed, 50) * 1000:6.0f} ms  p95 {percentile(elapsed, 95) * 1000:6.0f} ms  "
+          f"{stats['requests']:5d} req  {stats['bytes'] / 1024:8.1f} KB")
+    return {r["url"]: r["status"] for r in results}
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = sys.argv[2] if len(sys.argv) > 2 else "lognormal:40:0.5"
+    Config.LINK_PER_HOST_RATE = float(sys.argv[3]) if len(sys.argv) > 3 else 50.0
+    # Retry-After curto para o benchmark não ser dominado pela espera do 429
+    Config.LINK_MAX_RETRY_AFTER = 1
+
+    with tempfile.TemporaryDirectory() as tmp, StubServer(latency=latency, retry_after=1) as server:
+        cassette = Path(tmp) / "links.json"
+        urls = build_urls(server.base_url, count)
+        print(f"{count} URLs, latência {latency}, teto global {Config.LINK_MAX_CONCURRENCY}, "
+              f"por host {Config.LINK_PER_HOST_CONCURRENCY}, {Config.LINK_PER_HOST_RATE} req/s por host\n")
+
+        recorded = run_round("Gravação (servidor local)", urls, cassette, "record")
+        peak = server.peak_in_flight
+        server.reset_stats()
+        replayed = run_round("Reprodução (com latência)", urls, cassette, "replay")
+        replayed_fast = run_round("Reprodução (sem latência)", urls, cassette, "replay", latency=False)
+        replay_requests = server.requests
+
+    print(f"\nPico de requisições simultâneas no servidor: {peak}")
+    failures = []
+    # Todas as URLs estão no mesmo host, então o teto efetivo é o menor dos dois
+    cap = min(Config.LINK_MAX_CONCURRENCY, Config.LINK_PER_HOST_CONCURRENCY)
+    if peak > cap:
+        failures.append(f"concorrência {peak} acima do teto {cap}")
+    if replay_requests:
+        failures.append(f"reprodução acessou a rede ({replay_requests} requisições)")
+    if recorded != replayed or recorded != replayed_fast:
+        diff = sum(1 for url in recorded if recorded[url] != replayed.get(url) or recorded[url] != replayed_fast.get(url))
+        failures.append(f"{diff} URLs com status diferente entre gravação e reprodução")
+
+    if failures:
+        for failure in failures:
+            print(f"FALHA: {failure}")
+        sys.exit(1)
+    print("OK: concorrência dentro dos tetos e reprodução idêntica à gravação.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Servidor HTTP local que simula os sites referenciados nos livros, para testar o
+verificador de links sem rede.
+
+Rotas:
+  /ok/<id>                     200
+  /status/<código>/<id>        código informado (404, 500...)
+  /redirect/<n>/<id>           cadeia de n redirecionamentos 302 terminando em /ok/<id>
+  /ratelimit/<n>/<id>          429 com Retry-After nas n primeiras requisições, depois 200
+  /slow/<kb>/<id>              200 com corpo de <kb> KB enviado devagar
+  /nohead/<id>                 HEAD responde 405, GET responde 200
+
+A latência de cada resposta segue a distribuição configurada (fixed, uniform ou lognormal).
+O servidor conta requisições e registra o pico de requisições simultâneas.
+
+Uso: python benchmarks/link_stub_server.py --port 8765 --latency lognormal:50:0.6
+"""
+import sys
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def parse_latency(spec):
+    """'fixed:ms', 'uniform:min_ms:max_ms' ou 'lognormal:mediana_ms:sigma' -> função que sorteia segundos."""
+    kind, *args = spec.split(":")
+    values = [float(a) for a in args]
+    if kind == "fixed":
+        return lambda: values[0] / 1000
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1]) / 1000
+    if kind == "lognormal":
+        import math
+        return lambda: random.lognormvariate(math.log(values[0]), values[1]) / 1000
+    raise ValueError(f"Distribuição de latência desconhecida: {spec}")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _respond(self, code, headers=None, body_kb=0, slow=False):
+        self.send_response(code)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(body_kb * 1024))
+        self.end_headers()
+        if self.command == "HEAD" or not body_kb:
+            return
+        chunk = b"x" * 1024
+        try:
+            for _ in range(body_kb):
+                self.wfile.write(chunk)
+                if slow:
+                    time.sleep(0.002)
+        except (BrokenPipeError, ConnectionResetError):
+            # Cliente fechou a conexão após ler os cabeçalhos (comportamento esperado do GET em streaming)
+            self.server.aborted_bodies += 1
+
+    def _handle(self):
+        server = self.server
+        with server.lock:
+            server.in_flight += 1
+            server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+            server.requests += 1
+            server.hits[self.path] = server.hits.get(self.path, 0) + 1
+            hits = server.hits[self.path]
+        try:
+            time.sleep(server.latency())
+            parts = self.path.split("?")[0].strip("/").split("/")
+            route = parts[0] if parts else ""
+
+            if route == "ok":
+                self._respond(200)
+            elif route == "status":
+                self._respond(int(parts[1]))
+            elif route == "redirect":
+                remaining = int(parts[1])
+                rest = "/".join(parts[2:])
+                target = f"/redirect/{remaining - 1}/{rest}" if remaining > 1 else f"/ok/{rest}"
+                self._respond(302, {"Location": target})
+            elif route == "ratelimit":
+                limit = int(parts[1])
+                if hits <= limit:
+                    self._respond(429, {"Retry-After": str(server.retry_after)})
+                else:
+                    self._respond(200)
+            elif route == "slow":
+                self._respond(200, body_kb=int(parts[1]), slow=True)
+            elif route == "nohead":
+                self._respond(405 if self.command == "HEAD" else 200)
+            else:
+                self._respond(404)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    do_HEAD = _handle
+    do_GET = _handle
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, latency="fixed:20", retry_after=1):
+        super().__init__(("127.0.0.1", port), StubHandler)
+        self.latency = parse_latency(latency)
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.reset_stats()
+        self._thread = None
+
+    def reset_stats(self):
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.aborted_bodies = 0
+        self.hits = {}
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor HTTP simulado para o verificador de links.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="lognormal:50:0.6")
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+    server = StubServer(args.port, args.latency, args.retry_after)
+    print(f"Servidor simulado em {server.base_url} (latência {args.latency}). Ctrl+C para sair.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,10 +15,75 @@ class Config:
     AI_BASE_URL = os.getenv("AI_BASE_URL", "http://192.168.28.70:1234/v1")
     AI_API_KEY = os.getenv("AI_API_KEY", "lm-studio")
     AI_MODEL = os.getenv("AI_MODEL", "qwen3-vl-8b")
+    # Gateway de IA: requisições simultâneas (vagas paralelas do servidor), timeout por tentativa e retentativas
+    AI_MAX_IN_FLIGHT = int(os.getenv("AI_MAX_IN_FLIGHT", "2"))
+    AI_TIMEOUT = float(os.getenv("AI_TIMEOUT", "180"))
+    AI_RETRIES = int(os.getenv("AI_RETRIES", "2"))
+    AI_RETRY_BACKOFF = float(os.getenv("AI_RETRY_BACKOFF", "2"))
+    # Disjuntor: após N falhas seguidas a IA é pulada na hora; sonda de saúde a cada AI_BREAKER_COOLDOWN segundos
+    AI_BREAKER_THRESHOLD = int(os.getenv("AI_BREAKER_THRESHOLD", "3"))
+    AI_BREAKER_COOLDOWN = float(os.getenv("AI_BREAKER_COOLDOWN", "60"))
+    AI_PROBE_TIMEOUT = float(os.getenv("AI_PROBE_TIMEOUT", "5"))
     
     # Feature Flags
     ENABLE_VISION_AI = os.getenv("ENABLE_VISION_AI", "False").lower() in ("true", "1", "t", "yes")
+    # Páginas renderizadas ao mesmo tempo no Chromium compartilhado (um contexto isolado por livro)
+    VISION_PAGE_CONCURRENCY = int(os.getenv("VISION_PAGE_CONCURRENCY", "4"))
+    # Origem das páginas: "zip" (membros servidos sob demanda do pacote aberto) ou "extract" (extrai tudo em disco)
+    VISION_RENDER_SOURCE = os.getenv("VISION_RENDER_SOURCE", "zip")
+    # Capturas endereçadas por conteúdo (XHTML + CSS/imagens usados + viewport + elemento), com descarte LRU
+    RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", "cache/renders")
+    RENDER_CACHE_MAX_MB = int(os.getenv("RENDER_CACHE_MAX_MB", "500"))
+    # Respostas do modelo de visão por captura + prompt + modelo; capturas quase idênticas
+    # no mesmo livro (distância de Hamming do dHash de 512 bits) são analisadas uma só vez
+    VISION_CACHE_DIR = os.getenv("VISION_CACHE_DIR", "cache/vision")
+    VISION_CACHE_MAX_MB = int(os.getenv("VISION_CACHE_MAX_MB", "50"))
+    VISION_DEDUPE_DISTANCE = int(os.getenv("VISION_DEDUPE_DISTANCE", "6"))
     
+    # EPubCheck Worker (JVM persistente; fallback automático para subprocess)
+    EPUBCHECK_WORKER = os.getenv("EPUBCHECK_WORKER", "False").lower() in ("true", "1", "t", "yes")
+    EPUBCHECK_WORKER_TIMEOUT = float(os.getenv("EPUBCHECK_WORKER_TIMEOUT", "600"))
+    EPUBCHECK_WORKER_STARTUP_TIMEOUT = float(os.getenv("EPUBCHECK_WORKER_STARTUP_TIMEOUT", "60"))
+
+    # Result Cache (por SHA-256 do EPUB + versão do EPubCheck + versão da ferramenta)
+    # Incrementar sempre que uma verificação mudar, para invalidar resultados antigos
+    TOOL_VERSION = "2025.5"
+    RESULT_CACHE = os.getenv("RESULT_CACHE", "True").lower() in ("true", "1", "t", "yes")
+    RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "cache/results")
+    RESULT_CACHE_MAX_MB = int(os.getenv("RESULT_CACHE_MAX_MB", "200"))
+    MEMBER_FACTS_DIR = os.getenv("MEMBER_FACTS_DIR", "cache/members")
+
+    # Batch Mode (livros processados em paralelo)
+    BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "1"))
+
+    # Pipeline por livro (estágios independentes em paralelo)
+    PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "4"))
+
+    # External Links (concorrência global, limite por host e novas tentativas)
+    LINK_MAX_CONCURRENCY = int(os.getenv("LINK_MAX_CONCURRENCY", "20"))
+    LINK_PER_HOST_CONCURRENCY = int(os.getenv("LINK_PER_HOST_CONCURRENCY", "4"))
+    LINK_PER_HOST_RATE = float(os.getenv("LINK_PER_HOST_RATE", "5"))
+    LINK_TIMEOUT = float(os.getenv("LINK_TIMEOUT", "10"))
+    LINK_RETRIES = int(os.getenv("LINK_RETRIES", "3"))
+    LINK_BACKOFF_BASE = float(os.getenv("LINK_BACKOFF_BASE", "0.5"))
+    LINK_BACKOFF_MAX = float(os.getenv("LINK_BACKOFF_MAX", "10"))
+    LINK_MAX_RETRY_AFTER = float(os.getenv("LINK_MAX_RETRY_AFTER", "30"))
+    LINK_RANGE_PROBE = os.getenv("LINK_RANGE_PROBE", "True").lower() in ("true", "1", "t", "yes")
+    # Fita de links (record/replay) para benchmarks sem rede; vazio desativa
+    LINK_CASSETTE = os.getenv("LINK_CASSETTE", "")
+    LINK_CASSETTE_MODE = os.getenv("LINK_CASSETTE_MODE", "replay")
+    # Reproduz a latência gravada (False mede só o custo do próprio verificador)
+    LINK_CASSETTE_LATENCY = os.getenv("LINK_CASSETTE_LATENCY", "True").lower() in ("true", "1", "t", "yes")
+
+    # Cache de Links (SQLite compartilhado entre livros; modos: normal, refresh, off)
+    LINK_CACHE_PATH = os.getenv("LINK_CACHE_PATH", "cache/links.sqlite")
+    LINK_CACHE_MODE = os.getenv("LINK_CACHE_MODE", "normal")
+    LINK_CACHE_SUCCESS_TTL_HOURS = float(os.getenv("LINK_CACHE_SUCCESS_TTL_HOURS", "168"))
+    LINK_CACHE_FAILURE_TTL_HOURS = float(os.getenv("LINK_CACHE_FAILURE_TTL_HOURS", "6"))
+
+    # Relatório: lista também os itens aprovados no console de logs (padrão: só a contagem)
+    VERBOSE_REPORT = os.getenv("VERBOSE_REPORT", "False").lower() in ("true", "1", "t", "yes")
+
     # Paths
     EPUBCHECK_JAR = os.getenv("EPUBCHECK_JAR", "epubcheck-5.1.0/epubcheck.jar")
     REPORTS_DIR = os.getenv("REPORTS_DIR", "reports")
@@ -1,102 +1,123 @@
+import io
 import os
+import re
+import sys
+import html
 import time
+import argparse
+import multiprocessing
+import contextlib
+from functools import partial
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 import glob
 import json
 import subprocess
-import shutil
-import zipfile
-from lxml import etree
 from pathlib import Path
-from colorama import init, Fore
+from colorama import init, Fore, Style
 from config import Config
-from modules.structural import check_toc_and_pagelist, get_typesetting_credit, check_filenames
+from modules.structural import check_toc_and_pagelist, get_typesetting_credit, check_filenames, validate_internal_references
 from modules.css_checker import validate_css_rules, validate_limitador_and_structures
 from modules.vision_ai import check_visual_layout, get_ai_tech_advice
-import asyncio
+from modules.ai_gateway import get_gateway, shutdown_gateway, share_slots, ai_available, unavailable_reason
 from modules.link_validator import validate_external_links
 from modules.interactivity import validate_activities
 from modules.image_validator import validate_image_sizes
+from modules.epub_package import EpubPackage, PathIndex
+from modules.epubcheck_worker import run_in_worker
+from modules.epubcheck_report import iter_messages
+from modules.result_cache import ResultCache
+from modules.member_facts import MemberFacts
+from modules.pipeline import Pipeline
+from modules import report_renderer
+from modules.report_renderer import ReportWriter, finding_lines
+from modules.json_report import generate_json_report, FindingsStream
+from modules.findings import as_findings, problems
 
 init(autoreset=True)
 
-def run_epubcheck(epub_path):
+def run_epubcheck(pkg):
     jar_path = Config.EPUBCHECK_JAR
-    report_json = Path(f"reports/{Path(epub_path).stem}_check.json")
-    command = ["java", "-jar", jar_path, epub_path, "--json", str(report_json)]
-    subprocess.run(command, check=False, capture_output=True)
+    report_json = Path(f"reports/{Path(pkg.epub_path).stem}_check.json")
+    # Remove JSON de execução anterior para não ler um relatório obsoleto se a validação falhar
+    report_json.unlink(missing_ok=True)
+    if not (Config.EPUBCHECK_WORKER and run_in_worker(pkg.epub_path, report_json)):
+        command = ["java", "-jar", jar_path, pkg.epub_path, "--json", str(report_json)]
+        subprocess.run(command, check=False, capture_output=True)
     
     summary = {"FATAL": 0, "ERROR": 0, "WARNING": 0, "USAGE": 0, "messages": []}
     if report_json.exists():
-        with open(report_json, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            msgs = data.get('messages', [])
+        meta = {}
+        # Caminho relatado pelo EPubCheck -> membro do ZIP (None se não resolvido, para não repetir a busca)
+        resolved = {}
+
+        # Mensagens lidas uma a uma do JSON: o parse não carrega o arquivo inteiro. A lista do resumo
+        # ainda cresce com o número de mensagens (relatório, conselhos da IA e cache de resultados a usam);
+        # severidades, caminhos e textos repetidos são internados para ocupar uma única string
+        for m in iter_messages(report_json, meta):
+            sev = m.get('severity', 'UNKNOWN')
+            # A contagem será feita por localização para bater com a tabela
             
-            # Cache de arquivos para não ler repetidamente o mesmo arquivo do zip
-            file_cache = {}
-
-            for m in msgs:
-                sev = m.get('severity', 'UNKNOWN')
-                # A contagem será feita por localização para bater com a tabela
-                
-                locations = m.get('locations', [])
-                if locations:
-                    for loc in locations:
-                        file_path = loc.get('path', 'N/A')
-                        line_no = loc.get('line', -1)
-                        col = loc.get('column', -1)
-                        
-                        # Tenta extrair o conteúdo da linha se houver localização
-                        line_snippet = ""
-                        if file_path != 'N/A' and line_no > 0:
-                            try:
-                                if file_path not in file_cache:
-                                    with zipfile.ZipFile(epub_path, 'r') as z:
-                                        # Normaliza busca no zip (ignora case e caminhos parciais)
-                                        # EPubCheck costuma retornar caminhos relativos à raiz do zip
-                                        zip_file_name = next((f for f in z.namelist() if file_path.replace("\\", "/").lower() in f.lower()), None)
-                                        if zip_file_name:
-                                            with z.open(zip_file_name) as zf:
-                                                file_cache[file_path] = zf.read().decode('utf-8', errors='ignore').splitlines()
-                                
-                                if file_path in file_cache:
-                                    lines = file_cache[file_path]
-                                    if 0 < line_no <= len(lines):
-                                        line_snippet = lines[line_no-1].strip()
-                            except:
-                                pass
-
-                        # Tenta extrair o ID do fragmento se for erro de fragmento
-                        error_text = m.get('message', '')
-                        if line_snippet and ("fragment" in error_text.lower() or "fragmento" in error_text.lower()):
-                            import re
-                            # Busca o que vem depois do # até a aspa
-                            fid_match = re.search(r'#([^"\'>\s]*)', line_snippet)
-                            if fid_match:
-                                error_text += f" (ID: <strong style='color:#c0392b;'>#{fid_match.group(1)}</strong>)"
-
-                        # Formatar localização de forma legível
-                        if line_no > 0 and col > 0:
-                            loc_str = f"{file_path} (linha {line_no}, coluna {col})"
-                        elif line_no > 0:
-                            loc_str = f"{file_path} (linha {line_no})"
-                        else:
-                            loc_str = file_path
-                        
-                        if sev in summary: summary[sev] += 1
-                        summary['messages'].append({
-                            "severity": sev,
-                            "location": loc_str,
-                            "text": error_text,
-                            "snippet": line_snippet
-                        })
-                else:
+            locations = m.get('locations', [])
+            if locations:
+                for loc in locations:
+                    file_path = loc.get('path', 'N/A')
+                    line_no = loc.get('line', -1)
+                    col = loc.get('column', -1)
+                    
+                    # Tenta extrair o conteúdo da linha se houver localização
+                    line_snippet = ""
+                    if file_path != 'N/A' and line_no > 0:
+                        try:
+                            if file_path not in resolved:
+                                # Normaliza busca no zip (índice exato, minúsculo e por sufixo)
+                                # EPubCheck costuma retornar caminhos relativos à raiz do zip
+                                match = pkg.paths.lookup(PathIndex.normalize(None, file_path), allow_basename=True)
+                                resolved[file_path] = match.member
+                            
+                            member = resolved[file_path]
+                            if member:
+                                line_snippet = pkg.line(member, line_no).strip()
+                        except:
+                            pass
+
+                    # Tenta extrair o ID do fragmento se for erro de fragmento
+                    error_text = m.get('message', '')
+                    if line_snippet and ("fragment" in error_text.lower() or "fragmento" in error_text.lower()):
+                        # Busca o que vem depois do # até a aspa
+                        fid_match = re.search(r'#([^"\'>\s]*)', line_snippet)
+                        if fid_match:
+                            error_text += f" (ID: <strong style='color:#c0392b;'>#{fid_match.group(1)}</strong>)"
+
+                    # Formatar localização de forma legível
+                    if line_no > 0 and col > 0:
+                        loc_str = f"{file_path} (linha {line_no}, coluna {col})"
+                    elif line_no > 0:
+                        loc_str = f"{file_path} (linha {line_no})"
+                    else:
+                        loc_str = file_path
+                    
                     if sev in summary: summary[sev] += 1
                     summary['messages'].append({
-                        "severity": sev,
-                        "location": m.get('fileName', 'N/A'),
-                        "text": m.get('message', ''),
-                        "snippet": ""
+                        "severity": sys.intern(sev),
+                        "file": sys.intern(file_path) if file_path != 'N/A' else None,
+                        "line": line_no if line_no > 0 else None,
+                        "location": loc_str,
+                        "text": sys.intern(error_text),
+                        "snippet": line_snippet
                     })
+            else:
+                if sev in summary: summary[sev] += 1
+                summary['messages'].append({
+                    "severity": sys.intern(sev),
+                    "file": m.get('fileName'),
+                    "line": None,
+                    "location": m.get('fileName', 'N/A'),
+                    "text": sys.intern(m.get('message', '')),
+                    "snippet": ""
+                })
+        summary['checker_version'] = (meta.get('checker') or {}).get('checkerVersion')
     return summary
 
 def generate_html_report(epub_name, data):
@@ -113,20 +134,27 @@ def generate_html_report(epub_name, data):
     
     counter = SectionCounter()
 
-    error_rows = ""
-    for m in eb['messages']:
-        color = "var(--error)" if m['severity'] in ['FATAL', 'ERROR'] else "var(--warning)" if m['severity'] == 'WARNING' else "var(--info)"
-        snippet_html = f"<div class='snippet'><code>{m.get('snippet', '')}</code></div>" if m.get('snippet') else ""
-        error_rows += f"<tr><td><span class='badge' style='background:{color}'>{m['severity']}</span></td><td>{m['location']}</td><td>{m['text']}{snippet_html}</td></tr>"
-
-    # Sort external links: errors (non-200) first, then alphabetical by URL
-    sorted_links = sorted(data.get('external_links', []), key=lambda x: (x['status'] == 200, x['url']))
-
-    # Gerar tabela de links externos
-    ext_links_rows = ""
-    for link in sorted_links:
-        status_color = "green" if link['status'] == 200 else "red"
-        ext_links_rows += f"<tr><td>{link['url']}</td><td style='color:{status_color}'>{link['status']}</td></tr>"
+    # Linhas das tabelas grandes (geradas sob demanda e gravadas como JSON compacto)
+    def epubcheck_rows():
+        for m in eb['messages']:
+            yield [m['severity'], m['location'], m['text'], m.get('snippet', '')]
+
+    def link_rows():
+        # Sort external links: errors first, then alphabetical by URL
+        for link in sorted(data.get('external_links', []), key=lambda x: (x['ok'], x['url'])):
+            if link.get('cached'):
+                checked = time.strftime('%d/%m %H:%M', time.localtime(link['checked_at'])) if link.get('checked_at') else ""
+                origin = f"<span style='color:var(--text-muted)'>cache {checked}</span>"
+            else:
+                origin = "testado agora"
+            # Onde o link aparece (arquivo:linha e tag), para localizar o capítulo sem novas requisições
+            occurrences = link.get('occurrences', [])
+            locations = ", ".join(f"{o['file']}:{o['line']}" + (f" &lt;{o['tag']}&gt;" if o['tag'] != 'a' else "") for o in occurrences)
+            locations_html = f"{len(occurrences)} ocorrência(s): {locations}" if occurrences else ""
+            yield [link['url'], link['status'], origin, locations_html, "OK" if link['ok'] else "Com erro"]
+
+    # Referências internas quebradas (hrefs de conteúdo sem destino)
+    broken_refs = data.get('broken_internal_refs', [])
 
     # Lista de ficheiros sem limitador
     missing_divs = data.get('limitador_missing', [])
@@ -149,661 +177,568 @@ def generate_html_report(epub_name, data):
     invalid_images = data.get('invalid_images', [])
     images_html = "".join([f"<li style='color:var(--error)'>{marker_fail} {item['path']} ({item['width']}x{item['height']} = {item['pixels']:,}px)</li>" for item in invalid_images]) if invalid_images else f"<li>{marker_pass} Todas as imagens estão dentro do limite.</li>"
 
-    # Filtro de Terminal Logs
-    filtered_logs = []
-    for log in data.get('structure_logs', []):
-        if is_secad:
-            if ".limitador" in log or "PageList" in log or "Página" in log:
-                continue
-        filtered_logs.append(log)
+    # Linha do tempo dos estágios (início/fim) com o caminho crítico destacado
+    stage_labels = {
+        'epubcheck': "EPubCheck", 'typesetter': "Créditos", 'structure': "Estrutura",
+        'css_analysis': "Análise CSS", 'xhtml_analysis': "Análise XHTML", 'external_links': "Links Externos",
+        'filenames': "Nomenclatura", 'vision_ai': "Visão IA", 'ai_advice': "Conselhos IA",
+        'image_sizes': "Imagens", 'interactivity': "Atividades"
+    }
+    stage_times = data.get('stage_times', {})
+    critical_path = data.get('critical_path', [])
+    span_total = max([end for _, end in stage_times.values()] + [0.001])
+    timeline_rows = "".join(
+        report_renderer.render(
+            "timeline_row.html", label=stage_labels.get(name, name),
+            left=f"{t_start / span_total * 100:.2f}", width=f"{max((t_end - t_start) / span_total * 100, 0.5):.2f}",
+            color="var(--error)" if name in critical_path else "var(--accent)", span=f"{t_start:.2f}s → {t_end:.2f}s")
+        for name, (t_start, t_end) in sorted(stage_times.items(), key=lambda item: item[1][0]))
+    critical_label = " → ".join(stage_labels.get(n, n) for n in critical_path)
+    timeline_html = report_renderer.render("timeline.html", critical_label=critical_label, rows=timeline_rows) if stage_times else ""
+
+    # Filtro de Terminal Logs (Secad não usa .limitador nem PageList)
+    filtered_findings = [f for f in data.get('findings', []) if not (is_secad and f.check in ("limitador", "pagelist"))]
+    verbose = data.get('verbose', False)
 
     header_credit = f"<span class='stat-label'>Créditos: Secad</span>" if is_secad else f"<span class='stat-label'>Créditos: {data.get('typesetter', 'Não identificado')}</span>"
 
-    html = f"""
-    <!DOCTYPE html>
-    <html lang="pt-br">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Relatório de Validação | {epub_name}</title>
-        <link rel="preconnect" href="https://fonts.googleapis.com">
-        <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
-        <link href="https://fonts.googleapis.com/css2?family=Bricolage+Grotesque:opsz,wght@12..96,700&family=Outfit:wght@300;400;600&display=swap" rel="stylesheet">
-        <style>
-            :root {{
-                --bg: #fdfdfc;
-                --surface: #ffffff;
-                --text: #1a1a1b;
-                --text-muted: #626264;
-                --accent: #1b4332;
-                --border: #e8e8e6;
-                --error: #c0392b;
-                --warning: #d35400;
-                --info: #2980b9;
-                --shadow: 0 10px 30px -10px rgba(0,0,0,0.05);
-            }}
-
-            * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-            
-            body {{ 
-                font-family: 'Outfit', sans-serif; 
-                background: var(--bg); 
-                color: var(--text); 
-                line-height: 1.6;
-                padding: 40px 20px;
-                -webkit-font-smoothing: antialiased;
-            }}
-
-            .container {{ 
-                max-width: 1100px; 
-                margin: 0 auto; 
-            }}
-
-            header {{
-                margin-bottom: 60px;
-                border-bottom: 4px solid var(--text);
-                padding-bottom: 30px;
-                display: flex;
-                flex-direction: column;
-                gap: 20px;
-            }}
-
-            h1 {{ 
-                font-family: 'Bricolage Grotesque', sans-serif;
-                font-size: clamp(2.5rem, 8vw, 4.5rem);
-                line-height: 0.95;
-                letter-spacing: -0.04em;
-                text-transform: uppercase;
-                color: var(--text);
-            }}
-
-            .header-meta {{
-                display: flex;
-                flex-wrap: wrap;
-                align-items: center;
-                gap: 20px;
-                font-weight: 600;
-            }}
-
-            h2 {{ 
-                font-family: 'Bricolage Grotesque', sans-serif;
-                font-size: 1.8rem;
-                margin-bottom: 25px;
-                letter-spacing: -0.02em;
-                display: flex;
-                align-items: baseline;
-                gap: 10px;
-            }}
-            
-            h2 small {{ font-size: 0.5em; color: var(--text-muted); font-weight: normal; }}
-
-            .card {{ 
-                background: var(--surface); 
-                padding: 40px; 
-                border: 1px solid var(--border);
-                margin-bottom: 40px; 
-                box-shadow: var(--shadow);
-            }}
-
-            table {{ 
-                width: 100%; 
-                border-collapse: collapse; 
-                margin-top: 10px; 
-            }}
-
-            th {{ 
-                text-align: left; 
-                padding: 15px 10px; 
-                border-bottom: 2px solid var(--text);
-                font-size: 0.75rem;
-                text-transform: uppercase;
-                letter-spacing: 0.1em;
-                color: var(--text-muted);
-            }}
-
-            td {{ 
-                padding: 15px 10px; 
-                border-bottom: 1px solid var(--border); 
-                font-size: 0.95rem;
-                vertical-align: top;
-            }}
-
-            .badge {{ 
-                display: inline-block;
-                padding: 4px 12px; 
-                font-size: 0.7rem;
-                text-transform: uppercase;
-                letter-spacing: 0.05em;
-                border-radius: 2px; 
-                color: white; 
-                font-weight: 700; 
-            }}
-            
-            .snippet {{
-                background: #f8f8f8;
-                border-left: 3px solid var(--text);
-                padding: 12px;
-                margin-top: 10px;
-                font-family: 'SFMono-Regular', Consolas, 'Liberation Mono', Menlo, monospace;
-                font-size: 0.8rem;
-                color: #444;
-                overflow-x: auto;
-            }}
-
-            .ai-advice-container {{
-                background: #f0f4f2;
-                padding: 30px;
-                border: 1px solid #d1dbd4;
-                font-size: 1.1rem;
-                line-height: 1.6;
-                color: #1b4332;
-            }}
-
-            .screenshot-thumb {{ 
-                width: 100%;
-                max-width: 400px;
-                cursor: zoom-in; 
-                border: 1px solid var(--border);
-                margin-top: 15px;
-                filter: grayscale(0.2);
-                transition: filter 0.3s;
-            }}
-            
-            .screenshot-thumb:hover {{ filter: grayscale(0); }}
-
-            .log-console {{
-                background: #1a1a1b;
-                color: #e0e0e0;
-                padding: 25px;
-                font-family: monospace;
-                font-size: 0.85rem;
-                max-height: 500px;
-                overflow-y: auto;
-                border: 1px solid #333;
-            }}
-
-            .log-line {{
-                padding: 4px 0;
-                border-bottom: 1px solid #2a2a2b;
-            }}
-
-            /* Modal Lightbox */
-            .lightbox {{ display: none; position: fixed; z-index: 1000; left: 0; top: 0; width: 100%; height: 100%; background-color: rgba(255,255,255,0.95); cursor: zoom-out; }}
-            .lightbox-content {{ margin: auto; display: block; max-width: 90%; max-height: 90vh; position: absolute; top: 50%; left: 50%; transform: translate(-50%, -50%); box-shadow: 0 30px 60px rgba(0,0,0,0.1); border: 1px solid var(--border); }}
-            .close {{ position: absolute; top: 30px; right: 40px; color: var(--text); font-size: 3rem; font-weight: 300; cursor: pointer; }}
-        </style>
-        <script>
-            function openModal(src) {{
-                var modal = document.getElementById("myModal");
-                var modalImg = document.getElementById("img01");
-                modal.style.display = "block";
-                modalImg.src = src;
-            }}
-            function closeModal() {{
-                document.getElementById("myModal").style.display = "none";
-            }}
-        </script>
-    </head>
-    <body>
-        <div class="container">
-            <header>
-                <h1>{epub_name}</h1>
-                <div class="header-meta">
-                    {header_credit}
-                </div>
-            </header>
-
-            <section class="card">
-                <div style="display:flex; justify-content:space-between; align-items:center; margin-bottom:25px;">
-                    <h2 style="margin-bottom:0">{counter.next()}. Relatório EPubCheck</h2>
-                    <div class="badge-group">
-                        <span class="badge" style="background:var(--error)">{eb['FATAL'] + eb['ERROR']} Erros</span>
-                        <span class="badge" style="background:var(--warning)">{eb['WARNING']} Avisos</span>
-                        <span class="badge" style="background:var(--info)">{eb['USAGE']} Alertas</span>
-                    </div>
-                </div>
-                <table>
-                    <thead>
-                        <tr>
-                            <th>Status</th>
-                            <th>Localização</th>
-                            <th>Mensagem</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-                        {error_rows if error_rows else "<tr><td colspan='3'>Nenhum erro encontrado.</td></tr>"}
-                    </tbody>
-                </table>
-            </section>
-    """
+    def status_item(label, ok, fail_marker="[      FALHOU      ]", fail_color='#c0392b'):
+        return report_renderer.render("status_item.html", label=label, color='#27ae60' if ok else fail_color,
+                                      marker="[      PASSOU      ]" if ok else fail_marker)
+
+    def perf_row(label, value, value_style="font-weight:600;"):
+        return report_renderer.render("performance_row.html", label=label, value=value, value_style=value_style)
+
+    timings = data['timings']
+    link_stats = data.get('link_stats', {})
+    package_stats = data.get('package_stats', {})
+    member_facts_stats = data.get('member_facts_stats', {})
+    vision_stats = data.get('vision_stats', {})
+    ai_stats = data.get('ai_stats', {})
+
+    # Seções gravadas no arquivo à medida que são montadas
+    with ReportWriter(report_path) as out:
+        out.head(epub_name, header_credit)
+
+        out.render("epubcheck.html", number=counter.next(), errors=eb['FATAL'] + eb['ERROR'],
+                   warnings=eb['WARNING'], usage=eb['USAGE'])
+        out.data_table("epubcheck", ["Status", "Localização", "Mensagem"], epubcheck_rows(), "epubcheck",
+                       "Nenhum erro encontrado.", facet=0, facet_label="Severidade")
+        out.write("        </section>\n")
+
+        # Seção condicional: servidor de IA fora do ar (disjuntor aberto)
+        if data.get('ai_unavailable') is not None:
+            skipped = "Os conselhos técnicos e a análise visual" if Config.ENABLE_VISION_AI else "Os conselhos técnicos"
+            out.render("ai_unavailable.html", number=counter.next(), marker=marker_aviso, url=html.escape(Config.AI_BASE_URL),
+                       reason=html.escape(data['ai_unavailable'] or "falhas consecutivas."), skipped=skipped)
+
+        # Seção condicional: IA Technical Advice (só mostra se houver conteúdo válido)
+        if data.get('ai_advice'):
+            out.render("ai_advice.html", number=counter.next(), model=data.get('ai_advice_model', 'N/A'),
+                       advice=data.get('ai_advice'))
 
-    # Seção condicional: IA Technical Advice (só mostra se houver conteúdo válido)
-    if data.get('ai_advice'):
-        html += f"""
-            <section class="card">
-                <h2>{counter.next()}. Análise por IA <small>(Modelo: {data.get('ai_advice_model', 'N/A')})</small></h2>
-                <div class="ai-advice-container">
-                    {data.get('ai_advice')}
-                </div>
-            </section>
-    """
+        if is_secad:
+            interactivity_findings = data.get('interactivity_findings')
+            logs_html = "".join([f'<div style="margin-bottom: 12px; font-size: 0.95rem;">{line}</div>'
+                                 for line in finding_lines(interactivity_findings, verbose) if line]) if interactivity_findings else "<p>Nenhuma atividade detectada.</p>"
+            issues_html = f"<div style='margin-top:25px; padding:15px; background:#fff5f5; border:1px solid #feb2b2; color:#c53030; font-weight:600;'>{marker_fail} Falhas detectadas: {len(data['interactivity_issues'])} itens inconsistentes.</div>" if data.get('interactivity_issues') else ""
+            out.render("interactivity.html", number=counter.next(), logs=logs_html, issues=issues_html)
+
+        if Config.ENABLE_VISION_AI and data.get('vision_results'):
+            out.render("section_open.html", number=counter.next(), title="Análise Visual por IA <small>(IA Qwen3 VL)</small>")
+            for item in data.get('vision_results'):
+                image_html = f'<img src="{item["image_url"]}" class="screenshot-thumb" onclick="openModal(this.src)">' if item.get('image_url') else '<p><em>Sem captura de tela.</em></p>'
+                out.render("vision_item.html", location=item.get('location', 'N/A'), type=item.get('type', 'Geral'),
+                           risk=item.get('risk', ''), note=item.get('note', ''), analysis=item.get('analysis', 'Sem análise'), image=image_html)
+            out.write("        </section>\n")
+
+        # Seção: Estrutura & CSS (com filtros condicionais)
+        status_items = ""
+        if not is_secad:
+            status_items += status_item("Classe .limitador (40em)", data['css_rules']['limitador_ok'])
+        status_items += status_item("Nomenclatura de Arquivos", not invalid_filenames, f"[      FALHOU      ] ({len(invalid_filenames)})")
+        status_items += status_item("Tamanho das Imagens (Máx 5.6M px)", not invalid_images, f"[      FALHOU      ] ({len(invalid_images)})")
+        status_items += status_item("Referências Internas", not broken_refs, f"[      FALHOU      ] ({len(broken_refs)})")
+        status_items += status_item("Sumário & Links" if is_secad else "Estrutura E-book", data['structure_ok'],
+                                    "[      AVISO       ]", '#f39c12')
+
+        # Coluna da Direita (Layout de 2 colunas); para Secad não há Riscos Binpar
+        if is_secad:
+            right_column = report_renderer.render("secad_column.html")
+        else:
+            right_column = report_renderer.render("binpar_column.html", missing_html=missing_html, binpar_html=binpar_html,
+                                                  missing_color='var(--error)' if missing_divs else '#27ae60')
+        out.render("structure.html", number=counter.next(), status_items=status_items,
+                   filenames_html=filenames_html, images_html=images_html, right_column=right_column)
+
+        out.render("section_open.html", number=counter.next(), title="Verificação de Links")
+        out.data_table("links", ["URL", "Status", "Origem"], link_rows(), "links",
+                       "Nenhum link externo encontrado.", facet=4, facet_label="Situação")
+        out.write("        </section>\n")
+
+        out.render("section_open.html", number=counter.next(), title="Logs detalhados")
+        out.log_console("logs", finding_lines(filtered_findings, verbose))
+        out.write("        </section>\n")
+
+        left_rows = "".join([
+            perf_row("Abertura do Pacote", f"{timings.get('package', 0):.2f}s"),
+            perf_row("EPubCheck", f"{timings.get('epubcheck', 0):.2f}s"),
+            perf_row("Estrutura", f"{timings.get('structure', 0):.2f}s"),
+            perf_row("Análise CSS", f"{timings.get('css_analysis', 0):.2f}s"),
+            perf_row("Análise XHTML", f"{timings.get('xhtml_analysis', 0):.2f}s"),
+            perf_row("Links Externos", f"{timings.get('external_links', 0):.2f}s"),
+            perf_row("Links: Requisições / Recebido", f"{link_stats.get('requests', 0)} / {link_stats.get('bytes', 0) / 1024:.1f} KB"),
+            perf_row("Nomenclatura", f"{timings.get('filenames', 0):.2f}s"),
+        ])
+        right_rows = "".join([
+            perf_row("Visão IA", f"{timings.get('vision_ai', 0):.2f}s"),
+            perf_row("Visão: Capturas / Por segundo",
+                     f"{vision_stats.get('screenshots', 0)} / {vision_stats.get('screenshots_per_second', 0):.1f}") if vision_stats else "",
+            perf_row("Visão: Capturas do Cache", vision_stats.get('cache_hits', 0)) if vision_stats else "",
+            perf_row("Conselhos IA", f"{timings.get('ai_advice', 0):.2f}s"),
+            perf_row("Imagens", f"{timings.get('image_sizes', 0):.2f}s"),
+            perf_row("Interatividade", f"{timings.get('interactivity', 0):.2f}s") if is_secad else "",
+            perf_row("Tokens IA", data.get('total_tokens', 0), "font-weight:700; color:var(--accent)"),
+            perf_row("Tokens Economizados (cache)", data.get('tokens_saved', 0)),
+            perf_row("IA Visão: Envios / Cache / Duplicatas",
+                     f"{vision_stats.get('ai_requests', 0)} / {vision_stats.get('ai_cache_hits', 0)} / {vision_stats.get('ai_duplicates', 0)}") if vision_stats else "",
+            perf_row("IA: Requisições / Tentativas", f"{ai_stats.get('requests', 0)} / {ai_stats.get('attempts', 0)}"),
+            perf_row("IA: Fila / Inferência", f"{ai_stats.get('queue_wait', 0):.2f}s / {ai_stats.get('inference', 0):.2f}s"),
+            perf_row("Leituras / Parses (ZIP)", f"{package_stats.get('reads', 0)} / {package_stats.get('parses', 0)}"),
+            perf_row("Estágios do Cache", len(data.get('cache_hits', []))),
+            perf_row("Fatos por Membro (reuso / novos)", f"{member_facts_stats.get('hits', 0)} / {member_facts_stats.get('misses', 0)}"),
+        ])
+        out.render("performance.html", number=counter.next(), left_rows=left_rows, right_rows=right_rows,
+                   total=f"{timings.get('total', 0):.2f}s", timeline=timeline_html)
+
+        out.footer()
+    return report_path
 
-    if is_secad:
-        html += f"""
-            <section class="card">
-                <h2>{counter.next()}. Atividades Interativas</h2>
-                <div style="border-left: 2px solid var(--accent); padding-left: 20px;">
-                    {''.join([f'<div style="margin-bottom: 12px; font-size: 0.95rem;">{log}</div>' for log in data.get('interactivity_logs', [])]) if data.get('interactivity_logs') else "<p>Nenhuma atividade detectada.</p>"}
-                </div>
-                {f"<div style='margin-top:25px; padding:15px; background:#fff5f5; border:1px solid #feb2b2; color:#c53030; font-weight:600;'>{marker_fail} Falhas detectadas: {len(data['interactivity_issues'])} itens inconsistentes.</div>" if data.get('interactivity_issues') else ""}
-            </section>
-        """
-
-    if Config.ENABLE_VISION_AI and data.get('vision_results'):
-        html += f"""
-            <section class="card">
-                <h2>{counter.next()}. Análise Visual por IA <small>(IA Qwen3 VL)</small></h2>
-                {''.join([f'''
-                <div style="margin-bottom: 40px; padding-bottom: 30px; border-bottom: 1px solid var(--border);">
-                    <div style="display:flex; justify-content:space-between; align-items:baseline; margin-bottom:15px;">
-                        <h3 style="font-family:'Bricolage Grotesque';">{item.get('location', 'N/A')}</h3>
-                        <span class="badge" style="background:var(--text)">{item.get('type', 'Geral')}</span>
-                    </div>
-                    <p style="color:var(--text-muted); margin-bottom:20px;">{item.get('analysis', 'Sem análise')}</p>
-                    {f'<img src="{item["image_url"]}" class="screenshot-thumb" onclick="openModal(this.src)">' if item.get('image_url') else '<p><em>Sem captura de tela.</em></p>'}
-                </div>
-                ''' for item in data.get('vision_results')])}
-            </section>
-        """
-
-    # Seção: Estrutura & CSS (com filtros condicionais)
-    limitador_li = ""
-    if not is_secad:
-        limitador_li = f"""
-            <li style="display:flex; justify-content:space-between; border-bottom: 1px solid var(--border); padding-bottom: 10px;">
-                <span>Classe .limitador (40em)</span>
-                <span style="font-weight:700; color:{'#27ae60' if data['css_rules']['limitador_ok'] else '#c0392b'}">
-                    {"[      PASSOU      ]" if data['css_rules']['limitador_ok'] else "[      FALHOU      ]"}
-                </span>
-            </li>
-        """
-
-    structure_title = "Estrutura E-book"
-    if is_secad:
-        structure_title = "Sumário & Links"
+def get_publisher(pkg):
+    # O OPF já foi lido na abertura do pacote
+    return pkg.metadata.get('publisher', "Desconhecido")
 
-    # Coluna da Direita (Layout de 2 colunas)
-    right_column_content = ""
-    if is_secad:
-        # Para Secad, a coluna da direita pode ficar vazia ou ter outra info, mas removemos Riscos Binpar
-        right_column_content = f"""
-                <section class="card">
-                    <h4 style="font-size: 0.8rem; text-transform: uppercase; color: var(--text-muted); margin-bottom: 10px;">Informações Adicionais</h4>
-                    <p style="font-size: 0.9rem; color: var(--text-muted);">Validação de estrutura Secad concluída.</p>
-                </section>
-        """
-    else:
-        right_column_content = f"""
-                <section class="card">
-                    <h4 style="font-size: 0.8rem; text-transform: uppercase; color: var(--text-muted); margin-bottom: 10px;">Limitadores Ausentes (.limitador)</h4>
-                    <div style="max-height: 400px; overflow-y: auto; font-size: 0.85rem;">
-                        <ul style="list-style: none; color: {'var(--error)' if missing_divs else '#27ae60'}">
-                            {missing_html}
-                        </ul>
-                    </div>
-                    <div style="margin-top:20px;">
-                        <h4 style="font-size: 0.8rem; text-transform: uppercase; color: var(--text-muted); margin-bottom: 10px;">Riscos Estruturais Binpar</h4>
-                        <ul style="list-style: none;">
-                            {binpar_html}
-                        </ul>
-                    </div>
-                </section>
-        """
-
-    html += f"""
-            <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 40px;">
-                <section class="card">
-                    <h2>{counter.next()}. Estrutura</h2>
-                    <ul style="list-style: none; display: flex; flex-direction: column; gap: 15px;">
-                        {limitador_li}
-                        <li style="display:flex; justify-content:space-between; border-bottom: 1px solid var(--border); padding-bottom: 10px;">
-                            <span>Nomenclatura de Arquivos</span>
-                            <span style="font-weight:700; color:{'#27ae60' if not invalid_filenames else '#c0392b'}">
-                                {"[      PASSOU      ]" if not invalid_filenames else f"[      FALHOU      ] ({len(invalid_filenames)})"}
-                            </span>
-                        </li>
-                        <li style="display:flex; justify-content:space-between; border-bottom: 1px solid var(--border); padding-bottom: 10px;">
-                            <span>Tamanho das Imagens (Máx 5.6M px)</span>
-                            <span style="font-weight:700; color:{'#27ae60' if not invalid_images else '#c0392b'}">
-                                {"[      PASSOU      ]" if not invalid_images else f"[      FALHOU      ] ({len(invalid_images)})"}
-                            </span>
-                        </li>
-                        <li style="display:flex; justify-content:space-between; border-bottom: 1px solid var(--border); padding-bottom: 10px;">
-                            <span>{structure_title}</span>
-                            <span style="font-weight:700; color:{'#27ae60' if data['structure_ok'] else '#f39c12'}">
-                                {"[      PASSOU      ]" if data['structure_ok'] else "[      AVISO       ]"}
-                            </span>
-                        </li>
-                    </ul>
-
-                    <div style="margin-top: 25px;">
-                        <h4 style="font-size: 0.8rem; text-transform: uppercase; color: var(--text-muted); margin-bottom: 10px;">Arquivos com Nomes Inválidos</h4>
-                        <div style="max-height: 120px; overflow-y: auto; font-size: 0.85rem; border: 1px solid var(--border); padding: 10px; background: #fffcfc; margin-bottom: 15px;">
-                            <ul style="list-style: none;">
-                                {filenames_html}
-                            </ul>
-                        </div>
-
-                        <h4 style="font-size: 0.8rem; text-transform: uppercase; color: var(--text-muted); margin-bottom: 10px;">Imagens Excedendo Limite</h4>
-                        <div style="max-height: 120px; overflow-y: auto; font-size: 0.85rem; border: 1px solid var(--border); padding: 10px; background: #fffcfc;">
-                            <ul style="list-style: none;">
-                                {images_html}
-                            </ul>
-                        </div>
-                    </div>
-                </section>
-                {right_column_content}
-            </div>
-
-            <section class="card">
-                <h2>{counter.next()}. Verificação de Links</h2>
-                <table>
-                    <thead><tr><th>URL</th><th>Status</th></tr></thead>
-                    <tbody>{ext_links_rows if ext_links_rows else "<tr><td colspan='2'>Nenhum link externo encontrado.</td></tr>"}</tbody>
-                </table>
-            </section>
-
-            <section class="card">
-                <h2>{counter.next()}. Logs detalhados</h2>
-                <div class="log-console">
-                    {''.join([f'<div class="log-line">{log}</div>' for log in filtered_logs])}
-                </div>
-            </section>
-
-            <section class="card" style="margin-bottom: 100px;">
-                <h2>{counter.next()}. Performance</h2>
-                <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 40px;">
-                    <div style="display: flex; flex-direction: column; gap: 8px;">
-                        <div style="display:flex; justify-content:space-between; border-bottom: 1px solid var(--border); padding-bottom: 4px;">
-                            <span style="font-size: 0.9rem; color: var(--text-muted);">EPubCheck:</span>
-                            <span style="font-weight:600;">{data['timings'].get('epubcheck', 0):.2f}s</span>
-                        </div>
-                        <div style="display:flex; justify-content:space-between; border-bottom: 1px solid var(--border); padding-bottom: 4px;">
-                            <span style="font-size: 0.9rem; color: var(--text-muted);">Estrutura:</span>
-                            <span style="font-weight:600;">{data['timings'].get('structure', 0):.2f}s</span>
-                        </div>
-                        <div style="display:flex; justify-content:space-between; border-bottom: 1px solid var(--border); padding-bottom: 4px;">
-                            <span style="font-size: 0.9rem; color: var(--text-muted);">Análise CSS:</span>
-                            <span style="font-weight:600;">{data['timings'].get('css_analysis', 0):.2f}s</span>
-                        </div>
-                        <div style="display:flex; justify-content:space-between; border-bottom: 1px solid var(--border); padding-bottom: 4px;">
-                            <span style="font-size: 0.9rem; color: var(--text-muted);">Links Externos:</span>
-                            <span style="font-weight:600;">{data['timings'].get('external_links', 0):.2f}s</span>
-                        </div>
-                        <div style="display:flex; justify-content:space-between; border-bottom: 1px solid var(--border); padding-bottom: 4px;">
-                            <span style="font-size: 0.9rem; color: var(--text-muted);">Nomenclatura:</span>
-                            <span style="font-weight:600;">{data['timings'].get('filenames', 0):.2f}s</span>
-                        </div>
-                    </div>
-                    <div style="display: flex; flex-direction: column; gap: 8px;">
-                        <div style="display:flex; justify-content:space-between; border-bottom: 1px solid var(--border); padding-bottom: 4px;">
-                            <span style="font-size: 0.9rem; color: var(--text-muted);">Visão IA:</span>
-                            <span style="font-weight:600;">{data['timings'].get('vision_ai', 0):.2f}s</span>
-                        </div>
-                        <div style="display:flex; justify-content:space-between; border-bottom: 1px solid var(--border); padding-bottom: 4px;">
-                            <span style="font-size: 0.9rem; color: var(--text-muted);">Conselhos IA:</span>
-                            <span style="font-weight:600;">{data['timings'].get('ai_advice', 0):.2f}s</span>
-                        </div>
-                        <div style="display:flex; justify-content:space-between; border-bottom: 1px solid var(--border); padding-bottom: 4px;">
-                            <span style="font-size: 0.9rem; color: var(--text-muted);">Imagens:</span>
-                            <span style="font-weight:600;">{data['timings'].get('image_sizes', 0):.2f}s</span>
-                        </div>
-                        {f'''
-                        <div style="display:flex; justify-content:space-between; border-bottom: 1px solid var(--border); padding-bottom: 4px;">
-                            <span style="font-size: 0.9rem; color: var(--text-muted);">Interatividade:</span>
-                            <span style="font-weight:600;">{data['timings'].get('interactivity', 0):.2f}s</span>
-                        </div>
-                        ''' if is_secad else ''}
-                        <div style="display:flex; justify-content:space-between; border-bottom: 1px solid var(--border); padding-bottom: 4px;">
-                            <span style="font-size: 0.9rem; color: var(--text-muted);">Tokens IA:</span>
-                            <span style="font-weight:700; color:var(--accent)">{data.get('total_tokens', 0)}</span>
-                        </div>
-                        <div style="display:flex; justify-content:space-between; border-top: 2px solid var(--text); padding-top: 10px; margin-top: 5px;">
-                            <span style="font-weight:700; text-transform: uppercase;">Total:</span>
-                            <span style="font-weight:700; color: #27ae60; font-size: 1.1rem;">{data['timings'].get('total', 0):.2f}s</span>
-                        </div>
-                    </div>
-                </div>
-            </section>
-        </div>
-
-        <div id="myModal" class="lightbox">
-            <span class="close" onclick="closeModal()">&times;</span>
-            <img class="lightbox-content" id="img01">
-        </div>
-    </body>
-    </html>
-    """
-    with open(report_path, 'w', encoding='utf-8') as f:
-        f.write(html)
-    return report_path
+def _typed_findings(result):
+    # Estágios que retornam (ok, achados)
+    ok, findings = result
+    return ok, as_findings(findings)
 
-def get_publisher(epub_path):
-    try:
-        with zipfile.ZipFile(epub_path, 'r') as z:
-            # Encontra o arquivo OPF
-            opf_path = next((f for f in z.namelist() if f.endswith('.opf')), None)
-            if opf_path:
-                content = z.read(opf_path).decode('utf-8', errors='ignore')
-                tree = etree.fromstring(content.encode('utf-8'))
-                # DC namespaces
-                ns = {'dc': 'http://purl.org/dc/elements/1.1/', 'opf': 'http://www.idpf.org/2007/opf'}
-                publisher = tree.xpath('//dc:publisher/text()', namespaces=ns)
-                if publisher:
-                    return publisher[0].strip()
-    except:
-        pass
-    return "Desconhecido"
-
-def process_single_epub(epub_path):
+def process_single_epub(epub_path, cache=None, link_cache_mode="normal", verbose=False):
     import time # Added import for time module
     start_total = time.time()
     epub_name = Path(epub_path).name
-    report_data = {'timings': {}} 
+    report_data = {'timings': {}, 'verbose': verbose}
 
     print(f"\n{Fore.MAGENTA}{'='*50}\nVALIDANDO: {epub_name}\n{'='*50}")
 
+    # Cache por conteúdo: um EPUB idêntico reaproveita os estágios já calculados
+    cache_key = cache.key_for(epub_path) if cache and cache.enabled else None
+    cached_stages = cache.load(cache_key) if cache_key else {}
+    fresh_stages = {}
+    if cached_stages:
+        print(f"{Fore.CYAN}    [ INFO ] Resultados em cache para este EPUB ({len(cached_stages)} estágios).")
+
+    def cached(stage, compute, keep=lambda value: True, load=lambda value: value):
+        # `load` reconstrói o valor (do cache ou recém-calculado); formato inválido conta como ausente
+        if stage in cached_stages:
+            try:
+                return load(cached_stages[stage])
+            except (ValueError, KeyError, TypeError, IndexError):
+                print(f"{Fore.YELLOW}    [      AVISO       ] Cache do estágio '{stage}' em formato antigo; recalculando.")
+        value = compute()
+        if keep(value):
+            fresh_stages[stage] = value
+        return load(value)
+
+    # Abre o pacote uma única vez (OPF, manifesto, spine e caches de parse compartilhados)
+    s0 = time.time()
+    pkg = EpubPackage(epub_path)
+    if cache and cache.enabled:
+        # Fatos por membro (CRC32): numa nova versão do livro só os arquivos alterados são reanalisados
+        pkg.member_facts = MemberFacts(Path(epub_path).stem, pkg.infolist)
+    report_data['timings']['package'] = time.time() - s0
+
     # Detecta Publisher
-    publisher = get_publisher(epub_path)
+    publisher = get_publisher(pkg)
     is_secad = "Artmed Panamericana" in publisher
     report_data['publisher'] = publisher
     report_data['is_secad'] = is_secad
     print(f"{Fore.CYAN}    [ INFO ] Editora detectada: {publisher}")
 
-    step = 1
-    # 1. Validador Oficial (ePubCheck)
-    print(f"{Fore.YELLOW}[{step}] Executando EPubCheck (validador W3C)...")
-    s1 = time.time()
-    report_data['epubcheck'] = run_epubcheck(epub_path)
-    report_data['typesetter'] = get_typesetting_credit(epub_path)
-    report_data['timings']['epubcheck'] = time.time() - s1
-    
-    eb = report_data['epubcheck']
-    total_errors = eb['FATAL'] + eb['ERROR']
-    if total_errors > 0:
-        print(f"{Fore.RED}    [      FALHOU      ] EPubCheck: {total_errors} erro(s), {eb['WARNING']} aviso(s), {eb['USAGE']} alerta(s)")
-    else:
-        print(f"{Fore.GREEN}    [      PASSOU      ] EPubCheck: 0 erros, {eb['WARNING']} aviso(s), {eb['USAGE']} alerta(s)")
-
-    step += 1
-    # 2. Estrutura (TOC, NCX, PageList)
-    print(f"{Fore.YELLOW}[{step}] Validando TOC, PageList e Âncoras internas...")
-    s2 = time.time()
-    structure_ok, structure_logs = check_toc_and_pagelist(epub_path)
-    report_data['timings']['structure'] = time.time() - s2
-    report_data['structure_ok'] = structure_ok
-    report_data['structure_logs'] = structure_logs
-    if structure_ok:
-        print(f"    [      PASSOU      ] Estrutura TOC/PageList validada.")
-    else:
-        print(f"    [      FALHOU      ] Problemas na estrutura detectados.")
-
-    step += 1
-    # 3. Análise de CSS
-    print(f"{Fore.YELLOW}[{step}] Analisando regras nos arquivos CSS...")
-    s3 = time.time()
-    report_data['css_rules'] = validate_css_rules(epub_path)
-    report_data['timings']['css_analysis'] = time.time() - s3
-
-    step += 1
-    # 4. Análise de Arquivos XHTML (.limitador e estruturas)
-    if is_secad:
-        print(f"{Fore.YELLOW}[{step}] Verificando aplicação da div .limitador...")
-    else:
-        print(f"{Fore.YELLOW}[{step}] Verificando aplicação da div .limitador e riscos Binpar...")
-    s4 = time.time()
-    xhtml_analysis = validate_limitador_and_structures(epub_path, is_secad=is_secad)
-    report_data['timings']['xhtml_analysis'] = time.time() - s4
-    report_data['css'] = xhtml_analysis
-    report_data['structure_logs'].extend(report_data['css'].get('detailed_logs', []))
-    report_data['limitador_missing'] = xhtml_analysis["missing_limitador"]
-    report_data['binpar_structural_risks'] = xhtml_analysis["binpar_complex_warnings"]
-
-    step += 1
-    # 5. Links Externos (Status 200) - Parte ASSÍNCRONA
-    print(f"{Fore.YELLOW}[{step}] Testando links externos (Status 200)...")
-    s5 = time.time()
-    from modules.link_validator import validate_external_links
-    report_data['external_links'] = asyncio.run(validate_external_links(epub_path))
-    links = report_data['external_links']
-    broken_links = [l for l in links if l['status'] != 200]
-    if broken_links:
-        print(f"{Fore.RED}    [      FALHOU      ] {len(broken_links)} links externos quebrados encontrados.")
-    else:
-        print(f"{Fore.GREEN}    [      PASSOU      ] Todos os links externos estão OK.")
-    report_data['timings']['external_links'] = time.time() - s5
-
-    step += 1
-    # 6. Validação de Nomes de Arquivos (Plataforma)
-    s_filenames = time.time()
-    print(f"{Fore.YELLOW}[{step}] Validando nomenclatura de arquivos...")
-    invalid_filenames = check_filenames(epub_path)
-    report_data['invalid_filenames'] = invalid_filenames
-    if invalid_filenames:
-        print(f"{Fore.RED}    [      FALHOU      ] Nomes inválidos encontrados: {len(invalid_filenames)} itens")
-    else:
-        print(f"{Fore.GREEN}    [      PASSOU      ] Todos os nomes de arquivos são válidos.")
-    report_data['timings']['filenames'] = time.time() - s_filenames
+    # Grafo de estágios: só os conselhos da IA dependem do EPubCheck; o restante roda em paralelo
+    # (EPubCheck em thread própria, verificações Python no pool de threads, rede no event loop)
+    pipeline = Pipeline()
+    # Número do passo no console: atribuído no registro de cada estágio (estágios opcionais só contam se ativos)
+    step_numbers = iter(range(1, 100))
+
+    def stage_epubcheck(step):
+        # 1. Validador Oficial (ePubCheck)
+        print(f"{Fore.YELLOW}[{step}] Executando EPubCheck (validador W3C)...")
+        # Só guarda o EPubCheck se o JSON foi realmente gerado
+        report_data['epubcheck'] = cached('epubcheck', lambda: run_epubcheck(pkg), keep=lambda s: s.get('checker_version'))
+        eb = report_data['epubcheck']
+        total_errors = eb['FATAL'] + eb['ERROR']
+        if total_errors > 0:
+            print(f"{Fore.RED}    [      FALHOU      ] EPubCheck: {total_errors} erro(s), {eb['WARNING']} aviso(s), {eb['USAGE']} alerta(s)")
+        else:
+            print(f"{Fore.GREEN}    [      PASSOU      ] EPubCheck: 0 erros, {eb['WARNING']} aviso(s), {eb['USAGE']} alerta(s)")
+    pipeline.stage('epubcheck', partial(stage_epubcheck, next(step_numbers)), kind="background")
+
+    def stage_typesetter():
+        report_data['typesetter'] = cached('typesetter', lambda: get_typesetting_credit(pkg))
+    pipeline.stage('typesetter', stage_typesetter)
+
+    def stage_structure(step):
+        # 2. Estrutura (TOC, NCX, PageList)
+        print(f"{Fore.YELLOW}[{step}] Validando TOC, PageList e Âncoras internas...")
+        structure_ok, toc_findings = cached('structure', lambda: check_toc_and_pagelist(pkg), load=_typed_findings)
+        refs_ok, refs_findings = cached('internal_refs', lambda: validate_internal_references(pkg), load=_typed_findings)
+        report_data['structure_ok'] = structure_ok
+        report_data['broken_internal_refs'] = problems(refs_findings)
+        if structure_ok:
+            print(f"    [      PASSOU      ] Estrutura TOC/PageList validada.")
+        else:
+            print(f"    [      FALHOU      ] Problemas na estrutura detectados.")
+        return toc_findings + refs_findings
+    pipeline.stage('structure', partial(stage_structure, next(step_numbers)))
+
+    def stage_css(step):
+        # 3. Análise de CSS
+        print(f"{Fore.YELLOW}[{step}] Analisando regras nos arquivos CSS...")
+        report_data['css_rules'] = cached('css_rules', lambda: validate_css_rules(pkg))
+    pipeline.stage('css_analysis', partial(stage_css, next(step_numbers)))
+
+    def stage_xhtml(step):
+        # 4. Análise de Arquivos XHTML (.limitador e estruturas)
+        if is_secad:
+            print(f"{Fore.YELLOW}[{step}] Verificando aplicação da div .limitador...")
+        else:
+            print(f"{Fore.YELLOW}[{step}] Verificando aplicação da div .limitador e riscos Binpar...")
+        xhtml_analysis = cached('xhtml_analysis', lambda: validate_limitador_and_structures(pkg, is_secad=is_secad),
+                                load=lambda r: {**r, "findings": as_findings(r["findings"]),
+                                                "missing_limitador": r["missing_limitador"],
+                                                "binpar_complex_warnings": r["binpar_complex_warnings"]})
+        report_data['xhtml_findings'] = xhtml_analysis["findings"]
+        report_data['limitador_missing'] = xhtml_analysis["missing_limitador"]
+        report_data['binpar_structural_risks'] = xhtml_analysis["binpar_complex_warnings"]
+    pipeline.stage('xhtml_analysis', partial(stage_xhtml, next(step_numbers)))
+
+    async def stage_links(step):
+        # 5. Links Externos (Status 200) - Parte ASSÍNCRONA
+        print(f"{Fore.YELLOW}[{step}] Testando links externos (Status 200)...")
+        report_data['external_links'], report_data['link_stats'] = await validate_external_links(pkg, cache_mode=link_cache_mode)
+        broken_links = [l for l in report_data['external_links'] if not l['ok']]
+        if broken_links:
+            print(f"{Fore.RED}    [      FALHOU      ] {len(broken_links)} links externos quebrados encontrados.")
+        else:
+            print(f"{Fore.GREEN}    [      PASSOU      ] Todos os links externos estão OK.")
+    pipeline.stage('external_links', partial(stage_links, next(step_numbers)), kind="async")
+
+    def stage_filenames(step):
+        # 6. Validação de Nomes de Arquivos (Plataforma)
+        print(f"{Fore.YELLOW}[{step}] Validando nomenclatura de arquivos...")
+        invalid_filenames = check_filenames(pkg)
+        report_data['invalid_filenames'] = invalid_filenames
+        if invalid_filenames:
+            print(f"{Fore.RED}    [      FALHOU      ] Nomes inválidos encontrados: {len(invalid_filenames)} itens")
+        else:
+            print(f"{Fore.GREEN}    [      PASSOU      ] Todos os nomes de arquivos são válidos.")
+    pipeline.stage('filenames', partial(stage_filenames, next(step_numbers)))
 
     # 7. Visão Computacional (Opcional)
-    s6 = time.time()
-    report_data['total_prompt_tokens'] = 0
-    report_data['total_completion_tokens'] = 0
-    report_data['total_tokens'] = 0
     report_data['vision_results'] = []
-
     if Config.ENABLE_VISION_AI:
-        step += 1
-        print(f"{Fore.YELLOW}[{step}] Executando análise de visão computacional (Amostragem)...")
-        raw_vision_results = check_visual_layout(epub_path, max_items=3)
-        vision_processed = []
-        for v in raw_vision_results:
-            if isinstance(v, dict) and "usage" in v:
-                u = v["usage"]
-                report_data['total_prompt_tokens'] += u.get("prompt_tokens", 0)
-                report_data['total_completion_tokens'] += u.get("completion_tokens", 0)
-                report_data['total_tokens'] += u.get("total_tokens", 0)
-                v["tokens"] = u.get("total_tokens", 0)
-                v["analysis"] = v["content"]
-            vision_processed.append(v)
-        report_data['vision_results'] = vision_processed
+        def stage_vision(step):
+            print(f"{Fore.YELLOW}[{step}] Executando análise de visão computacional (Amostragem)...")
+            # Circuito aberto: nem abre o navegador, já que as capturas não seriam analisadas
+            if not ai_available():
+                report_data['ai_unavailable'] = unavailable_reason()
+                print(f"{Fore.YELLOW}    [      AVISO       ] IA indisponível; análise visual pulada.")
+                return
+            vision_processed = []
+            vision_results, report_data['vision_stats'] = check_visual_layout(pkg, max_items=3, use_cache=bool(cache and cache.enabled))
+            for v in vision_results:
+                if isinstance(v, dict) and "usage" in v:
+                    v["tokens"] = v["usage"].get("total_tokens", 0)
+                    v["analysis"] = v["content"]
+                vision_processed.append(v)
+            report_data['vision_results'] = vision_processed
+            if any(isinstance(v, dict) and v.get("unavailable") for v in vision_processed):
+                report_data['ai_unavailable'] = unavailable_reason()
+        # O Chromium tem event loop próprio (compartilhado entre livros); o estágio só espera no pool de threads
+        pipeline.stage('vision_ai', partial(stage_vision, next(step_numbers)))
     else:
         print(f"{Fore.WHITE}    [ INFO ] Análise visual desativada.")
-    report_data['timings']['vision_ai'] = time.time() - s6
-
-    # 8. Conselhos Técnicos da IA
-    step += 1
-    print(f"{Fore.BLUE}[{step}] Consultando IA para conselhos técnicos sobre o EPubCheck...")
-    s_ia = time.time()
-    ia_res = get_ai_tech_advice(report_data['epubcheck']['messages'])
-    raw_advice = ia_res.get("content", "")
-    advice_model = ia_res.get("model", "N/A")
-    usage = ia_res.get("usage")
-    
-    if usage:
-        report_data['total_prompt_tokens'] += usage.get("prompt_tokens", 0)
-        report_data['total_completion_tokens'] += usage.get("completion_tokens", 0)
-        report_data['total_tokens'] += usage.get("total_tokens", 0)
-
-    report_data['ai_advice_model'] = advice_model
-    if raw_advice:
-        import re
-        import html
-        escaped_advice = html.escape(raw_advice)
-        advice_html = re.sub(r'\*\*([^\*]+)\*\*', r"<b>\1</b>", escaped_advice)
-        report_data['ai_advice'] = advice_html.replace("\n", "<br>")
-    else:
-        report_data['ai_advice'] = ""
-    report_data['timings']['ai_advice'] = time.time() - s_ia
-
-    step += 1
-    # 7. Validação de Tamanho e Qualidade de Imagens
-    print(f"{Fore.YELLOW}[{step}] Validando dimensões e qualidade das imagens...")
-    s_images = time.time()
-    image_results = validate_image_sizes(epub_path, max_pixels=Config.MAX_IMAGE_PIXELS)
-    report_data['invalid_images'] = image_results
-    if image_results:
-        print(f"{Fore.RED}    [      FALHOU      ] Imagens excedendo limite encontradas: {len(image_results)} itens")
-    else:
-        print(f"{Fore.GREEN}    [      PASSOU      ] Todas as imagens estão dentro do limite.")
-    report_data['timings']['image_sizes'] = time.time() - s_images
 
+    def stage_advice(step):
+        # 8. Conselhos Técnicos da IA
+        print(f"{Fore.BLUE}[{step}] Consultando IA para conselhos técnicos sobre o EPubCheck...")
+        # Falhas de comunicação com a IA não entram no cache (o próximo envio tenta de novo)
+        ia_res = cached('ai_advice', lambda: get_ai_tech_advice(report_data['epubcheck']['messages']),
+                        keep=lambda r: r.get('model') != "Erro/Desconhecido")
+        raw_advice = ia_res.get("content", "")
+        report_data['ai_advice_model'] = ia_res.get("model", "N/A")
+        if ia_res.get("unavailable"):
+            report_data['ai_unavailable'] = unavailable_reason()
+        # Tempos de fila/inferência só existem quando a requisição foi feita nesta execução
+        report_data['ai_advice_timing'] = ia_res.pop("timing", None)
+        if raw_advice:
+            import re
+            import html
+            escaped_advice = html.escape(raw_advice)
+            advice_html = re.sub(r'\*\*([^\*]+)\*\*', r"<b>\1</b>", escaped_advice)
+            report_data['ai_advice'] = advice_html.replace("\n", "<br>")
+        else:
+            report_data['ai_advice'] = ""
+        return ia_res.get("usage")
+    pipeline.stage('ai_advice', partial(stage_advice, next(step_numbers)), deps=['epubcheck'])
+
+    def stage_images(step):
+        # 9. Validação de Tamanho e Qualidade de Imagens
+        print(f"{Fore.YELLOW}[{step}] Validando dimensões e qualidade das imagens...")
+        image_results = cached('images', lambda: validate_image_sizes(pkg, max_pixels=Config.MAX_IMAGE_PIXELS))
+        report_data['invalid_images'] = image_results
+        if image_results:
+            print(f"{Fore.RED}    [      FALHOU      ] Imagens excedendo limite encontradas: {len(image_results)} itens")
+        else:
+            print(f"{Fore.GREEN}    [      PASSOU      ] Todas as imagens estão dentro do limite.")
+    pipeline.stage('image_sizes', partial(stage_images, next(step_numbers)))
+
+    report_data['interactivity_findings'] = []
+    report_data['interactivity_issues'] = []
     if is_secad:
-        step += 1
-        # 8. Atividades Interativas e Gabarito
-        print(f"{Fore.YELLOW}[{step}] Validando exercícios interativos e Gabarito...")
-        s_inter = time.time()
-        inter_ok, inter_logs, inter_issues = validate_activities(epub_path)
-        report_data['timings']['interactivity'] = time.time() - s_inter
-        report_data['interactivity_logs'] = inter_logs
-        report_data['interactivity_issues'] = inter_issues
-        if inter_issues:
-            print(f"{Fore.RED}    [      FALHOU      ] {len(inter_issues)} falhas em atividades interativas.")
+        def stage_interactivity(step):
+            # 10. Atividades Interativas e Gabarito
+            print(f"{Fore.YELLOW}[{step}] Validando exercícios interativos e Gabarito...")
+            inter_ok, inter_findings = cached('interactivity', lambda: validate_activities(pkg), load=_typed_findings)
+            inter_issues = [f.message for f in problems(inter_findings)]
+            report_data['interactivity_findings'] = inter_findings
+            report_data['interactivity_issues'] = inter_issues
+            if inter_issues:
+                print(f"{Fore.RED}    [      FALHOU      ] {len(inter_issues)} falhas em atividades interativas.")
+            else:
+                print(f"{Fore.GREEN}    [      PASSOU      ] Todas as atividades interativas validadas com sucesso.")
+        pipeline.stage('interactivity', partial(stage_interactivity, next(step_numbers)))
+
+    results = pipeline.run()
+    if pipeline.errors:
+        pkg.close()
+        failed_stage, error = next(iter(pipeline.errors.items()))
+        raise RuntimeError(f"Estágio '{failed_stage}' falhou: {error}") from error
+
+    for name, (stage_start, stage_end) in pipeline.times.items():
+        report_data['timings'][name] = stage_end - stage_start
+    report_data['stage_times'] = dict(pipeline.times)
+    report_data['critical_path'] = pipeline.critical_path()
+
+    # Achados na ordem do relatório, independente da ordem de término dos estágios
+    report_data['findings'] = (results['structure']
+                               + report_data['xhtml_findings']
+                               + report_data['interactivity_findings'])
+
+    # Tokens de IA (visão + conselhos) gastos nesta execução; respostas do cache contam como economia
+    usages = [v["usage"] for v in report_data['vision_results'] if isinstance(v, dict) and v.get("usage")]
+    report_data['tokens_saved'] = report_data.get('vision_stats', {}).get('tokens_saved', 0)
+    if results.get('ai_advice'):
+        if 'ai_advice' in cached_stages and 'ai_advice' not in fresh_stages:
+            report_data['tokens_saved'] += results['ai_advice'].get("total_tokens", 0)
         else:
-            print(f"{Fore.GREEN}    [      PASSOU      ] Todas as atividades interativas validadas com sucesso.")
-    else:
-        inter_logs = []
-        report_data['interactivity_logs'] = []
-        report_data['interactivity_issues'] = []
-    report_data['structure_logs'].extend(inter_logs)
+            usages.append(results['ai_advice'])
+    report_data['total_prompt_tokens'] = sum(u.get("prompt_tokens", 0) for u in usages)
+    report_data['total_completion_tokens'] = sum(u.get("completion_tokens", 0) for u in usages)
+    report_data['total_tokens'] = sum(u.get("total_tokens", 0) for u in usages)
+
+    # Gateway de IA: espera por vaga separada do tempo de inferência
+    ai_timings = [v["timing"] for v in report_data['vision_results'] if isinstance(v, dict) and v.get("timing")]
+    if report_data.get('ai_advice_timing'):
+        ai_timings.append(report_data['ai_advice_timing'])
+    report_data['ai_stats'] = {
+        "requests": len(ai_timings),
+        "attempts": sum(t["attempts"] for t in ai_timings),
+        "queue_wait": sum(t["queue_wait"] for t in ai_timings),
+        "inference": sum(t["inference"] for t in ai_timings),
+    }
+
+    eb = report_data['epubcheck']
+    total_errors = eb['FATAL'] + eb['ERROR']
+    image_results = report_data['invalid_images']
 
     # Tempo total
     report_data['timings']['total'] = time.time() - start_total
-
-
-    # 8. Geração do Relatório Final
+    report_data['package_stats'] = dict(pkg.stats)
+    # Estágios recalculados (formato antigo no cache) não contam como reaproveitados
+    report_data['cache_hits'] = sorted(s for s in cached_stages if s not in fresh_stages)
+    if pkg.member_facts:
+        report_data['member_facts_stats'] = dict(pkg.member_facts.stats)
+        pkg.member_facts.save()
+    pkg.close()
+
+    if cache_key and fresh_stages:
+        cache.store(cache_key, {**cached_stages, **fresh_stages})
+
+
+    # Resumo para a tabela final do lote (também gravado no relatório JSON)
+    failed_checks = []
+    if total_errors > 0: failed_checks.append("EPubCheck")
+    if not report_data['structure_ok'] or report_data['broken_internal_refs']: failed_checks.append("Estrutura")
+    if report_data['limitador_missing']: failed_checks.append(".limitador")
+    if any(not l['ok'] for l in report_data['external_links']): failed_checks.append("Links")
+    if report_data['invalid_filenames']: failed_checks.append("Nomes")
+    if image_results: failed_checks.append("Imagens")
+    if report_data['interactivity_issues']: failed_checks.append("Atividades")
+
+    # 8. Geração do Relatório Final (HTML para leitura, JSON para painéis e agregação)
     report_file = generate_html_report(epub_name, report_data)
+    json_file = generate_json_report(epub_name, report_data, not failed_checks, failed_checks)
     
     print(f"\n{Fore.GREEN}✔ Processo concluído para: {epub_name}")
     if image_results:
         print(f"{Fore.LIGHTRED_EX}👉 Alerta: {len(image_results)} imagens excedem o limite de pixels.")
     print(f"{Fore.CYAN}👉 Relatório: {report_file}")
 
+    return {"epub": epub_name, "ok": not failed_checks, "failed_checks": failed_checks, "report": str(report_file),
+            "json_report": str(json_file)}
+
+def _cpu_time():
+    # Inclui processos filhos já finalizados (java do EPubCheck)
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+def run_book(epub_path, use_cache=True, buffered=False, link_cache_mode="normal", verbose=False):
+    """
+    Processa um livro isolando falhas: qualquer exceção vira um resumo com status de erro.
+    Com buffered=True a saída do console é devolvida no resumo em vez de impressa.
+    """
+    s_wall, s_cpu = time.time(), _cpu_time()
+    buffer = io.StringIO()
+    with contextlib.redirect_stdout(buffer) if buffered else contextlib.nullcontext():
+        try:
+            summary = process_single_epub(epub_path, cache=ResultCache(enabled=use_cache),
+                                          link_cache_mode=link_cache_mode, verbose=verbose)
+        except Exception as e:
+            print(f"{Fore.RED}    [      FALHOU      ] Erro inesperado ao processar {Path(epub_path).name}: {e}")
+            print(traceback.format_exc())
+            summary = {"epub": Path(epub_path).name, "ok": False, "failed_checks": [f"Erro: {e}"], "report": None}
+    summary["wall"] = time.time() - s_wall
+    summary["cpu"] = _cpu_time() - s_cpu
+    summary["output"] = buffer.getvalue()
+    return summary
+
+def _print_book_output(summary):
+    # Saída do livro em bloco, com prefixo por linha para identificar a origem
+    prefix = f"{Style.DIM}[{summary['epub']}]{Style.RESET_ALL} "
+    for line in summary.get("output", "").splitlines():
+        print(f"{prefix}{line}{Style.RESET_ALL}")
+
+def _crashed_summary(epub_path, error):
+    return {"epub": Path(epub_path).name, "ok": False, "failed_checks": [f"Processo encerrado: {error}"],
+            "report": None, "wall": None, "cpu": None, "output": ""}
+
+def _init_batch_worker(ai_slots, ai_down_reason=None):
+    # Cada processo tem o próprio gateway de IA; o semáforo compartilhado limita o lote inteiro às vagas do servidor
+    share_slots(ai_slots)
+    # Servidor fora do ar na sonda inicial: o processo já começa com o circuito aberto
+    if ai_down_reason is not None:
+        get_gateway().breaker.trip(ai_down_reason)
+
+def run_batch(epubs, workers, use_cache=True, link_cache_mode="normal", findings=None, verbose=False):
+    """
+    Processa vários livros em um pool de processos; um livro que derruba o processo não interrompe o lote.
+    Cada livro concluído é anexado ao fluxo NDJSON `findings` (se informado) assim que termina.
+    """
+    summaries = []
+    crashed = []
+    ai_slots = multiprocessing.BoundedSemaphore(max(1, Config.AI_MAX_IN_FLIGHT))
+    ai_down_reason = None if ai_available() else unavailable_reason()
+    # O event loop do gateway não sobrevive ao fork: cada processo abre o seu
+    shutdown_gateway()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker, initargs=(ai_slots, ai_down_reason)) as pool:
+        futures = {pool.submit(run_book, epub, use_cache, True, link_cache_mode, verbose): epub for epub in epubs}
+        for future in as_completed(futures):
+            try:
+                summary = future.result()
+            except BrokenProcessPool:
+                # O pool quebra para todos os livros em andamento; refaz cada um isoladamente
+                crashed.append(futures[future])
+                continue
+            _print_book_output(summary)
+            if findings:
+                findings.add(summary)
+            summaries.append(summary)
+
+    for epub in crashed:
+        print(f"{Fore.YELLOW}    [      AVISO       ] Processo encerrado durante {Path(epub).name}; reprocessando isoladamente.")
+        with ProcessPoolExecutor(max_workers=1, initializer=_init_batch_worker, initargs=(ai_slots, ai_down_reason)) as pool:
+            try:
+                summary = pool.submit(run_book, epub, use_cache, True, link_cache_mode, verbose).result()
+                _print_book_output(summary)
+            except BrokenProcessPool as e:
+                summary = _crashed_summary(epub, e)
+        if findings:
+            findings.add(summary)
+        summaries.append(summary)
+    return summaries
+
+def print_batch_summary(summaries, wall_total):
+    print(f"\n{Fore.MAGENTA}{'='*78}\nRESUMO DO LOTE\n{'='*78}")
+    print(f"{'Livro':<40} {'Resultado':<10} {'Tempo':>8} {'CPU':>8}  Falhas")
+    for s in sorted(summaries, key=lambda s: s['epub']):
+        color = Fore.GREEN if s['ok'] else Fore.RED
+        status = "PASSOU" if s['ok'] else "FALHOU"
+        wall = f"{s['wall']:.2f}s" if s.get('wall') is not None else "-"
+        cpu = f"{s['cpu']:.2f}s" if s.get('cpu') is not None else "-"
+        print(f"{color}{s['epub'][:40]:<40} {status:<10} {wall:>8} {cpu:>8}  {', '.join(s['failed_checks'])}")
+    cpu_total = sum(s['cpu'] for s in summaries if s.get('cpu') is not None)
+    passed = sum(1 for s in summaries if s['ok'])
+    print(f"{Fore.CYAN}{passed}/{len(summaries)} livros aprovados | Tempo total (relógio): {wall_total:.2f}s | Soma de CPU por livro: {cpu_total:.2f}s")
+
 def main():
+    parser = argparse.ArgumentParser(description="Validação automática de arquivos EPUB.")
+    parser.add_argument("--no-cache", action="store_true", help="Ignora o cache de resultados e revalida tudo.")
+    parser.add_argument("--workers", type=int, default=Config.BATCH_WORKERS,
+                        help="Número de livros processados em paralelo (processos).")
+    parser.add_argument("--refresh-links", action="store_true",
+                        help="Revalida todos os links externos, ignorando resultados ainda válidos no cache.")
+    parser.add_argument("--verbose", action="store_true", default=Config.VERBOSE_REPORT,
+                        help="Lista no relatório também os itens aprovados (por padrão, só a contagem).")
+    args = parser.parse_args()
+
     print(Fore.CYAN + "=== INICIANDO PROCESSO DE VALIDAÇÃO AUTOMÁTICA ===")
-    
-    # Limpa capturas de sessões anteriores
-    img_dir = Path("reports/screenshots")
-    if img_dir.exists():
-        shutil.rmtree(img_dir)
-    img_dir.mkdir(parents=True, exist_ok=True)
+    use_cache = Config.RESULT_CACHE and not args.no_cache
+    # Por padrão só links vencidos (TTL) ou desconhecidos são testados de novo
+    link_cache_mode = "off" if args.no_cache else "refresh" if args.refresh_links else Config.LINK_CACHE_MODE
 
     epubs = glob.glob("input/*.epub")
     if not epubs:
         print(Fore.RED + "Coloque arquivos .epub na pasta /input.")
         return
-    for epub in epubs:
-        process_single_epub(epub)
+
+    # Sonda de saúde da IA: com o servidor fora do ar, os estágios de IA são pulados na hora
+    ok, reason = get_gateway().probe()
+    if ok:
+        print(f"{Fore.GREEN}    [      PASSOU      ] Servidor de IA respondendo em {Config.AI_BASE_URL}.")
+    else:
+        print(f"{Fore.YELLOW}    [      AVISO       ] IA indisponível em {Config.AI_BASE_URL} ({reason}); "
+              f"estágios de IA serão pulados (nova sonda a cada {Config.AI_BREAKER_COOLDOWN:.0f}s).")
+
+    start = time.time()
+    # Achados de todos os livros em NDJSON (uma linha por achado), para painéis e agregação
+    findings = FindingsStream()
+    try:
+        if args.workers > 1 and len(epubs) > 1:
+            print(f"{Fore.CYAN}    [ INFO ] Modo lote: {len(epubs)} livros em {min(args.workers, len(epubs))} processos.")
+            summaries = run_batch(epubs, args.workers, use_cache=use_cache, link_cache_mode=link_cache_mode,
+                                  findings=findings, verbose=args.verbose)
+        else:
+            summaries = []
+            for epub in epubs:
+                summary = run_book(epub, use_cache=use_cache, link_cache_mode=link_cache_mode, verbose=args.verbose)
+                findings.add(summary)
+                summaries.append(summary)
+    finally:
+        findings.close()
+    print_batch_summary(summaries, time.time() - start)
+    print(f"{Fore.CYAN}👉 Achados do lote (NDJSON): {findings.path}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,46 @@
+import com.adobe.epubcheck.tool.EpubChecker;
+
+import java.io.BufferedReader;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.nio.charset.StandardCharsets;
+
+/**
+ * Worker persistente do EPubCheck.
+ * A JVM e as classes do epubcheck.jar são carregadas uma única vez; cada linha do stdin
+ * é um pedido "id\tcaminho.epub\tsaida.json" e gera o mesmo JSON de "--json".
+ * As respostas saem no stdout como "@@EPUBCHECK-WORKER@@ id código".
+ *
+ * Execução (Java 11+): java -cp epubcheck-5.1.0/epubcheck.jar modules/EpubCheckWorker.java
+ */
+public class EpubCheckWorker {
+    private static final String TAG = "@@EPUBCHECK-WORKER@@";
+
+    public static void main(String[] args) throws Exception {
+        PrintStream protocol = new PrintStream(new FileOutputStream(FileDescriptor.out), true, "UTF-8");
+        // Toda a saída do próprio EPubCheck vai para o stderr para não poluir o protocolo
+        System.setOut(System.err);
+
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        protocol.println(TAG + " READY");
+
+        String line;
+        while ((line = in.readLine()) != null) {
+            String[] parts = line.split("\t");
+            if (parts.length < 3) {
+                protocol.println(TAG + " ? -1");
+                continue;
+            }
+            int code;
+            try {
+                code = new EpubChecker().run(new String[] { parts[1], "--json", parts[2] });
+            } catch (Throwable t) {
+                t.printStackTrace();
+                code = -1;
+            }
+            protocol.println(TAG + " " + parts[0] + " " + code);
+        }
+    }
+}
@@ -0,0 +1,59 @@
+from collections import deque
+
+
+class AhoCorasick:
+    """
+    Autômato de Aho-Corasick para busca de vários padrões em uma única passagem.
+    Usado para verificar todos os títulos do sumário que apontam para o mesmo arquivo
+    sem varrer o texto do destino uma vez por link.
+    """
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [set()]
+        self.patterns = set(patterns)
+
+        for pattern in self.patterns:
+            state = 0
+            for ch in pattern:
+                nxt = self.goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(set())
+                state = nxt
+            self.output[state].add(pattern)
+
+        # Links de falha em largura (BFS), herdando as saídas do sufixo mais longo
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                self.output[nxt] |= self.output[self.fail[nxt]]
+
+    def find_all(self, text):
+        """Retorna o conjunto de padrões que ocorrem em text (o padrão vazio sempre ocorre)."""
+        found = set(self.output[0])
+        remaining = len(self.patterns) - len(found)
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state]:
+                new = output[state] - found
+                if new:
+                    found |= new
+                    remaining -= len(new)
+                    if remaining <= 0:
+                        break
+        return found
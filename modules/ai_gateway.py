@@ -0,0 +1,239 @@
+import time
+import random
+import atexit
+import asyncio
+import threading
+import openai
+from openai import AsyncOpenAI
+from config import Config
+
+# Falhas transitórias do servidor de IA (fila cheia, modelo carregando, rede): tentam de novo
+RETRYABLE = (asyncio.TimeoutError, openai.APITimeoutError, openai.APIConnectionError,
+             openai.RateLimitError, openai.InternalServerError)
+
+
+class AIUnavailable(Exception):
+    """Circuito aberto: o servidor de IA falhou seguidamente e as chamadas são recusadas na hora."""
+
+
+class CircuitBreaker:
+    """
+    Disjuntor do servidor de IA, compartilhado por todos os livros do processo.
+    Após `threshold` falhas consecutivas o circuito abre e as chamadas falham imediatamente;
+    passados `cooldown` segundos ele fica semiaberto e uma sonda de saúde decide se fecha de novo.
+    """
+
+    def __init__(self, threshold=None, cooldown=None):
+        self.threshold = max(1, threshold or Config.AI_BREAKER_THRESHOLD)
+        self.cooldown = Config.AI_BREAKER_COOLDOWN if cooldown is None else cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.reason = ""
+        self.trips = 0
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.time() - self.opened_at >= self.cooldown else "open"
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.reason = ""
+
+    def failure(self, reason):
+        self.failures += 1
+        self.reason = reason
+        # Semiaberto: uma falha da sonda reabre o circuito por mais um período
+        if self.opened_at is not None or self.failures >= self.threshold:
+            self.trip(reason)
+
+    def trip(self, reason):
+        if self.opened_at is None:
+            self.trips += 1
+        self.opened_at = time.time()
+        self.reason = reason
+
+
+class AIGateway:
+    """
+    Cliente assíncrono único para todas as chamadas de IA do processo.
+    Roda num event loop próprio (thread dedicada), como o BrowserPool, e limita as requisições
+    simultâneas a `max_in_flight` (as vagas paralelas do servidor). Cada tentativa tem timeout
+    próprio; falhas transitórias são repetidas com backoff exponencial.
+    No modo lote, `shared_slots` (semáforo entre processos) limita o total do lote às mesmas vagas.
+    O tempo na fila (esperando vaga) é medido separado do tempo de inferência.
+    Falhas transitórias alimentam o disjuntor (`breaker`); com o circuito aberto nada é enviado.
+    """
+
+    def __init__(self, max_in_flight=None, timeout=None, retries=None, backoff=None, shared_slots=None):
+        self.max_in_flight = max(1, Config.AI_MAX_IN_FLIGHT if max_in_flight is None else max_in_flight)
+        self.shared_slots = shared_slots
+        self.timeout = timeout or Config.AI_TIMEOUT
+        self.retries = Config.AI_RETRIES if retries is None else retries
+        self.backoff = Config.AI_RETRY_BACKOFF if backoff is None else backoff
+        self.loop = None
+        self.thread = None
+        self.client = None
+        self._slots = None
+        self._probe_lock = None
+        self.breaker = CircuitBreaker()
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True, name="ai-gateway")
+        self.thread.start()
+        self.run(self._open())
+
+    async def _open(self):
+        # Retentativas ficam a cargo do gateway (o SDK não sabe da fila nem do limite de vagas)
+        self.client = AsyncOpenAI(base_url=Config.AI_BASE_URL, api_key=Config.AI_API_KEY,
+                                  timeout=self.timeout, max_retries=0)
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._probe_lock = asyncio.Lock()
+
+    def run(self, coro):
+        """Executa uma corrotina no event loop do gateway e espera o resultado."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def submit(self, messages, **kwargs):
+        """
+        Agenda uma requisição de chat sem bloquear. Retorna um concurrent.futures.Future com
+        (resposta, tempos), onde tempos = {queue_wait, inference, attempts}.
+        """
+        return asyncio.run_coroutine_threadsafe(self._chat(messages, **kwargs), self.loop)
+
+    def chat(self, messages, **kwargs):
+        return self.submit(messages, **kwargs).result()
+
+    def probe(self):
+        """Sonda de saúde (início da execução): atualiza o disjuntor e retorna (ok, motivo)."""
+        return self.run(self._probe(record=True))
+
+    async def _probe(self, record=False):
+        # Lista de modelos com timeout curto: não ocupa vaga de inferência
+        try:
+            await asyncio.wait_for(self.client.models.list(), Config.AI_PROBE_TIMEOUT)
+        except Exception as e:
+            reason = str(e) or type(e).__name__
+            if record:
+                self.breaker.trip(reason)
+            return False, reason
+        if record:
+            self.breaker.success()
+        return True, ""
+
+    async def _admit(self):
+        """Recusa na hora com o circuito aberto; semiaberto, uma única sonda decide pelos demais."""
+        if self.breaker.state == "closed":
+            return
+        async with self._probe_lock:
+            state = self.breaker.state
+            if state == "closed":
+                return
+            if state == "open":
+                raise AIUnavailable(self.breaker.reason)
+            ok, reason = await self._probe()
+            if not ok:
+                self.breaker.failure(reason)
+                raise AIUnavailable(reason)
+            self.breaker.success()
+
+    async def _chat(self, messages, **kwargs):
+        timing = {"queue_wait": 0.0, "inference": 0.0, "attempts": 0}
+        for attempt in range(self.retries + 1):
+            await self._admit()
+            queued = time.time()
+            # A vaga é liberada durante o backoff, para não segurar o servidor parado
+            async with self._slots:
+                await self._acquire_shared()
+                try:
+                    # O circuito pode ter aberto enquanto a requisição esperava vaga
+                    if self.breaker.state == "open":
+                        raise AIUnavailable(self.breaker.reason)
+                    start = time.time()
+                    timing["queue_wait"] += start - queued
+                    timing["attempts"] += 1
+                    try:
+                        response = await asyncio.wait_for(
+                            self.client.chat.completions.create(model=Config.AI_MODEL, messages=messages, **kwargs),
+                            self.timeout)
+                        timing["inference"] += time.time() - start
+                        self.breaker.success()
+                        return response, timing
+                    except RETRYABLE as e:
+                        timing["inference"] += time.time() - start
+                        self.breaker.failure(str(e) or type(e).__name__)
+                        if attempt == self.retries:
+                            raise
+                finally:
+                    if self.shared_slots is not None:
+                        self.shared_slots.release()
+            await asyncio.sleep(self.backoff * 2 ** attempt * random.uniform(0.8, 1.2))
+
+    async def _acquire_shared(self):
+        """Vaga do lote (semáforo entre processos), esperada fora do event loop."""
+        if self.shared_slots is None:
+            return
+        # Com timeout: uma vaga presa por um processo que caiu não trava o lote para sempre
+        acquired = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: self.shared_slots.acquire(timeout=self.timeout))
+        if not acquired:
+            raise asyncio.TimeoutError("Sem vaga de IA livre no lote")
+
+    async def _close(self):
+        if self.client is not None:
+            await self.client.close()
+
+    def stop(self):
+        if self.loop is None:
+            return
+        try:
+            self.run(self._close())
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+        self.loop.close()
+        self.loop = self.client = None
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+_shared_slots = None
+
+
+def share_slots(semaphore):
+    """Vagas de IA compartilhadas pelos processos do lote (chamado no início de cada processo)."""
+    global _shared_slots
+    _shared_slots = semaphore
+
+
+def get_gateway():
+    """Gateway compartilhado no processo, iniciado na primeira chamada de IA."""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            gateway = AIGateway(shared_slots=_shared_slots)
+            gateway.start()
+            _gateway = gateway
+            atexit.register(shutdown_gateway)
+        return _gateway
+
+
+def ai_available():
+    """False enquanto o circuito estiver aberto (semiaberto conta como disponível: a próxima chamada sonda)."""
+    return get_gateway().breaker.state != "open"
+
+
+def unavailable_reason():
+    return get_gateway().breaker.reason
+
+
+def shutdown_gateway():
+    global _gateway
+    with _gateway_lock:
+        if _gateway is not None:
+            _gateway.stop()
+            _gateway = None
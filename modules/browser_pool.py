@@ -0,0 +1,107 @@
+import time
+import atexit
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from playwright.async_api import async_playwright
+from colorama import Fore
+from config import Config
+
+VIEWPORT = {"width": 800, "height": 1000}
+
+
+class BrowserPool:
+    """
+    Chromium de longa duração compartilhado por todos os livros do processo.
+    A API assíncrona do Playwright roda num event loop próprio (thread dedicada), de modo que
+    o navegador sobrevive ao pipeline de cada livro; cada livro usa um contexto isolado e
+    até `pages` páginas renderizando ao mesmo tempo.
+    """
+
+    def __init__(self, pages=None):
+        self.pages = max(1, pages or Config.VISION_PAGE_CONCURRENCY)
+        self.loop = None
+        self.thread = None
+        self.playwright = None
+        self.browser = None
+        self.launch_time = 0.0
+        self.books = 0
+
+    @property
+    def alive(self):
+        return self.browser is not None and self.browser.is_connected()
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True, name="browser-pool")
+        self.thread.start()
+        start = time.time()
+        self.run(self._launch())
+        self.launch_time = time.time() - start
+
+    async def _launch(self):
+        self.playwright = await async_playwright().start()
+        self.browser = await self.playwright.chromium.launch()
+
+    def run(self, coro):
+        """Executa uma corrotina no event loop do pool e espera o resultado (chamado de threads do pipeline)."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    @asynccontextmanager
+    async def context(self):
+        """Contexto isolado (cookies, cache, armazenamento) para um livro."""
+        context = await self.browser.new_context(viewport=VIEWPORT)
+        try:
+            yield context
+        finally:
+            await context.close()
+
+    async def _close(self):
+        if self.browser is not None:
+            await self.browser.close()
+        if self.playwright is not None:
+            await self.playwright.stop()
+
+    def stop(self):
+        if self.loop is None:
+            return
+        try:
+            self.run(self._close())
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+        self.loop.close()
+        self.loop = self.browser = self.playwright = None
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Pool compartilhado no processo, iniciado no primeiro livro com análise visual."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool.alive:
+            return _pool
+        if _pool is not None:
+            print(f"{Fore.YELLOW}    [      AVISO       ] Navegador encerrado inesperadamente; iniciando outro.")
+            _pool.stop()
+        pool = BrowserPool()
+        try:
+            pool.start()
+        except Exception:
+            pool.stop()
+            raise
+        _pool = pool
+        atexit.register(shutdown_pool)
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.stop()
+            _pool = None
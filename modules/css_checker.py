@@ -1,39 +1,47 @@
-import zipfile
 import re
 from colorama import Fore
+from modules.findings import Severity, finding
 
-def validate_css_rules(epub_path):
+def validate_css_rules(pkg):
     """Verifica regras de estilo no CSS: .limitador e riscos de renderização Binpar."""
     results = {"limitador_ok": False, "binpar_risks": []}
     
     try:
-        with zipfile.ZipFile(epub_path, 'r') as z:
-            css_files = [f for f in z.namelist() if f.endswith('.css')]
+        css_files = [f for f in pkg.names if f.endswith('.css')]
+        
+        for css_file in css_files:
+            content = pkg.text(css_file)
+            
+            # Busca robusta por .limitador { width: 40em; } (suporta espaços e variações)
+            if re.search(r'\.limitador\s*\{[^}]*width\s*:\s*40em', content, re.IGNORECASE):
+                results["limitador_ok"] = True
             
-            for css_file in css_files:
-                with z.open(css_file) as f:
-                    content = f.read().decode('utf-8', errors='ignore')
-                    
-                    # Busca robusta por .limitador { width: 40em; } (suporta espaços e variações)
-                    if re.search(r'\.limitador\s*\{[^}]*width\s*:\s*40em', content, re.IGNORECASE):
-                        results["limitador_ok"] = True
-                    
-                    # Detecta counters e pseudo-elementos (Problemas comuns na Binpar)
-                    counters = re.findall(r'counter-(?:reset|increment)\s*:', content)
-                    pseudos = re.findall(r'::before|::after', content)
-                    
-                    if counters or pseudos:
-                        results["binpar_risks"].append({
-                            "file": css_file,
-                            "has_counters": len(counters) > 0,
-                            "has_pseudos": len(pseudos) > 0
-                        })
+            # Detecta counters e pseudo-elementos (Problemas comuns na Binpar)
+            counters = re.findall(r'counter-(?:reset|increment)\s*:', content)
+            pseudos = re.findall(r'::before|::after', content)
+            
+            if counters or pseudos:
+                results["binpar_risks"].append({
+                    "file": css_file,
+                    "has_counters": len(counters) > 0,
+                    "has_pseudos": len(pseudos) > 0
+                })
         return results
     except Exception as e:
         print(f"{Fore.RED}    [      FALHOU      ] Erro ao analisar arquivos CSS: {e}")
         return results
 
-def validate_limitador_and_structures(epub_path, is_secad=False):
+def _scan_xhtml_structure(pkg, html):
+    """Fatos de um XHTML usados na varredura: presença da .limitador e listas em tabelas/divs."""
+    content = pkg.text(html)
+    has_list = "<ul>" in content or "<ol>" in content
+    return {
+        "limitador": bool(re.search(r'class\s*=\s*["\'][^"\']*limitador[^"\']*["\']', content, re.IGNORECASE)),
+        "list_in_table": "<table>" in content and has_list,
+        "list_in_div": "<div>" in content and has_list
+    }
+
+def validate_limitador_and_structures(pkg, is_secad=False):
     """
     Varredura nos XHTMLs:
     1. Verifica ausência da div .limitador (exceto para Secad).
@@ -42,77 +50,36 @@ def validate_limitador_and_structures(epub_path, is_secad=False):
     analysis_results = {
         "missing_limitador": [],
         "binpar_complex_warnings": [],
-        "detailed_logs": []
+        "findings": []
     }
+    findings = analysis_results["findings"]
+    section = "Detalhamento: Classe .limitador e Estruturas"
     
     try:
-        with zipfile.ZipFile(epub_path, 'r') as z:
-            # Filtra apenas arquivos de conteúdo, ignorando navegação
-            html_files = [f for f in z.namelist() if f.endswith(('.xhtml', '.html')) and 'nav' not in f.lower()]
+        # Filtra apenas arquivos de conteúdo, ignorando navegação
+        html_files = [f for f in pkg.names if f.endswith(('.xhtml', '.html')) and 'nav' not in f.lower()]
+        
+        for html in html_files:
+            facts = pkg.facts('xhtml_structure', html, lambda: _scan_xhtml_structure(pkg, html))
             
-            for html in html_files:
-                with z.open(html) as f:
-                    content = f.read().decode('utf-8', errors='ignore')
-                    
-                    file_log = []
-                    
-                    # 1. Checagem da div .limitador (exceto para Secad)
-                    if not is_secad:
-                        if not re.search(r'class\s*=\s*["\'][^"\']*limitador[^"\']*["\']', content, re.IGNORECASE):
-                            analysis_results["missing_limitador"].append(html)
-                            file_log.append("<span style='font-family:monospace; color:#c0392b;'>[ FALHOU ]</span>")
-                        else:
-                            file_log.append("<span style='font-family:monospace; color:#27ae60;'>[ PASSOU ]</span>")
-                    
-                    # 2. Checagem de estruturas complexas (Binpar High Risk)
-                    # Lista dentro de Tabela
-                    if "<table>" in content and ("<ul>" in content or "<ol>" in content):
-                        msg = f"{html} (Lista dentro de Tabela)"
-                        analysis_results["binpar_complex_warnings"].append(msg)
-                        file_log.append("<span style='font-family:monospace; color:#f39c12;'>[ AVISO  ]</span> Estrutura complexa: Lista dentro de Tabela")
-                    
-                    # Lista dentro de Div (Risco Médio)
-                    elif "<div>" in content and ("<ul>" in content or "<ol>" in content):
-                        # Só alerta se houver uma div imediatamente pai ou próxima
-                        msg = f"{html} (Lista dentro de Div)"
-                        analysis_results["binpar_complex_warnings"].append(msg)
-                        file_log.append("<span style='font-family:monospace; color:#f39c12;'>[ AVISO  ]</span> Estrutura complexa: Lista dentro de Div")
-                    
-                    # Determinação do status consolidado para o prefixo
-                    if any("FALHOU" in s for s in file_log):
-                        status_marker = "<span style='font-family:monospace; color:#c0392b;'>[ FALHOU ]</span>"
-                    elif any("AVISO" in s for s in file_log):
-                        status_marker = "<span style='font-family:monospace; color:#f39c12;'>[ AVISO  ]</span>"
-                    elif any("PASSOU" in s for s in file_log):
-                        status_marker = "<span style='font-family:monospace; color:#27ae60;'>[ PASSOU ]</span>"
-                    else:
-                        # Arquivo sem validações ativas (ex: Secad sem .limitador e sem estruturas complexas)
-                        status_marker = "<span style='font-family:monospace; color:#27ae60;'>[ PASSOU ]</span>"
-                    
-                    # Limpeza dos detalhes (remove os marcadores internos para evitar redundância)
-                    clean_details = []
-                    for log in file_log:
-                        # Remove a tag span do status
-                        msg = re.sub(r'<span[^>]*>\[.*?\]</span>\s*', '', log).strip()
-                        if msg: clean_details.append(msg)
-                    
-                    if not clean_details:
-                        if "PASSOU" in status_marker and not is_secad:
-                            details = "Div .limitador presente"
-                        elif "FALHOU" in status_marker:
-                            details = "Div .limitador ausente"
-                        else:
-                            # Secad ou sem problemas estruturais
-                            details = "Verificação estrutural OK"
-                    else:
-                        details = "; ".join(clean_details)
-                    
-                    # Só adiciona ao log se houver algo relevante ou for não-Secad
-                    if not is_secad or clean_details:
-                        analysis_results["detailed_logs"].append(f"{status_marker} 📄 {html}: {details}")
+            # 1. Checagem da div .limitador (exceto para Secad)
+            if not is_secad:
+                if not facts["limitador"]:
+                    analysis_results["missing_limitador"].append(html)
+                    findings.append(finding("limitador", Severity.ERROR, f"`{html}`: Div .limitador ausente", html, section=section))
+                else:
+                    findings.append(finding("limitador", Severity.PASS, f"`{html}`: Div .limitador presente", html, section=section))
             
-            if analysis_results["detailed_logs"]:
-                analysis_results["detailed_logs"].insert(0, "<br>📄 <strong>Detalhamento: Classe .limitador e Estruturas</strong>")
+            # 2. Checagem de estruturas complexas (Binpar High Risk)
+            # Lista dentro de Tabela; senão, Lista dentro de Div (Risco Médio)
+            if facts["list_in_table"]:
+                structure = "Lista dentro de Tabela"
+            elif facts["list_in_div"]:
+                structure = "Lista dentro de Div"
+            else:
+                continue
+            analysis_results["binpar_complex_warnings"].append(f"{html} ({structure})")
+            findings.append(finding("binpar", Severity.WARNING, f"`{html}`: Estrutura complexa: {structure}", html, section=section))
         
         # Logs de console para feedback imediato
         if analysis_results["missing_limitador"]:
@@ -123,5 +90,5 @@ def validate_limitador_and_structures(epub_path, is_secad=False):
         return analysis_results
     except Exception as e:
         print(f"{Fore.RED}    [      FALHOU      ] Erro na varredura de XHTML: {e}")
-        analysis_results["detailed_logs"].append(f"<span style='font-family:monospace; color:#c0392b;'>[      FALHOU      ]</span> Erro crítico na varredura: {str(e)}")
-        return analysis_results
\ No newline at end of file
+        findings.append(finding("limitador", Severity.ERROR, f"Erro crítico na varredura: {e}", section=section))
+        return analysis_results
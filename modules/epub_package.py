@@ -0,0 +1,292 @@
+import re
+import zipfile
+import posixpath
+import threading
+from array import array
+from collections import namedtuple
+from urllib.parse import unquote
+from lxml import etree
+
+CONTAINER_PATH = "META-INF/container.xml"
+HTML_EXTENSIONS = ('.xhtml', '.html')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.svg', '.webp', '.tiff')
+OPF_NS = {'dc': 'http://purl.org/dc/elements/1.1/', 'opf': 'http://www.idpf.org/2007/opf'}
+# Quebras de linha contadas como no parser XML (e no EPubCheck)
+NEWLINE_RE = re.compile(r'\r\n|\r|\n')
+
+# Resultado da resolução de um caminho no índice:
+# member: nome real no ZIP (None se não resolvido); status: um dos MATCH_*;
+# path: caminho normalizado que foi procurado; candidates: membros concorrentes (ambíguo)
+PathMatch = namedtuple('PathMatch', ['member', 'status', 'path', 'candidates'])
+
+MATCH_EXACT = "exact"
+MATCH_CASE = "case"
+MATCH_BASENAME = "basename"
+MATCH_AMBIGUOUS = "ambiguous"
+MATCH_MISSING = "missing"
+
+
+class PathIndex:
+    """
+    Índice dos membros do ZIP com chaves exata, minúscula e por nome de arquivo.
+    Resolve hrefs em O(1) e sinaliza correspondências ambíguas em vez de escolher a primeira.
+    """
+
+    def __init__(self, names):
+        self.exact = set(names)
+        self.lower = {}
+        self.basename = {}
+        for name in names:
+            if name.endswith('/'):
+                continue
+            self.lower.setdefault(name.lower(), []).append(name)
+            self.basename.setdefault(posixpath.basename(name).lower(), []).append(name)
+
+    @staticmethod
+    def normalize(base_file, href):
+        """Caminho no ZIP de um href relativo a base_file (sem fragmento, query ou escapes %)."""
+        target = unquote(href.split('#')[0].split('?')[0]).replace('\\', '/')
+        if not target:
+            # Fragmento no próprio documento (href="#id")
+            return base_file or ""
+        if target.startswith('/'):
+            full = target.lstrip('/')
+        else:
+            base_dir = posixpath.dirname(base_file) if base_file else ""
+            full = posixpath.join(base_dir, target) if base_dir else target
+        return posixpath.normpath(full) if full else ""
+
+    def lookup(self, path, allow_basename=False):
+        """Procura um caminho já relativo à raiz do ZIP."""
+        if not path:
+            return PathMatch(None, MATCH_MISSING, path, [])
+        if path in self.exact:
+            return PathMatch(path, MATCH_EXACT, path, [])
+
+        same_case = self.lower.get(path.lower(), [])
+        if len(same_case) == 1:
+            return PathMatch(same_case[0], MATCH_CASE, path, [])
+        if len(same_case) > 1:
+            return PathMatch(None, MATCH_AMBIGUOUS, path, same_case)
+
+        if allow_basename:
+            same_name = self.basename.get(posixpath.basename(path).lower(), [])
+            # Aceita apenas se o caminho pedido for sufixo do membro em segmentos inteiros
+            # ("b/c.xhtml" casa com "OEBPS/b/c.xhtml", mas não com "ab/c.xhtml")
+            suffix = path.lower()
+            same_name = [n for n in same_name if n.lower() == suffix or n.lower().endswith('/' + suffix)]
+            if len(same_name) == 1:
+                return PathMatch(same_name[0], MATCH_BASENAME, path, [])
+            if len(same_name) > 1:
+                return PathMatch(None, MATCH_AMBIGUOUS, path, same_name)
+
+        return PathMatch(None, MATCH_MISSING, path, [])
+
+    def resolve(self, base_file, href, allow_basename=False):
+        """Resolve um href relativo ao arquivo que o contém."""
+        return self.lookup(self.normalize(base_file, href), allow_basename=allow_basename)
+
+
+class EpubPackage:
+    """
+    Pacote EPUB aberto uma única vez por livro.
+    Mantém o ZIP aberto, o manifesto e o spine do OPF, os bytes descompactados sob
+    demanda e as árvores lxml memorizadas, para que todos os módulos compartilhem
+    a mesma leitura de cada XHTML.
+    """
+
+    def __init__(self, epub_path):
+        self.epub_path = str(epub_path)
+        self.zip = zipfile.ZipFile(self.epub_path, 'r')
+        self.infolist = self.zip.infolist()
+        self.names = [info.filename for info in self.infolist]
+        self._name_set = set(self.names)
+        self.paths = PathIndex(self.names)
+
+        # Caches (bytes, texto decodificado, árvores HTML e XML)
+        self._bytes = {}
+        self._texts = {}
+        self._html_trees = {}
+        self._xml_trees = {}
+        self._ids = {}
+        self._line_offsets = {}
+        self._id_locations = None
+        self._lock = threading.RLock()
+        self.stats = {"reads": 0, "parses": 0}
+        # Fatos por membro persistidos entre versões do livro (MemberFacts, opcional)
+        self.member_facts = None
+
+        self.opf_path = self._find_opf()
+        self.manifest = {}  # id -> {"href": caminho no zip, "media_type": str, "properties": str}
+        self.spine = []     # caminhos no zip, na ordem de leitura
+        self.metadata = {}
+        self._load_opf()
+
+    # --- Ciclo de vida ---
+    def close(self):
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- Listagens ---
+    @property
+    def html_files(self):
+        return [f for f in self.names if f.lower().endswith(HTML_EXTENSIONS)]
+
+    @property
+    def css_files(self):
+        return [f for f in self.names if f.lower().endswith('.css')]
+
+    @property
+    def image_files(self):
+        return [f for f in self.names if f.lower().endswith(IMAGE_EXTENSIONS)]
+
+    @property
+    def nav_files(self):
+        """Documentos de navegação declarados no manifesto (properties="nav")."""
+        return [item["href"] for item in self.manifest.values() if 'nav' in item["properties"].split()]
+
+    def exists(self, name):
+        return name in self._name_set
+
+    # --- Leitura com cache ---
+    def read(self, name, cache=True):
+        """Bytes descompactados do membro (memorizados, exceto se cache=False)."""
+        with self._lock:
+            if name in self._bytes:
+                return self._bytes[name]
+        data = self.zip.read(name)
+        with self._lock:
+            self.stats["reads"] += 1
+            if cache:
+                self._bytes[name] = data
+        return data
+
+    def text(self, name):
+        """Conteúdo decodificado em UTF-8 (erros ignorados), memorizado."""
+        with self._lock:
+            if name in self._texts:
+                return self._texts[name]
+        content = self.read(name).decode('utf-8', errors='ignore')
+        with self._lock:
+            self._texts[name] = content
+        return content
+
+    def line(self, name, line_no):
+        """Linha line_no (a partir de 1) do texto do membro, sem a quebra; "" se fora do intervalo.
+        Usa uma tabela de offsets por membro (memorizada) em vez de dividir o texto a cada consulta."""
+        content = self.text(name)
+        with self._lock:
+            offsets = self._line_offsets.get(name)
+        if offsets is None:
+            offsets = array('L', [0])
+            offsets.extend(m.end() for m in NEWLINE_RE.finditer(content))
+            with self._lock:
+                self._line_offsets[name] = offsets
+        if not 0 < line_no <= len(offsets):
+            return ""
+        end = offsets[line_no] if line_no < len(offsets) else len(content)
+        return content[offsets[line_no - 1]:end].rstrip('\r\n')
+
+    def html(self, name):
+        """Árvore lxml (parser HTML tolerante), memorizada. Pode ser None para arquivos vazios."""
+        with self._lock:
+            if name in self._html_trees:
+                return self._html_trees[name]
+        tree = etree.HTML(self.read(name))
+        with self._lock:
+            self.stats["parses"] += 1
+            self._html_trees[name] = tree
+        return tree
+
+    def xml(self, name):
+        """Árvore lxml (parser XML estrito), memorizada. Propaga XMLSyntaxError."""
+        with self._lock:
+            if name in self._xml_trees:
+                return self._xml_trees[name]
+        tree = etree.fromstring(self.read(name))
+        with self._lock:
+            self.stats["parses"] += 1
+            self._xml_trees[name] = tree
+        return tree
+
+    # --- Fatos por membro ---
+    def facts(self, kind, name, compute, valid=lambda value: True):
+        """Resultado de compute() para o membro, reaproveitado do cache se o CRC32 não mudou
+        (e se valid() aceitar o valor guardado). O valor precisa ser serializável em JSON."""
+        if self.member_facts is None:
+            return compute()
+        return self.member_facts.get(kind, name, compute, valid)
+
+    # --- Índice de IDs ---
+    def ids(self, name):
+        """Conjunto de ids declarados no documento (memorizado)."""
+        with self._lock:
+            if name in self._ids:
+                return self._ids[name]
+        found = frozenset(self.facts('ids', name, lambda: self._parse_ids(name)))
+        with self._lock:
+            self._ids[name] = found
+        return found
+
+    def _parse_ids(self, name):
+        tree = self.html(name)
+        return sorted(set(tree.xpath('//@id'))) if tree is not None else []
+
+    def id_locations(self):
+        """Índice global id -> lista de documentos que o declaram (construído uma vez)."""
+        with self._lock:
+            if self._id_locations is not None:
+                return self._id_locations
+        locations = {}
+        for name in self.html_files:
+            for id_value in self.ids(name):
+                locations.setdefault(id_value, []).append(name)
+        with self._lock:
+            self._id_locations = locations
+        return locations
+
+    # --- OPF ---
+    def _find_opf(self):
+        if CONTAINER_PATH in self._name_set:
+            try:
+                container = self.xml(CONTAINER_PATH)
+                paths = container.xpath('//*[local-name()="rootfile"]/@full-path')
+                if paths and paths[0] in self._name_set:
+                    return paths[0]
+            except etree.XMLSyntaxError:
+                pass
+        return next((f for f in self.names if f.endswith('.opf')), None)
+
+    def _load_opf(self):
+        if not self.opf_path:
+            return
+        try:
+            opf = self.xml(self.opf_path)
+        except etree.XMLSyntaxError:
+            return
+
+        opf_dir = posixpath.dirname(self.opf_path)
+        for item in opf.xpath('//*[local-name()="manifest"]/*[local-name()="item"]'):
+            href = unquote(item.get('href', ''))
+            full = posixpath.normpath(posixpath.join(opf_dir, href)) if opf_dir else posixpath.normpath(href)
+            self.manifest[item.get('id', '')] = {
+                "href": full,
+                "media_type": item.get('media-type', ''),
+                "properties": item.get('properties', '')
+            }
+
+        for ref in opf.xpath('//*[local-name()="spine"]/*[local-name()="itemref"]/@idref'):
+            if ref in self.manifest:
+                self.spine.append(self.manifest[ref]["href"])
+
+        publisher = opf.xpath('//dc:publisher/text()', namespaces=OPF_NS)
+        if publisher:
+            self.metadata['publisher'] = publisher[0].strip()
+        title = opf.xpath('//dc:title/text()', namespaces=OPF_NS)
+        if title:
+            self.metadata['title'] = title[0].strip()
@@ -0,0 +1,97 @@
+import json
+
+# Tamanho do bloco lido do JSON do EPubCheck (o buffer nunca guarda muito mais que isso)
+CHUNK_SIZE = 1 << 20
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\r\n'
+
+
+class _JsonReader:
+    """Leitor incremental: decodifica um valor JSON por vez a partir de blocos do arquivo."""
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Descarta o que já foi consumido para manter o buffer pequeno
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"JSON do EPubCheck inválido: esperado '{char}', encontrado '{found}'")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # Um número no fim do buffer pode estar cortado; só aceita após ler o próximo bloco
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return obj
+
+    def items(self, close):
+        """Percorre os elementos de um array/objeto já aberto até o delimitador `close`."""
+        if self.peek() == close:
+            self.pos += 1
+            return
+        while True:
+            yield
+            sep = self.peek()
+            self.pos += 1
+            if sep == close:
+                return
+            if sep != ',':
+                raise ValueError(f"JSON do EPubCheck inválido: separador '{sep}'")
+
+
+def iter_messages(path, meta=None):
+    """
+    Itera as mensagens do relatório JSON do EPubCheck sem carregar o arquivo inteiro.
+    Os demais campos de primeiro nível (ex.: "checker") são guardados em `meta`;
+    arrays grandes fora de "messages" (como "items") são percorridos e descartados.
+    """
+    meta = meta if meta is not None else {}
+    with open(path, 'r', encoding='utf-8') as f:
+        reader = _JsonReader(f)
+        reader.expect('{')
+        for _ in reader.items('}'):
+            key = reader.value()
+            reader.expect(':')
+            if reader.peek() != '[':
+                meta[key] = reader.value()
+                continue
+            reader.expect('[')
+            for _ in reader.items(']'):
+                element = reader.value()
+                if key == 'messages':
+                    yield element
@@ -0,0 +1,143 @@
+import atexit
+import itertools
+import queue
+import subprocess
+import threading
+from pathlib import Path
+from colorama import Fore
+from config import Config
+
+WORKER_SOURCE = Path(__file__).parent / "EpubCheckWorker.java"
+PROTOCOL_TAG = "@@EPUBCHECK-WORKER@@"
+
+
+class EpubCheckWorker:
+    """
+    JVM de longa duração que mantém o EPubCheck carregado e valida um EPUB por pedido.
+    Se o processo morrer ou não responder, o chamador volta para o subprocess tradicional.
+    """
+
+    def __init__(self, jar_path=None):
+        self.jar_path = jar_path or Config.EPUBCHECK_JAR
+        self.process = None
+        self._lines = queue.Queue()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self, timeout=Config.EPUBCHECK_WORKER_STARTUP_TIMEOUT):
+        command = ["java", "-cp", self.jar_path, str(WORKER_SOURCE)]
+        self.process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,
+        )
+        threading.Thread(target=self._pump, args=(self.process.stdout,), daemon=True).start()
+        if self._wait_for(f"{PROTOCOL_TAG} READY", timeout) is None:
+            self.stop()
+            return False
+        return True
+
+    def _pump(self, stream):
+        # Lê o stdout do worker numa thread para permitir timeouts no lado Python
+        for line in stream:
+            self._lines.put(line.rstrip("\n"))
+        self._lines.put(None)
+
+    def _wait_for(self, prefix, timeout):
+        while True:
+            try:
+                line = self._lines.get(timeout=timeout)
+            except queue.Empty:
+                return None
+            if line is None:
+                return None
+            if line.startswith(prefix):
+                return line
+
+    def check(self, epub_path, json_out, timeout=Config.EPUBCHECK_WORKER_TIMEOUT):
+        """Valida um EPUB no worker. Retorna True se o JSON foi gerado pelo worker."""
+        with self._lock:
+            if not self.alive:
+                return False
+            job_id = next(self._ids)
+            try:
+                self.process.stdin.write(f"{job_id}\t{Path(epub_path).resolve()}\t{Path(json_out).resolve()}\n")
+                self.process.stdin.flush()
+            except (BrokenPipeError, OSError):
+                self.stop()
+                return False
+
+            reply = self._wait_for(f"{PROTOCOL_TAG} {job_id} ", timeout)
+            if reply is None:
+                # Travou ou morreu: descarta o worker para os próximos livros
+                self.stop()
+                return False
+            code = reply.rsplit(" ", 1)[-1]
+            return code != "-1" and Path(json_out).exists()
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.process = None
+
+
+_worker = None
+_worker_failed = False
+_worker_lock = threading.Lock()
+
+
+def get_worker():
+    """Worker compartilhado no processo, iniciado sob demanda (None se não puder subir)."""
+    global _worker, _worker_failed
+    with _worker_lock:
+        if _worker is not None and _worker.alive:
+            return _worker
+        if _worker_failed:
+            return None
+        worker = EpubCheckWorker()
+        try:
+            started = worker.start()
+        except OSError:
+            started = False
+        if not started:
+            _worker_failed = True
+            print(f"{Fore.YELLOW}    [      AVISO       ] Worker EPubCheck indisponível, usando subprocess por livro.")
+            return None
+        _worker = worker
+        atexit.register(shutdown_worker)
+        return _worker
+
+
+def run_in_worker(epub_path, json_out):
+    """Tenta validar no worker persistente. Retorna False para o chamador usar o subprocess."""
+    worker = get_worker()
+    if worker is None:
+        return False
+    if worker.check(epub_path, json_out):
+        return True
+    print(f"{Fore.YELLOW}    [      AVISO       ] Worker EPubCheck falhou, voltando ao subprocess.")
+    return False
+
+
+def shutdown_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is not None:
+            _worker.stop()
+            _worker = None
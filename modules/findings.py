@@ -0,0 +1,52 @@
+import sys
+from enum import IntEnum
+from typing import NamedTuple, Optional
+
+
+class Severity(IntEnum):
+    PASS = 0     # item verificado sem problemas
+    INFO = 1     # contexto (arquivo analisado, totais)
+    WARNING = 2
+    ERROR = 3
+
+
+class Finding(NamedTuple):
+    """
+    Resultado de uma verificação, sem formatação: o HTML é montado só na geração do relatório.
+    `message` é texto simples; trechos entre crases (`assim`) são exibidos como código.
+    `section` agrupa os achados no log (ex.: "Links do Sumário Técnico").
+    """
+    check: str
+    severity: Severity
+    message: str
+    file: Optional[str] = None
+    line: Optional[int] = None
+    section: Optional[str] = None
+
+
+def finding(check, severity, message, file=None, line=None, section=None):
+    # Caminhos se repetem em milhares de achados: internados, ocupam uma única string
+    return Finding(check, severity, message, sys.intern(file) if file else None, line or None, section)
+
+
+def _as_finding(row):
+    if isinstance(row, Finding):
+        return row
+    if not isinstance(row, (list, tuple)) or not 3 <= len(row) <= 6 or not isinstance(row[2], str):
+        raise ValueError(f"Achado malformado: {row!r}")
+    return finding(row[0], Severity(row[1]), *row[2:])
+
+
+def as_findings(rows):
+    """
+    Reconstrói achados vindos do cache em JSON (listas) ou já tipados.
+    Linhas em outro formato (ex.: cache de uma versão anterior) levantam ValueError.
+    """
+    if not isinstance(rows, (list, tuple)):
+        raise ValueError(f"Lista de achados malformada: {type(rows).__name__}")
+    return [_as_finding(row) for row in rows]
+
+
+def problems(findings, check=None):
+    """Achados de aviso ou erro (opcionalmente de uma verificação)."""
+    return [f for f in findings if f.severity >= Severity.WARNING and (check is None or f.check == check)]
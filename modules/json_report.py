@@ -0,0 +1,143 @@
+import re
+import json
+import html
+import time
+from pathlib import Path
+from config import Config
+from modules.findings import Severity
+
+# Versão do formato dos relatórios JSON/NDJSON (incrementar ao mudar campos existentes)
+SCHEMA_VERSION = 1
+
+_TAG_RE = re.compile(r'<[^>]+>')
+
+
+def plain_text(value):
+    """Texto sem tags nem entidades HTML (mensagens montadas para o relatório HTML)."""
+    return re.sub(r'\s+', ' ', html.unescape(_TAG_RE.sub('', str(value)))).strip()
+
+
+def _finding(check, severity, message, file=None, line=None, plain=False):
+    return {"check": check, "severity": severity, "file": file, "line": line if line and line > 0 else None,
+            "message": message if plain else plain_text(message)}
+
+
+def collect_findings(data):
+    """Converte o report_data de um livro em achados tipados: check, severity, file, line, message."""
+    findings = []
+
+    for m in data['epubcheck']['messages']:
+        findings.append(_finding("epubcheck", m['severity'], m['text'], m.get('file'), m.get('line')))
+
+    # Estrutura, referências internas, .limitador/Binpar e atividades já chegam tipados: só avisos e falhas
+    for f in data.get('findings', []):
+        if f.severity >= Severity.WARNING:
+            findings.append(_finding(f.check, f.severity.name, f.message.replace('`', ''), f.file, f.line, plain=True))
+
+    for link in data.get('external_links', []):
+        if link['ok']:
+            continue
+        message = f"{link['url']} → {link['status']}"
+        for occurrence in link.get('occurrences') or [{}]:
+            findings.append(_finding("external_links", "ERROR", message, occurrence.get('file'), occurrence.get('line')))
+
+    for file in data.get('invalid_filenames', []):
+        findings.append(_finding("filenames", "ERROR", "Nome de arquivo com caracteres não permitidos", file))
+
+    for image in data.get('invalid_images', []):
+        findings.append(_finding("images", "ERROR",
+                                 f"{image['width']}x{image['height']} = {image['pixels']:,}px excede o limite", image['path']))
+
+    return findings
+
+
+def build_report(epub_name, data, ok, failed_checks):
+    """Documento JSON do livro: achados tipados, links, tempos e uso de tokens."""
+    findings = collect_findings(data)
+    counts = {}
+    for f in findings:
+        by_severity = counts.setdefault(f["check"], {})
+        by_severity[f["severity"]] = by_severity.get(f["severity"], 0) + 1
+    # Itens aprovados entram só na contagem
+    for f in data.get('findings', []):
+        if f.severity == Severity.PASS:
+            by_severity = counts.setdefault(f.check, {})
+            by_severity["PASS"] = by_severity.get("PASS", 0) + 1
+
+    return {
+        "schema": SCHEMA_VERSION,
+        "epub": epub_name,
+        "generated_at": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "tool_version": Config.TOOL_VERSION,
+        "checker_version": data['epubcheck'].get('checker_version'),
+        "publisher": data.get('publisher'),
+        "is_secad": data.get('is_secad', False),
+        "typesetter": data.get('typesetter'),
+        "ok": ok,
+        "failed_checks": failed_checks,
+        "counts": counts,
+        "findings": findings,
+        "external_links": [
+            {"url": l['url'], "status": l['status'], "ok": l['ok'], "final_url": l.get('final_url'), "error_class": l.get('error_class'),
+             "cached": l.get('cached', False), "occurrences": [{"file": o['file'], "line": o['line'], "tag": o['tag']}
+                                                               for o in l.get('occurrences', [])]}
+            for l in data.get('external_links', [])
+        ],
+        "timings": data.get('timings', {}),
+        "stage_times": data.get('stage_times', {}),
+        "critical_path": data.get('critical_path', []),
+        "ai_unavailable": data.get('ai_unavailable'),
+        "tokens": {
+            "prompt": data.get('total_prompt_tokens', 0),
+            "completion": data.get('total_completion_tokens', 0),
+            "total": data.get('total_tokens', 0),
+            "saved": data.get('tokens_saved', 0)
+        },
+        "stats": {
+            "links": data.get('link_stats', {}),
+            "vision": data.get('vision_stats', {}),
+            "ai": data.get('ai_stats', {}),
+            "package": data.get('package_stats', {}),
+            "member_facts": data.get('member_facts_stats', {}),
+            "cache_hits": data.get('cache_hits', [])
+        }
+    }
+
+
+def generate_json_report(epub_name, data, ok, failed_checks):
+    report_path = Path(f"reports/REPORT_{epub_name}.json")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(build_report(epub_name, data, ok, failed_checks), f, ensure_ascii=False, indent=1)
+    return report_path
+
+
+class FindingsStream:
+    """
+    Fluxo NDJSON do lote (uma linha por achado e uma linha de resumo por livro).
+    Só o processo principal escreve: cada livro é anexado a partir do seu REPORT_<nome>.json.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path or "reports/findings.ndjson")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.f = open(self.path, 'w', encoding='utf-8')
+
+    def add(self, summary):
+        json_report = summary.get("json_report")
+        if not json_report:
+            # Livro que falhou antes de gerar relatório: registra apenas o resumo
+            self._write({"type": "book", "epub": summary["epub"], "ok": False, "failed_checks": summary["failed_checks"]})
+            return
+        with open(json_report, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+        for finding in report["findings"]:
+            self._write({"type": "finding", "epub": report["epub"], **finding})
+        self._write({"type": "book", "epub": report["epub"], "ok": report["ok"], "failed_checks": report["failed_checks"],
+                     "counts": report["counts"], "timings": report["timings"], "tokens": report["tokens"]})
+        self.f.flush()
+
+    def _write(self, record):
+        self.f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n")
+
+    def close(self):
+        self.f.close()
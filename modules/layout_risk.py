@@ -0,0 +1,162 @@
+import math
+
+LIST_TAGS = ("ul", "ol")
+CELL_TAGS = ("td", "th")
+
+# Pesos da pontuação de risco de layout (quanto maior, mais provável quebrar no leitor/Binpar)
+WEIGHTS = {
+    "rows": 0.15,          # por linha (até MAX_ROWS)
+    "columns": 0.4,        # por coluna (até MAX_COLUMNS)
+    "spans": 0.6,          # por célula com rowspan/colspan > 1 (até MAX_SPANS)
+    "nested_table": 3.0,   # tabela dentro de tabela
+    "list_in_cell": 2.5,   # padrão Binpar: lista dentro de tabela
+    "image_in_cell": 1.5,
+    "list_depth": 1.5,     # por nível extra de lista aninhada
+    "list_items": 0.05,    # por item de lista (até MAX_ITEMS)
+    "list_image": 1.0,
+    "text": 0.5,           # por ordem de grandeza do texto (log10 dos caracteres)
+}
+MAX_ROWS = 60
+MAX_COLUMNS = 12
+MAX_SPANS = 15
+MAX_ITEMS = 60
+
+
+def _local(node):
+    tag = node.tag
+    return tag.rsplit('}', 1)[-1].lower() if isinstance(tag, str) else ""
+
+
+def _is_complex(node):
+    """Mesmo critério do seletor usado no navegador: table, ou ul/ol filho de div que não seja .limitador."""
+    tag = _local(node)
+    if tag == "table":
+        return True
+    if tag in LIST_TAGS:
+        parent = node.getparent()
+        return parent is not None and _local(parent) == "div" and "limitador" not in (parent.get("class") or "").split()
+    return False
+
+
+def _nearest_table(node):
+    return next((a for a in node.iterancestors() if _local(a) == "table"), None)
+
+
+def _span(cell, attr):
+    try:
+        return int(cell.get(attr) or 1)
+    except ValueError:
+        return 1
+
+
+def _count(node, tags, inside=None):
+    """Descendentes com uma das tags (opcionalmente só os que estão dentro de células)."""
+    return sum(1 for n in node.iterdescendants() if _local(n) in tags
+               and (inside is None or any(_local(a) in inside for a in n.iterancestors())))
+
+
+def _score_table(table):
+    # Linhas e células da própria tabela (as de tabelas aninhadas contam como aninhamento)
+    rows = [r for r in table.iterdescendants() if _local(r) == "tr" and _nearest_table(r) is table]
+    columns = max((sum(_span(c, "colspan") for c in r if _local(c) in CELL_TAGS) for r in rows), default=0)
+    spans = sum(1 for r in rows for c in r if _local(c) in CELL_TAGS and (_span(c, "rowspan") > 1 or _span(c, "colspan") > 1))
+    nested = _count(table, ("table",))
+    lists = _count(table, LIST_TAGS, inside=CELL_TAGS)
+    images = _count(table, ("img", "svg"), inside=CELL_TAGS)
+    text = len("".join(table.itertext()).strip())
+
+    reasons = [f"{len(rows)} linhas x {columns} colunas"]
+    score = WEIGHTS["rows"] * min(len(rows), MAX_ROWS) + WEIGHTS["columns"] * min(columns, MAX_COLUMNS)
+    if spans:
+        score += WEIGHTS["spans"] * min(spans, MAX_SPANS)
+        reasons.append(f"{spans} células mescladas")
+    if nested:
+        score += WEIGHTS["nested_table"] * min(nested, 5)
+        reasons.append(f"{nested} tabela(s) aninhada(s)")
+    if lists:
+        score += WEIGHTS["list_in_cell"] * min(lists, 5)
+        reasons.append(f"{lists} lista(s) em células")
+    if images:
+        score += WEIGHTS["image_in_cell"] * min(images, 5)
+        reasons.append(f"{images} imagem(ns) em células")
+    score += WEIGHTS["text"] * math.log10(text + 1)
+    return score, reasons
+
+
+def _list_depth(node):
+    depth = 1
+    for sub in node.iterdescendants():
+        if _local(sub) in LIST_TAGS:
+            chain = 2
+            for a in sub.iterancestors():
+                if a is node:
+                    break
+                if _local(a) in LIST_TAGS:
+                    chain += 1
+            depth = max(depth, chain)
+    return depth
+
+
+def _score_list(node):
+    depth = _list_depth(node)
+    items = _count(node, ("li",))
+    images = _count(node, ("img", "svg"))
+    text = len("".join(node.itertext()).strip())
+
+    reasons = [f"{items} itens"]
+    score = WEIGHTS["list_items"] * min(items, MAX_ITEMS)
+    if depth > 1:
+        score += WEIGHTS["list_depth"] * (depth - 1)
+        reasons.append(f"{depth} níveis de aninhamento")
+    if images:
+        score += WEIGHTS["list_image"] * min(images, 5)
+        reasons.append(f"{images} imagem(ns)")
+    score += WEIGHTS["text"] * math.log10(text + 1)
+    return score, reasons
+
+
+def _score_document(pkg, member):
+    """
+    Candidatos de um documento: [tag, ordem entre os elementos da mesma tag, índice entre os
+    elementos complexos, pontuação, motivos]. A ordem por tag localiza o elemento no navegador.
+    """
+    tree = pkg.html(member)
+    if tree is None:
+        return []
+    candidates = []
+    ordinals = {}
+    index = 0
+    for node in tree.iter():
+        tag = _local(node)
+        if tag not in ("table",) + LIST_TAGS:
+            continue
+        ordinal = ordinals.get(tag, 0)
+        ordinals[tag] = ordinal + 1
+        if not _is_complex(node):
+            continue
+        score, reasons = _score_table(node) if tag == "table" else _score_list(node)
+        candidates.append([tag, ordinal, index, round(score, 3), reasons])
+        index += 1
+    return candidates
+
+
+def content_documents(pkg):
+    """Documentos de conteúdo na ordem de leitura (spine), seguidos dos que ficaram fora dele."""
+    html = [f for f in pkg.html_files if 'nav' not in f.rsplit('/', 1)[-1].lower()]
+    in_spine = set(pkg.spine)
+    return [f for f in pkg.spine if f in html] + sorted(f for f in html if f not in in_spine)
+
+
+def rank_candidates(pkg, documents=None):
+    """
+    Pré-classificação estática (só lxml, sem navegador) das tabelas e listas do livro por risco de layout.
+    Retorna dicts {file, tag, ordinal, index, score, reasons}, do maior para o menor risco
+    (empates na ordem de leitura).
+    """
+    ranked = []
+    for position, member in enumerate(documents if documents is not None else content_documents(pkg)):
+        for tag, ordinal, index, score, reasons in pkg.facts('layout_risk', member, lambda: _score_document(pkg, member)):
+            ranked.append({"file": member, "tag": tag, "ordinal": ordinal, "index": index,
+                           "score": score, "reasons": reasons, "position": position})
+    ranked.sort(key=lambda c: (-c["score"], c["position"], c["index"]))
+    return ranked
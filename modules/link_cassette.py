@@ -0,0 +1,80 @@
+import json
+import time
+import asyncio
+import threading
+from pathlib import Path
+import httpx
+
+# Cabeçalhos guardados na fita (o suficiente para status, redirecionamentos e Retry-After)
+RECORDED_HEADERS = ("location", "retry-after", "content-type", "content-length", "content-range")
+
+
+class CassetteTransport(httpx.AsyncBaseTransport):
+    """
+    Transporte httpx de gravação/reprodução para o verificador de links.
+    - "record": repassa para a rede e grava status, cabeçalhos relevantes e latência por requisição;
+    - "replay": responde a partir da fita, sem rede (opcionalmente reproduzindo a latência gravada).
+    Respostas repetidas da mesma requisição (ex.: 429 seguido de 200) são reproduzidas em ordem.
+    """
+
+    def __init__(self, path, mode="replay", simulate_latency=True, **transport_kwargs):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Modo de fita inválido: {mode}")
+        self.path = Path(path)
+        self.mode = mode
+        self.simulate_latency = simulate_latency
+        self._lock = threading.Lock()
+        self._cursor = {}
+        self.entries = {}
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f).get("requests", {})
+        elif mode == "replay":
+            raise FileNotFoundError(f"Fita não encontrada: {self.path}")
+        self._inner = httpx.AsyncHTTPTransport(**transport_kwargs) if mode == "record" else None
+
+    @staticmethod
+    def _key(request):
+        return f"{request.method} {request.url}"
+
+    async def handle_async_request(self, request):
+        key = self._key(request)
+        if self.mode == "record":
+            start = time.perf_counter()
+            response = await self._inner.handle_async_request(request)
+            latency = time.perf_counter() - start
+            with self._lock:
+                self.entries.setdefault(key, []).append({
+                    "status": response.status_code,
+                    "headers": {k: v for k, v in response.headers.items() if k.lower() in RECORDED_HEADERS},
+                    "latency": round(latency, 4)
+                })
+            return response
+
+        with self._lock:
+            recorded = self.entries.get(key)
+            if not recorded:
+                raise httpx.ConnectError(f"Requisição não gravada na fita: {key}", request=request)
+            index = self._cursor.get(key, 0)
+            self._cursor[key] = index + 1
+            entry = recorded[min(index, len(recorded) - 1)]
+        if self.simulate_latency and entry.get("latency"):
+            await asyncio.sleep(entry["latency"])
+        headers = dict(entry.get("headers", {}))
+        # O corpo não é gravado; evita que o cliente espere bytes que não virão
+        headers["content-length"] = "0"
+        return httpx.Response(entry["status"], headers=headers, request=request)
+
+    def save(self):
+        if self.mode != "record":
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            payload = {"requests": self.entries}
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, indent=1)
+
+    async def aclose(self):
+        if self._inner is not None:
+            await self._inner.aclose()
+        self.save()
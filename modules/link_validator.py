@@ -1,57 +1,257 @@
 import httpx
 import asyncio
-import zipfile
+import random
 import re
+import time
 import warnings
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urldefrag, urlsplit, urlunsplit
+from lxml import etree
+from config import Config
+from modules.url_cache import UrlCache
+from modules.link_cassette import CassetteTransport
 
 # Suprimir avisos de SSL inseguro (já que estamos bypassando verificação para links externos)
 warnings.filterwarnings("ignore", category=UserWarning) 
 # Nota: httpx pode não emitir InsecureRequestWarning do urllib3, mas sim seus próprios logs.
 
-async def check_url(client, url):
-    retries = 3
+# Status que indicam sobrecarga/limite temporário do servidor (vale a pena tentar de novo)
+RETRYABLE_STATUS = {429, 502, 503, 504}
+# Status que contam como link OK (206: resposta ao GET com Range de um recurso existente)
+OK_STATUS = {200, 206}
+
+
+class TokenBucket:
+    """Limite de taxa por host: `rate` requisições por segundo com rajada de até `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class HostThrottle:
+    """
+    Teto global de requisições simultâneas + semáforo e token bucket por host.
+    A vaga global é pega por último, para um host lento não prender as vagas dos demais.
+    Também contabiliza requisições e bytes recebidos (cabeçalhos + corpo efetivamente lido).
+    """
+
+    def __init__(self, max_concurrency=None, per_host=None, per_host_rate=None):
+        self.global_sem = asyncio.Semaphore(max_concurrency or Config.LINK_MAX_CONCURRENCY)
+        self.per_host = per_host or Config.LINK_PER_HOST_CONCURRENCY
+        self.per_host_rate = per_host_rate or Config.LINK_PER_HOST_RATE
+        self.hosts = {}
+        self.stats = {"requests": 0, "bytes": 0}
+
+    def _host(self, url):
+        host = urlsplit(url).hostname or ""
+        if host not in self.hosts:
+            self.hosts[host] = (asyncio.Semaphore(self.per_host),
+                                TokenBucket(self.per_host_rate, max(1.0, self.per_host_rate)))
+        return self.hosts[host]
+
+    def _account(self, response):
+        # Inclui os saltos de redirecionamento; num_bytes_downloaded é o corpo bruto (antes de descomprimir)
+        for r in [*response.history, response]:
+            self.stats["requests"] += 1
+            self.stats["bytes"] += sum(len(k) + len(v) + 4 for k, v in r.headers.raw) + r.num_bytes_downloaded
+
+    async def request(self, client, method, url):
+        host_sem, bucket = self._host(url)
+        # Vaga global só para a chamada de rede: a espera pelo limite do host não a ocupa
+        async with host_sem:
+            await bucket.acquire()
+            async with self.global_sem:
+                response = await client.request(method, url)
+        self._account(response)
+        return response
+
+    async def probe(self, client, url, headers=None):
+        """GET em modo streaming: lê status e cabeçalhos e fecha a conexão sem baixar o corpo."""
+        host_sem, bucket = self._host(url)
+        async with host_sem:
+            await bucket.acquire()
+            async with self.global_sem:
+                async with client.stream("GET", url, headers=headers) as response:
+                    pass
+        self._account(response)
+        return response
+
+
+def _retry_after(response):
+    """Segundos pedidos pelo servidor no Retry-After (inteiro ou data HTTP), se houver."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt, response=None):
+    # Retry-After tem prioridade (limitado para manter o tempo total previsível);
+    # senão, backoff exponencial com jitter completo
+    if response is not None:
+        wait = _retry_after(response)
+        if wait is not None:
+            return min(wait, Config.LINK_MAX_RETRY_AFTER)
+    return random.uniform(0, min(Config.LINK_BACKOFF_MAX, Config.LINK_BACKOFF_BASE * (2 ** attempt)))
+
+
+async def _get_probe(client, url, throttle):
+    if Config.LINK_RANGE_PROBE:
+        # Pede só o primeiro byte; 206 (Partial Content) significa que o recurso existe
+        response = await throttle.probe(client, url, headers={"Range": "bytes=0-0"})
+        if response.status_code != 416:
+            return response
+        # 416: servidor rejeitou o intervalo (ex.: recurso vazio); tenta sem Range
+    return await throttle.probe(client, url)
+
+def _result(url, response=None, error=None):
+    if error is not None:
+        return {"url": url, "status": f"Erro: {str(error)}", "final_url": None,
+                "error_class": type(error).__name__, "ok": False, "cached": False}
+    # Status real do servidor; `ok` diz se o link funciona (200 ou 206 do GET com Range)
+    code = response.status_code
+    ok = code in OK_STATUS
+    return {"url": url, "status": code, "final_url": str(response.url),
+            "error_class": None if ok else f"HTTP {code}", "ok": ok, "cached": False}
+
+async def check_url(client, url, throttle):
+    """Testa a URL e anota o tempo total gasto (incluindo esperas entre tentativas)."""
+    start = time.perf_counter()
+    result = await _check_url(client, url, throttle)
+    result["elapsed"] = round(time.perf_counter() - start, 4)
+    return result
+
+async def _check_url(client, url, throttle):
+    retries = Config.LINK_RETRIES
     for i in range(retries):
+        last_attempt = i == retries - 1
         try:
             # Tenta HEAD primeiro
-            response = await client.head(url, timeout=10.0)
+            response = await throttle.request(client, "HEAD", url)
             if response.status_code == 200:
-                return {"url": url, "status": response.status_code}
+                return _result(url, response)
             
-            # Se falhar (ex: 405 Method Not Allowed ou 403), tenta GET
-            response = await client.get(url, timeout=10.0)
-            if response.status_code == 200:
-                return {"url": url, "status": response.status_code}
+            # Se falhar (ex: 405 Method Not Allowed ou 403), tenta GET sem baixar o corpo
+            if response.status_code not in RETRYABLE_STATUS:
+                response = await _get_probe(client, url, throttle)
+                if response.status_code in OK_STATUS:
+                    return _result(url, response)
+
+            # Status definitivo (404, 410...) não melhora com novas tentativas
+            if response.status_code not in RETRYABLE_STATUS or last_attempt:
+                return _result(url, response)
+            await asyncio.sleep(_backoff(i, response))
                 
         except Exception as e:
-            if i == retries - 1:
-                return {"url": url, "status": f"Erro: {str(e)}"}
-            await asyncio.sleep(1) # Espera 1s antes de tentar novamente
+            if last_attempt:
+                return _result(url, error=e)
+            await asyncio.sleep(_backoff(i))
             
-    return {"url": url, "status": "Erro (Retries Esgotados)"}
+    return {"url": url, "status": "Erro (Retries Esgotados)", "final_url": None, "error_class": "RetriesExhausted", "ok": False, "cached": False}
 
-from lxml import etree
+DEFAULT_PORTS = {"http": 80, "https": 443}
 
-async def validate_external_links(epub_path):
-    """Extrai links http/https de tags <a> dentro do <body> e testa o status 200."""
-    urls = set()
-    with zipfile.ZipFile(epub_path, 'r') as z:
-        for file in z.namelist():
-            if file.lower().endswith(('.xhtml', '.html')):
-                with z.open(file) as f:
-                    content_bytes = f.read()
-                    try:
-                        tree = etree.HTML(content_bytes)
-                        if tree is not None:
-                            # XPath para pegar apenas hrefs de tags <a> dentro do body
-                            found_hrefs = tree.xpath('//body//a/@href')
-                            for href in found_hrefs:
-                                if href.startswith(('http://', 'https://')):
-                                    urls.update([href])
-                    except Exception:
-                        continue # Ignora erros de parsing em arquivos individuais
-
-    if not urls: return []
+# Atributos que apontam para recursos externos (links, folhas de estilo, mídia e iframes)
+EXTERNAL_REF_XPATH = '//body//a/@href | //link/@href | //img/@src | //iframe/@src | //source/@src'
 
+def canonicalize_url(url):
+    """
+    Forma canônica usada só como chave de deduplicação (não é a URL testada): esquema e host em minúsculas, sem porta padrão,
+    sem fragmento e sem barra final (exceto na raiz). Retorna None se não for http(s).
+    """
+    try:
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        if scheme not in DEFAULT_PORTS or not parts.hostname:
+            return None
+        host = parts.hostname.lower()
+        if ":" in host:
+            host = f"[{host}]"  # IPv6
+        if parts.port and parts.port != DEFAULT_PORTS[scheme]:
+            host = f"{host}:{parts.port}"
+    except ValueError:
+        return None
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/") or "/"
+    return urlunsplit((scheme, host, path, parts.query, ""))
+
+def _extract_urls(pkg, file):
+    """Ocorrências [href, linha, tag] de referências http/https no documento."""
+    tree = pkg.html(file)
+    if tree is None:
+        return []
+    found = []
+    for attr in tree.xpath(EXTERNAL_REF_XPATH):
+        href = str(attr).strip()
+        if href.lower().startswith(('http://', 'https://')):
+            element = attr.getparent()
+            found.append([href, element.sourceline, element.tag])
+    return found
+
+async def validate_external_links(pkg, cache_mode=None):
+    """
+    Extrai referências http/https (a, link, img, iframe, source) e testa o status 200.
+    Cada recurso canônico é testado uma vez, pelo href da primeira ocorrência (sem fragmento);
+    o resultado traz esse href e todas as ocorrências (arquivo e linha).
+    URLs testadas recentemente (cache SQLite entre livros) não são consultadas de novo.
+    """
+    occurrences = {}  # URL canônica -> lista de ocorrências
+    for file in pkg.html_files:
+        try:
+            for href, line, tag in pkg.facts('external_refs', file, lambda: _extract_urls(pkg, file)):
+                canonical = canonicalize_url(href)
+                if canonical:
+                    occurrences.setdefault(canonical, []).append({"file": file, "line": line, "tag": tag, "href": href})
+        except Exception:
+            continue # Ignora erros de parsing em arquivos individuais
+
+    # URL testada: um href real do livro (servidores podem distinguir /a de /a/)
+    probe_urls = {urldefrag(occ[0]["href"]).url: canonical for canonical, occ in occurrences.items()}
+    urls = set(probe_urls)
+    if not urls: return [], {"requests": 0, "bytes": 0, "cached": 0}
+
+    url_cache = UrlCache(mode=cache_mode or Config.LINK_CACHE_MODE)
+    try:
+        cached = url_cache.lookup(urls)
+        to_probe = [url for url in urls if url not in cached]
+        if cached:
+            print(f"    [INFO] {len(cached)} links externos reaproveitados do cache.")
+        results, stats = await _probe_urls(to_probe) if to_probe else ([], {"requests": 0, "bytes": 0})
+        url_cache.store(results)
+    finally:
+        url_cache.close()
+    stats["cached"] = len(cached)
+    stats["occurrences"] = sum(len(occ) for occ in occurrences.values())
+    results = list(cached.values()) + results
+    for result in results:
+        result["occurrences"] = occurrences.get(probe_urls.get(result["url"]), [])
+    return results, stats
+
+async def _probe_urls(urls):
     # Headers mais próximos de um navegador real
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -66,9 +266,24 @@ async def validate_external_links(epub_path):
         "Sec-Fetch-User": "?1"
     }
 
+    # Pool de conexões do tamanho do teto global, mantendo keep-alive para reaproveitar conexões por host
+    limits = httpx.Limits(max_connections=Config.LINK_MAX_CONCURRENCY,
+                          max_keepalive_connections=Config.LINK_MAX_CONCURRENCY,
+                          keepalive_expiry=30.0)
+    timeout = httpx.Timeout(Config.LINK_TIMEOUT, connect=min(5.0, Config.LINK_TIMEOUT))
+    throttle = HostThrottle()
+
+    # Fita de gravação/reprodução (LINK_CASSETTE) para rodar sem rede em benchmarks e testes
+    transport = None
+    if Config.LINK_CASSETTE:
+        transport = CassetteTransport(Config.LINK_CASSETTE, mode=Config.LINK_CASSETTE_MODE,
+                                      simulate_latency=Config.LINK_CASSETTE_LATENCY, verify=False, limits=limits)
+
     # Desabilitamos http2 para evitar fingerprints comuns de bots em http2
-    async with httpx.AsyncClient(headers=headers, follow_redirects=True, http2=False, verify=False) as client:
-        tasks = [check_url(client, url) for url in urls]
+    async with httpx.AsyncClient(headers=headers, follow_redirects=True, http2=False, verify=False,
+                                 limits=limits, timeout=timeout, transport=transport) as client:
+        tasks = [check_url(client, url, throttle) for url in urls]
         print(f"    [INFO] Testando {len(urls)} links externos...")
         results = await asyncio.gather(*tasks)
-        return results
\ No newline at end of file
+        print(f"    [INFO] {throttle.stats['requests']} requisições, {throttle.stats['bytes'] / 1024:.1f} KB recebidos.")
+        return results, throttle.stats
\ No newline at end of file
@@ -0,0 +1,75 @@
+import os
+import json
+import threading
+from pathlib import Path
+from config import Config
+
+
+class MemberFacts:
+    """
+    Fatos por membro do ZIP (IDs, links, achados de .limitador, dimensões de imagem...)
+    guardados em disco junto do CRC32 e do tamanho de cada membro.
+    Na próxima versão do mesmo livro (mesmo nome de arquivo), só os membros alterados
+    são reanalisados; as verificações do livro inteiro são recompostas a partir dos fatos.
+    """
+
+    def __init__(self, stem, infolist, cache_dir=None):
+        self.path = Path(cache_dir or Config.MEMBER_FACTS_DIR) / f"{stem}.json"
+        self.fingerprints = {info.filename: f"{info.CRC:08x}-{info.file_size}" for info in infolist}
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._facts = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # Fatos de outra versão da ferramenta podem ter outro formato
+        if stored.get("tool_version") != Config.TOOL_VERSION:
+            return {}
+        return stored.get("members", {})
+
+    def get(self, kind, name, compute, valid=lambda value: True):
+        """
+        Valor do fato `kind` para o membro `name`, recalculado só se o CRC mudou
+        ou se `valid` recusar o valor guardado (fato que depende de algo fora do membro).
+        """
+        fingerprint = self.fingerprints.get(name)
+        with self._lock:
+            entry = self._facts.get(name)
+            if fingerprint and entry and entry.get("crc") == fingerprint and kind in entry.get("facts", {}) \
+                    and valid(entry["facts"][kind]):
+                self.stats["hits"] += 1
+                return entry["facts"][kind]
+        value = compute()
+        if fingerprint is None:
+            return value
+        with self._lock:
+            self.stats["misses"] += 1
+            entry = self._facts.get(name)
+            if not entry or entry.get("crc") != fingerprint:
+                entry = {"crc": fingerprint, "facts": {}}
+                self._facts[name] = entry
+            entry["facts"][kind] = value
+            self._dirty = True
+        return value
+
+    def save(self):
+        if not self._dirty:
+            return
+        with self._lock:
+            # Descarta membros que não existem mais nesta versão do livro
+            members = {name: entry for name, entry in self._facts.items() if name in self.fingerprints}
+            payload = {"tool_version": Config.TOOL_VERSION, "members": members}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+            self._dirty = False
+        except (OSError, TypeError, ValueError):
+            tmp.unlink(missing_ok=True)
@@ -0,0 +1,146 @@
+import io
+import sys
+import time
+import asyncio
+import threading
+import contextvars
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import Config
+
+# kind: "thread" (pool de threads), "async" (event loop dedicado) ou
+# "background" (thread própria, para subprocessos longos como o EPubCheck)
+Stage = namedtuple('Stage', ['name', 'func', 'deps', 'kind'])
+
+# Buffer de console do estágio atual (propagado para threads e tasks via contextvars)
+_stage_output = contextvars.ContextVar('stage_output', default=None)
+
+
+class _StageStdout(io.TextIOBase):
+    """Encaminha print() para o buffer do estágio corrente, ou para o stdout real fora de estágios."""
+
+    def __init__(self, target):
+        self.target = target
+
+    def write(self, s):
+        buffer = _stage_output.get()
+        return (buffer if buffer is not None else self.target).write(s)
+
+    def flush(self):
+        self.target.flush()
+
+
+class Pipeline:
+    """
+    Grafo de estágios de um livro com dependências declaradas.
+    Estágios independentes rodam em paralelo; a saída de cada um é impressa em bloco
+    quando ele termina, e os instantes de início/fim ficam em `times` para o relatório.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or Config.PIPELINE_WORKERS
+        self.stages = {}
+        self.results = {}
+        self.errors = {}
+        self.times = {}  # nome -> (início, fim) em segundos desde o início do pipeline
+
+    def stage(self, name, func, deps=(), kind="thread"):
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"Estágio '{name}' depende de '{dep}', que não foi declarado antes.")
+        self.stages[name] = Stage(name, func, tuple(deps), kind)
+
+    # Os wrappers nunca propagam exceções: devolvem (erro, valor, saída) para o laço principal
+    def _timed(self, stage, t0):
+        buffer = io.StringIO()
+        _stage_output.set(buffer)
+        start = time.time() - t0
+        try:
+            return None, stage.func(), buffer
+        except Exception as e:
+            return e, None, buffer
+        finally:
+            self.times[stage.name] = (start, time.time() - t0)
+
+    async def _timed_async(self, stage, t0):
+        buffer = io.StringIO()
+        _stage_output.set(buffer)
+        start = time.time() - t0
+        try:
+            return None, await stage.func(), buffer
+        except Exception as e:
+            return e, None, buffer
+        finally:
+            self.times[stage.name] = (start, time.time() - t0)
+
+    def run(self):
+        """Executa todos os estágios respeitando as dependências. Retorna {nome: resultado}."""
+        t0 = time.time()
+        loop = asyncio.new_event_loop()
+        loop_thread = threading.Thread(target=loop.run_forever, daemon=True)
+        loop_thread.start()
+        pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="stage")
+        background = ThreadPoolExecutor(thread_name_prefix="background")
+
+        real_stdout = sys.stdout
+        sys.stdout = _StageStdout(real_stdout)
+        pending = dict(self.stages)
+        running = {}
+        try:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    failed_dep = next((d for d in stage.deps if d in self.errors), None)
+                    if failed_dep:
+                        self.errors[name] = RuntimeError(f"dependência '{failed_dep}' falhou")
+                        del pending[name]
+                        continue
+                    if not all(d in self.results for d in stage.deps):
+                        continue
+                    ctx = contextvars.copy_context()
+                    if stage.kind == "async":
+                        future = asyncio.run_coroutine_threadsafe(self._timed_async(stage, t0), loop)
+                    elif stage.kind == "background":
+                        future = background.submit(ctx.run, self._timed, stage, t0)
+                    else:
+                        future = pool.submit(ctx.run, self._timed, stage, t0)
+                    running[future] = name
+                    del pending[name]
+
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    error, value, buffer = future.result()
+                    # Saída do estágio em bloco, na ordem de término (linha a linha por causa do autoreset do colorama)
+                    for line in buffer.getvalue().splitlines(keepends=True):
+                        real_stdout.write(line)
+                    if error is not None:
+                        self.errors[name] = error
+                    else:
+                        self.results[name] = value
+        finally:
+            sys.stdout = real_stdout
+            pool.shutdown(wait=True)
+            background.shutdown(wait=True)
+            loop.call_soon_threadsafe(loop.stop)
+            loop_thread.join()
+            loop.close()
+        return self.results
+
+    def critical_path(self):
+        """
+        Caminho crítico: a partir do estágio que terminou por último, volta sempre
+        pela dependência que terminou mais tarde (a que de fato liberou o estágio).
+        """
+        if not self.times:
+            return []
+        current = max(self.times, key=lambda n: self.times[n][1])
+        path = [current]
+        while True:
+            deps = [d for d in self.stages[current].deps if d in self.times]
+            if not deps:
+                break
+            current = max(deps, key=lambda d: self.times[d][1])
+            path.append(current)
+        return list(reversed(path))
@@ -0,0 +1,151 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from pathlib import Path
+from config import Config
+
+# Incrementar ao mudar a forma da captura (ajuste de estilo, recorte), para invalidar PNGs antigos
+RENDER_VERSION = 1
+
+# Referências que alteram a renderização de um documento: folhas de estilo, imagens e objetos
+DEPENDENCY_XPATH = ('//link[contains(concat(" ", normalize-space(@rel), " "), " stylesheet ")]/@href'
+                    ' | //img/@src | //image/@href | //image/@*[name()="xlink:href"] | //object/@data'
+                    ' | //source/@src | //video/@poster')
+CSS_URL_RE = re.compile(r'''(?:@import\s+|url\()\s*['"]?([^'")\s;]+)''', re.IGNORECASE)
+
+
+def _css_hrefs(pkg, css):
+    """Referências locais de uma folha de estilo (@import e url(), como fontes e fundos), como escritas."""
+    found = []
+    for href in CSS_URL_RE.findall(pkg.text(css)):
+        if not href.startswith(('data:', 'http:', 'https:')) and href not in found:
+            found.append(href)
+    return found
+
+
+def _document_hrefs(pkg, member):
+    """Referências de folhas de estilo, imagens e objetos do documento, como escritas."""
+    tree = pkg.html(member)
+    if tree is None:
+        return []
+    return list(dict.fromkeys(str(href) for href in tree.xpath(DEPENDENCY_XPATH)))
+
+
+def _resolve_all(pkg, base, hrefs, deps):
+    for href in hrefs:
+        target = pkg.paths.resolve(base, href).member
+        if target and target not in deps:
+            deps.append(target)
+
+
+def _document_dependencies(pkg, member):
+    """Membros dos quais a renderização do documento depende (CSS em primeiro nível e o que eles usam)."""
+    # Os fatos guardam só os hrefs: a resolução depende dos demais membros do pacote
+    # (um CSS ou imagem pode ter sido incluído, removido ou renomeado) e é refeita a cada execução
+    deps = []
+    _resolve_all(pkg, member, pkg.facts('render_hrefs', member, lambda: _document_hrefs(pkg, member)), deps)
+    for css in [d for d in deps if d.lower().endswith('.css')]:
+        _resolve_all(pkg, css, pkg.facts('css_hrefs', css, lambda: _css_hrefs(pkg, css)), deps)
+    return deps
+
+
+class RenderCache:
+    """
+    Capturas de tela endereçadas por conteúdo: a chave combina o hash do XHTML, das folhas de
+    estilo e imagens que ele usa, o viewport e o elemento capturado; o valor é o PNG.
+    Elementos que não estavam visíveis ficam registrados para não reabrir a página.
+    O tamanho total é limitado com descarte LRU pela data de último acesso (mtime).
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None, enabled=True):
+        self.cache_dir = Path(cache_dir or Config.RENDER_CACHE_DIR)
+        self.max_bytes = max_bytes if max_bytes is not None else Config.RENDER_CACHE_MAX_MB * 1024 * 1024
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._member_hashes = {}
+        self.stats = {"hits": 0, "misses": 0}
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _member_hash(self, pkg, name):
+        if name not in self._member_hashes:
+            if name.lower().endswith(('.xhtml', '.html', '.htm', '.css')):
+                # Texto (já lido pelas verificações): SHA-256 do conteúdo
+                self._member_hashes[name] = hashlib.sha256(pkg.read(name)).hexdigest()
+            else:
+                # Imagens e fontes: CRC32 + tamanho do índice do ZIP, sem descompactar
+                info = pkg.zip.getinfo(name)
+                self._member_hashes[name] = f"{info.CRC:08x}-{info.file_size}"
+        return self._member_hashes[name]
+
+    def key_for(self, pkg, member, element, viewport):
+        """Chave do elemento `element` (ex.: "table:3" ou "page") do documento `member`."""
+        deps = _document_dependencies(pkg, member)
+        parts = {
+            "version": RENDER_VERSION,
+            "document": self._member_hash(pkg, member),
+            "dependencies": sorted(f"{d}={self._member_hash(pkg, d)}" for d in deps if pkg.exists(d)),
+            "viewport": viewport,
+            "element": element,
+        }
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+    def path_for(self, key):
+        return self.cache_dir / key[:2] / f"{key}.png"
+
+    def _invisible_marker(self, key):
+        return self.cache_dir / key[:2] / f"{key}.none"
+
+    def lookup(self, key):
+        """Caminho do PNG em cache, False se o elemento estava invisível, ou None se não houver entrada."""
+        if not self.enabled:
+            self.stats["misses"] += 1
+            return None
+        for path, value in ((self.path_for(key), None), (self._invisible_marker(key), False)):
+            if path.exists():
+                try:
+                    # Marca o acesso para a política LRU
+                    os.utime(path, None)
+                except OSError:
+                    continue
+                self.stats["hits"] += 1
+                return path if value is None else False
+        self.stats["misses"] += 1
+        return None
+
+    def temp_path(self, key):
+        """Destino provisório da captura; `store` o move para o lugar definitivo."""
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp.png")
+
+    def store(self, key, temp):
+        """Publica a captura feita em `temp` (None = elemento invisível). Retorna o caminho final."""
+        if temp is None:
+            marker = self._invisible_marker(key)
+            marker.parent.mkdir(parents=True, exist_ok=True)
+            marker.touch()
+            return None
+        path = self.path_for(key)
+        os.replace(temp, path)
+        return path
+
+    def evict(self):
+        """Remove as capturas menos usadas até o cache caber no limite configurado."""
+        with self._lock:
+            entries = []
+            for p in self.cache_dir.glob("*/*"):
+                if p.suffix not in (".png", ".none") or p.name.endswith(".tmp.png"):
+                    continue
+                try:
+                    st = p.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, p))
+            total = sum(size for _, size, _ in entries)
+            for _, size, p in sorted(entries, key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                p.unlink(missing_ok=True)
+                total -= size
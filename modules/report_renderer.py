@@ -0,0 +1,160 @@
+import re
+import html
+import json
+import string
+from pathlib import Path
+from modules.findings import Severity
+
+TEMPLATE_DIR = Path(__file__).resolve().parent.parent / "templates" / "report"
+
+# Altura máxima do console de logs (px); o restante é rolado de forma virtualizada
+LOG_CONSOLE_MAX_HEIGHT = 500
+LOG_ROW_HEIGHT = 26
+# Linhas de tabela acumuladas antes de cada escrita no arquivo
+ROWS_PER_WRITE = 2000
+
+# Ícone do cabeçalho de cada seção do console de logs
+SECTION_ICONS = {
+    "Sumário Técnico": "📑", "Links do Sumário Técnico": "🔗", "Sumário Visual (HTML)": "📖",
+    "Links do Sumário Visual": "📖", "Links Duplicados": "🔄", "Inconsistência de Conteúdo": "❓",
+    "Texto sem link detectado no Sumário": "⚠️", "Títulos parcialmente fora do <a>": "⚠️",
+    "Âncoras não encontradas": "❌", "Referências Internas": "🔗", "Estrutura": "❌"
+}
+MARKERS = {
+    Severity.PASS: "<span style='font-family:monospace; color:#27ae60;'>[ PASSOU ]</span>",
+    Severity.WARNING: "<span style='font-family:monospace; color:#f39c12;'>[ AVISO  ]</span>",
+    Severity.ERROR: "<span style='font-family:monospace; color:#c0392b;'>[ FALHOU ]</span>"
+}
+_CODE_RE = re.compile(r'`([^`]+)`')
+
+_cache = {}
+
+
+def _read(name):
+    if name not in _cache:
+        _cache[name] = (TEMPLATE_DIR / name).read_text(encoding='utf-8')
+    return _cache[name]
+
+
+def render(name, **values):
+    """Preenche o template ($variáveis do string.Template) e devolve o texto."""
+    return string.Template(_read(name)).substitute(values)
+
+
+def _json_text(value):
+    # "</" fecharia o <script> que embute os dados
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).replace('</', '<\\/')
+
+
+def _inline(text):
+    # Achados são texto simples: escapa e mostra os trechos entre crases como código
+    return _CODE_RE.sub(r'<code>\1</code>', html.escape(text, quote=False))
+
+
+def finding_lines(findings, verbose=False):
+    """
+    Linhas HTML do console de logs, agrupadas por seção na ordem em que aparecem.
+    Avisos e falhas são listados um a um; itens aprovados viram uma contagem (ou são listados com verbose).
+    """
+    sections = {}
+    for f in findings:
+        sections.setdefault(f.section or "", []).append(f)
+
+    for section, items in sections.items():
+        yield ""
+        yield f"{SECTION_ICONS.get(section, '📄')} <strong>{_inline(section)}</strong>"
+        passed = [f for f in items if f.severity == Severity.PASS]
+        failed = sum(1 for f in items if f.severity == Severity.ERROR)
+        warned = sum(1 for f in items if f.severity == Severity.WARNING)
+        for f in items:
+            if f.severity == Severity.INFO:
+                yield f"   └─ {_inline(f.message)}"
+        if failed:
+            yield f"   └─ {MARKERS[Severity.ERROR]} {failed} falha(s)"
+        elif warned:
+            yield f"   └─ {MARKERS[Severity.WARNING]} {warned} aviso(s)"
+        if len(passed) == 1 and not verbose:
+            yield f"   └─ {MARKERS[Severity.PASS]} {_inline(passed[0].message)}"
+        elif passed:
+            yield f"   └─ {MARKERS[Severity.PASS]} {len(passed)} itens validados"
+        for f in items:
+            if f.severity >= Severity.WARNING or (verbose and f.severity == Severity.PASS):
+                yield f"      {MARKERS[f.severity]} {_inline(f.message)}"
+
+
+class ReportWriter:
+    """
+    Escreve o relatório HTML seção por seção diretamente no arquivo.
+    Tabelas grandes não viram HTML no servidor: as linhas vão como JSON compacto
+    (textos repetidos guardados uma vez) e são paginadas/filtradas no navegador.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.f = None
+
+    def __enter__(self):
+        self.f = open(self.path, 'w', encoding='utf-8')
+        return self
+
+    def __exit__(self, *exc):
+        self.f.close()
+
+    def write(self, text):
+        self.f.write(text)
+
+    def render(self, name, **values):
+        self.f.write(render(name, **values))
+
+    def head(self, epub_name, header_credit):
+        self.render("head.html", epub_name=epub_name, header_credit=header_credit,
+                    styles=_read("report.css"), script=_read("report.js"))
+
+    def footer(self):
+        self.render("footer.html")
+
+    def _rows_json(self, source, rows):
+        """Grava {"rows": [[índices]], "strings": [...], ...} em blocos, sem montar o HTML das linhas."""
+        index = {"": 0}
+        strings = [""]
+        batch = []
+        first = True
+        self.write(f'<script type="application/json" id="{source}">{{"rows":[')
+        for row in rows:
+            cells = []
+            for cell in row:
+                if cell.__class__ is not str:
+                    cell = "" if cell is None else str(cell)
+                i = index.get(cell)
+                if i is None:
+                    i = index[cell] = len(strings)
+                    strings.append(cell)
+                cells.append(i)
+            batch.append(cells)
+            # Grava em blocos para não acumular a tabela inteira
+            if len(batch) == ROWS_PER_WRITE:
+                self.write(("" if first else ",") + _json_text(batch)[1:-1])
+                batch, first = [], False
+        if batch:
+            self.write(("" if first else ",") + _json_text(batch)[1:-1])
+        return strings
+
+    def data_table(self, name, columns, rows, render_as, empty, facet=None, facet_label=""):
+        """
+        Tabela paginada e filtrável. `rows` pode ser um gerador de listas de textos;
+        `render_as` escolhe o desenho da linha em report.js e `facet` é a coluna usada no seletor.
+        """
+        source = f"data-{name}"
+        self.render("data_table.html", source=source, render=render_as, empty=empty,
+                    facet_label=facet_label, headers="".join(f"<th>{c}</th>" for c in columns))
+        strings = self._rows_json(source, rows)
+        self.write(f'],"strings":{_json_text(strings)},"facet":{_json_text(facet)}}}</script>\n')
+
+    def log_console(self, name, lines):
+        """Console de logs com rolagem virtualizada (apenas as linhas visíveis ficam no DOM)."""
+        source = f"data-{name}"
+        lines = list(lines)
+        height = min(LOG_CONSOLE_MAX_HEIGHT, len(lines) * LOG_ROW_HEIGHT + 50)
+        self.render("log_console.html", source=source, height=height)
+        strings = self._rows_json(source, ([line] for line in lines))
+        self.write(f'],"strings":{_json_text(strings)}}}</script>\n')
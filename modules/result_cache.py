@@ -0,0 +1,122 @@
+import os
+import json
+import hashlib
+import zipfile
+import threading
+from pathlib import Path
+from config import Config
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    """SHA-256 do arquivo lido em blocos (não carrega o EPUB inteiro na memória)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def epubcheck_version(jar_path=None):
+    """Versão do EPubCheck lida do MANIFEST do .jar (ou tamanho/data do arquivo, se não houver)."""
+    jar_path = jar_path or Config.EPUBCHECK_JAR
+    try:
+        with zipfile.ZipFile(jar_path) as jar:
+            manifest = jar.read("META-INF/MANIFEST.MF").decode('utf-8', errors='ignore')
+        for line in manifest.splitlines():
+            if line.startswith("Implementation-Version:"):
+                return line.split(":", 1)[1].strip()
+    except (OSError, KeyError, zipfile.BadZipFile):
+        pass
+    try:
+        st = os.stat(jar_path)
+        return f"{st.st_size}-{int(st.st_mtime)}"
+    except OSError:
+        return "desconhecida"
+
+
+def config_fingerprint():
+    """Versão da ferramenta + parâmetros que alteram o resultado das verificações."""
+    relevant = {
+        "tool": Config.TOOL_VERSION,
+        "max_pixels": Config.MAX_IMAGE_PIXELS,
+        "quality_tolerance": Config.IMAGE_QUALITY_TOLERANCE,
+        "quality_threshold": Config.IMAGE_QUALITY_THRESHOLD,
+        "ai_model": Config.AI_MODEL,
+    }
+    prompts = Path("prompts.txt")
+    if prompts.exists():
+        relevant["prompts"] = hashlib.sha256(prompts.read_bytes()).hexdigest()
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class ResultCache:
+    """
+    Cache em disco dos resultados por livro, um JSON por chave
+    (SHA-256 do EPUB + versão do EPubCheck + versão/configuração da ferramenta).
+    O tamanho total é limitado com descarte LRU pela data de último acesso (mtime).
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None, enabled=True):
+        self.cache_dir = Path(cache_dir or Config.RESULT_CACHE_DIR)
+        self.max_bytes = max_bytes if max_bytes is not None else Config.RESULT_CACHE_MAX_MB * 1024 * 1024
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._checker_version = None
+        if self.enabled:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def key_for(self, epub_path):
+        if self._checker_version is None:
+            self._checker_version = epubcheck_version()
+        parts = [file_sha256(epub_path), self._checker_version, config_fingerprint()]
+        return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.json"
+
+    def load(self, key):
+        """Retorna os estágios em cache para a chave (dict vazio se não houver)."""
+        if not self.enabled:
+            return {}
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                stages = json.load(f)
+            # Marca o acesso para a política LRU
+            os.utime(path, None)
+            return stages
+        except (OSError, ValueError):
+            return {}
+
+    def store(self, key, stages):
+        if not self.enabled or not stages:
+            return
+        path = self._path(key)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(stages, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError):
+            tmp.unlink(missing_ok=True)
+            return
+        self.evict()
+
+    def evict(self):
+        """Remove as entradas menos usadas até o cache caber no limite configurado."""
+        with self._lock:
+            entries = []
+            for p in self.cache_dir.glob("*.json"):
+                try:
+                    st = p.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, p))
+            total = sum(size for _, size, _ in entries)
+            for _, size, p in sorted(entries, key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                p.unlink(missing_ok=True)
+                total -= size
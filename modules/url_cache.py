@@ -0,0 +1,82 @@
+import time
+import sqlite3
+from pathlib import Path
+from config import Config
+
+# Modos do cache de links:
+# "normal"  -> usa resultados dentro do TTL e revalida apenas os vencidos ou desconhecidos
+# "refresh" -> revalida todos os links e atualiza o cache
+# "off"     -> não lê nem grava o cache
+CACHE_MODES = ("normal", "refresh", "off")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS url_status (
+    url TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    final_url TEXT,
+    checked_at REAL NOT NULL,
+    error_class TEXT
+)
+"""
+
+
+class UrlCache:
+    """
+    Cache SQLite de status de URLs compartilhado entre livros e execuções.
+    Sucessos e falhas têm TTLs separados (falhas expiram antes, para serem retestadas).
+    """
+
+    def __init__(self, path=None, mode="normal", success_ttl=None, failure_ttl=None):
+        self.mode = mode if mode in CACHE_MODES else "normal"
+        self.success_ttl = success_ttl if success_ttl is not None else Config.LINK_CACHE_SUCCESS_TTL_HOURS * 3600
+        self.failure_ttl = failure_ttl if failure_ttl is not None else Config.LINK_CACHE_FAILURE_TTL_HOURS * 3600
+        self.conn = None
+        if self.mode == "off":
+            return
+        path = Path(path or Config.LINK_CACHE_PATH)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # WAL + timeout: vários processos do modo lote podem gravar ao mesmo tempo
+        self.conn = sqlite3.connect(str(path), timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def _is_fresh(self, ok, checked_at, now):
+        ttl = self.success_ttl if ok else self.failure_ttl
+        return now - checked_at < ttl
+
+    def lookup(self, urls):
+        """Resultados ainda válidos para as URLs pedidas (url -> resultado com cached=True)."""
+        if self.conn is None or self.mode == "refresh" or not urls:
+            return {}
+        now = time.time()
+        fresh = {}
+        urls = list(urls)
+        # Consulta em blocos para respeitar o limite de parâmetros do SQLite
+        for i in range(0, len(urls), 500):
+            chunk = urls[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT url, status, final_url, checked_at, error_class FROM url_status "
+                f"WHERE url IN ({','.join('?' * len(chunk))})", chunk)
+            for url, status, final_url, checked_at, error_class in rows:
+                status = int(status) if status.isdigit() else status
+                # Só links OK são gravados sem error_class
+                ok = error_class is None
+                if self._is_fresh(ok, checked_at, now):
+                    fresh[url] = {"url": url, "status": status, "final_url": final_url, "error_class": error_class,
+                                  "ok": ok, "checked_at": checked_at, "cached": True}
+        return fresh
+
+    def store(self, results):
+        if self.conn is None or not results:
+            return
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO url_status (url, status, final_url, checked_at, error_class) VALUES (?, ?, ?, ?, ?)",
+            [(r["url"], str(r["status"]), r.get("final_url"), now, r.get("error_class")) for r in results])
+        self.conn.commit()
@@ -1,14 +1,21 @@
+import os
+import time
 import base64
-import zipfile
-import shutil
+import asyncio
 import tempfile
-from pathlib import Path
-from openai import OpenAI
-from playwright.sync_api import sync_playwright
+import contextlib
+import mimetypes
+from pathlib import Path, PurePosixPath
+from urllib.parse import quote, unquote, urlsplit
 from colorama import Fore
 from config import Config
+from modules.browser_pool import get_pool, VIEWPORT
+from modules.ai_gateway import get_gateway, AIUnavailable
+from modules.render_cache import RenderCache
+from modules.vision_cache import VisionCache, perceptual_hash, is_near_duplicate
+from modules.layout_risk import content_documents, rank_candidates
 
-client = OpenAI(base_url=Config.AI_BASE_URL, api_key=Config.AI_API_KEY)
+NO_USAGE = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
 
 def load_prompt(key):
     """Carrega um prompt específico do arquivo prompts.txt."""
@@ -30,145 +37,314 @@ def load_prompt(key):
     except Exception as e:
         return f"Erro ao carregar prompt: {str(e)}"
 
-def check_visual_layout(epub_path, max_items=3):
+# Origem fictícia usada para servir os membros do ZIP ao navegador (modo "zip")
+EPUB_ORIGIN = "http://epub.local"
+MEDIA_TYPES = {".xhtml": "application/xhtml+xml", ".html": "text/html", ".css": "text/css", ".svg": "image/svg+xml"}
+
+async def _serve_from_zip(context, pkg, stats):
+    """
+    Atende as requisições à EPUB_ORIGIN com os bytes do membro lido do ZIP já aberto.
+    Só o que a página realmente pede é descompactado; nada vai para o disco.
+    """
+    media_types = {item["href"]: item["media_type"] for item in pkg.manifest.values() if item["media_type"]}
+    loop = asyncio.get_running_loop()
+
+    async def handle(route):
+        name = unquote(urlsplit(route.request.url).path).lstrip('/')
+        if not pkg.exists(name):
+            await route.fulfill(status=404, body="")
+            return
+        # Leitura no pool de threads para não travar as outras páginas; imagens não ficam em memória
+        body = await loop.run_in_executor(None, pkg.read, name, False)
+        stats["members_served"] += 1
+        stats["bytes_served"] += len(body)
+        content_type = (media_types.get(name) or MEDIA_TYPES.get(PurePosixPath(name).suffix.lower())
+                        or mimetypes.guess_type(name)[0] or "application/octet-stream")
+        await route.fulfill(status=200, body=body, content_type=content_type)
+
+    await context.route(f"{EPUB_ORIGIN}/**", handle)
+
+async def _render_file(context, url, targets, cache):
+    """
+    Abre um documento numa página própria do contexto e captura os alvos [(candidato, chave)]
+    (localizados pela tag e pela ordem entre os elementos da mesma tag; tag None = página inteira).
+    As capturas vão direto para o cache. Retorna [(candidato, PNG ou None se invisível)].
+    """
+    page = await context.new_page()
+    try:
+        await page.goto(url, wait_until="load")
+        rendered = []
+        for candidate, key in targets:
+            temp = cache.temp_path(key)
+            if candidate["tag"] is None:
+                await page.screenshot(path=str(temp))
+            else:
+                el = page.locator(candidate["tag"]).nth(candidate["ordinal"])
+                if not await el.count() or not await el.is_visible():
+                    rendered.append((candidate, cache.store(key, None)))
+                    continue
+                # Style tweak para melhor captura
+                await el.evaluate("el => { el.style.padding = '20px'; el.style.backgroundColor = 'white'; }")
+                await el.screenshot(path=str(temp))
+            rendered.append((candidate, cache.store(key, temp)))
+        return rendered
+    finally:
+        await page.close()
+
+async def _render_targets(pool, targets_by_file, url_for, cache, stats, pkg=None):
+    """
+    Renderiza num contexto isolado só os documentos com capturas fora do cache, até `pool.pages`
+    ao mesmo tempo. Com `pkg`, os documentos são servidos sob demanda a partir do ZIP.
+    """
+    rendered = []
+    async with pool.context() as context:
+        if pkg is not None:
+            await _serve_from_zip(context, pkg, stats)
+        files = list(targets_by_file.items())
+        for i in range(0, len(files), pool.pages):
+            window = files[i:i + pool.pages]
+            outcomes = await asyncio.gather(*[
+                _render_file(context, url_for(member), targets, cache) for member, targets in window
+            ])
+            stats["pages"] += len(window)
+            for file_rendered in outcomes:
+                rendered.extend(file_rendered)
+    return rendered
+
+def check_visual_layout(pkg, max_items=3, use_cache=True):
     """
     Analisa layout visual.
     max_items: Número máximo de elementos para analisar (None para todos/Full scan).
+    Os elementos são escolhidos por uma pré-classificação estática de risco (layout_risk), não pela
+    ordem dos arquivos. Capturas cujo documento, estilos e imagens não mudaram vêm do RenderCache,
+    sem abrir o navegador. Retorna (resultados, estatísticas de renderização).
     """
-    results = [] # Lista de dicts: {analysis, image_url, location}
+    results = [] # Lista de dicts: {content, model, usage, image_url, location, type, risk}
+    stats = {"candidates": 0, "ranking_seconds": 0.0, "cache_hits": 0, "pages": 0, "screenshots": 0,
+             "render_seconds": 0.0, "screenshots_per_second": 0.0, "browser_launch": 0.0, "concurrency": 0,
+             "source": Config.VISION_RENDER_SOURCE, "members_served": 0, "bytes_served": 0,
+             "ai_requests": 0, "ai_cache_hits": 0, "ai_duplicates": 0, "tokens_saved": 0,
+             "ai_queue_wait": 0.0, "ai_inference": 0.0, "ai_seconds": 0.0}
     
     try:
-        epub_stem = Path(epub_path).stem
-        img_dir = Path(f"reports/screenshots/{epub_stem}")
-        img_dir.mkdir(parents=True, exist_ok=True)
+        documents = content_documents(pkg)
+        if not documents:
+            return [{"analysis": "Aviso: Nenhum arquivo de conteúdo HTML encontrado.", "image_url": None}], stats
 
+        # Pré-classificação estática: só as páginas com os elementos de maior risco vão ao navegador
+        start = time.time()
+        ranked = rank_candidates(pkg, documents)
+        stats["candidates"] = len(ranked)
+        stats["ranking_seconds"] = time.time() - start
+        print(f"{Fore.CYAN}    [ INFO ] {len(ranked)} tabelas/listas classificadas por risco em {stats['ranking_seconds']:.2f}s.")
+        # Livro sem tabelas/listas complexas: print da página genérica do primeiro documento
+        if not ranked:
+            ranked = [{"file": documents[0], "tag": None, "ordinal": None, "index": None, "score": None, "reasons": []}]
+        for rank, candidate in enumerate(ranked):
+            candidate["rank"] = rank
 
+        cache = RenderCache(enabled=use_cache)
+        captures = [] # (candidato, PNG no cache)
+        pool = None
+        with contextlib.ExitStack() as stack:
+            position = 0
+            while position < len(ranked) and (max_items is None or len(captures) < max_items):
+                batch = ranked[position:] if max_items is None else ranked[position:position + max_items - len(captures)]
+                position += len(batch)
 
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_path = Path(temp_dir)
-            with zipfile.ZipFile(epub_path, 'r') as z:
-                z.extractall(temp_path)
-            
-            html_files = sorted([f for f in temp_path.rglob("*") if f.suffix in ('.xhtml', '.html') and 'nav' not in f.name.lower()])
-            
-            if not html_files:
-                return [{"analysis": "Aviso: Nenhum arquivo de conteúdo HTML encontrado.", "image_url": None}]
-
-            processed_count = 0
-
-            with sync_playwright() as p:
-                browser = p.chromium.launch()
-                page = browser.new_page()
-                page.set_viewport_size({"width": 800, "height": 1000})
-                
-                for html_file in html_files:
-                    if max_items is not None and processed_count >= max_items:
-                        break
-
-                    file_url = html_file.as_uri()
-                    page.goto(file_url)
-                    page.wait_for_load_state("networkidle")
-                    
-                    # Encontra elementos complexos (excluindo listas wrapper padrão .limitador)
-                    # Selector logic:
-                    # - table: sempre complexo
-                    # - div:not(.limitador) > ul: listas aninhadas em divs que NÃO sejam a wrapper padrão
-                    # - div:not(.limitador) > ol: idem
-                    elements = page.locator("table, div:not(.limitador) > ul, div:not(.limitador) > ol").all()
-                    
-                    # Se não tiver elementos complexos, tira um print da página genérica (apenas para o primeiro arquivo)
-                    if not elements and processed_count == 0:
-                         img_name = f"view_general_{html_file.stem}.png"
-                         img_path = img_dir / img_name
-                         page.screenshot(path=str(img_path))
-                         
-                         analysis, ai_model = analyze_image_with_ai(img_path, load_prompt("GENERAL_LAYOUT"))
-                         results.append({
-                             "location": html_file.name,
-                             "type": "General Layout",
-                             "image_url": f"screenshots/{epub_stem}/{img_name}",
-                             "analysis": analysis,
-                             "ai_model": ai_model
-                         })
-                         processed_count += 1
-                         continue
-
-                    for i, el in enumerate(elements):
-                        if max_items is not None and processed_count >= max_items:
-                            break
-                        
-                        if not el.is_visible(): continue
-
-                        img_name = f"view_{html_file.stem}_{i}.png"
-                        img_path = img_dir / img_name
-                        
-                        # Style tweak para melhor captura
-                        page.evaluate("el => { el.style.padding = '20px'; el.style.backgroundColor = 'white'; }", el.element_handle())
-                        el.screenshot(path=str(img_path))
-                        
-                        analysis, ai_model = analyze_image_with_ai(img_path, load_prompt("COMPLEX_STRUCTURE"))
-                        
-                        results.append({
-                            "location": f"{html_file.name} (Elemento {i+1})",
-                            "type": "Complex Structure",
-                            "image_url": f"screenshots/{epub_stem}/{img_name}",
-                            "analysis": analysis,
-                            "ai_model": ai_model
-                        })
-                        processed_count += 1
-
-                browser.close()
+                # Capturas já feitas (ou elementos já vistos invisíveis) não voltam ao navegador
+                misses = {}
+                for candidate in batch:
+                    element = f"{candidate['tag']}:{candidate['ordinal']}" if candidate["tag"] else "page"
+                    key = cache.key_for(pkg, candidate["file"], element, VIEWPORT)
+                    cached = cache.lookup(key)
+                    if cached:
+                        captures.append((candidate, cached))
+                    elif cached is None:
+                        misses.setdefault(candidate["file"], []).append((candidate, key))
+                if not misses:
+                    continue
+
+                if pool is None:
+                    if Config.VISION_RENDER_SOURCE == "extract":
+                        # Modo antigo: extrai o pacote inteiro e abre os arquivos via file://
+                        temp_path = Path(stack.enter_context(tempfile.TemporaryDirectory()))
+                        pkg.zip.extractall(temp_path)
+                        url_for = lambda member: (temp_path / member).as_uri()
+                        source = None
+                    else:
+                        url_for = lambda member: f"{EPUB_ORIGIN}/{quote(member)}"
+                        source = pkg
+                    # Navegador compartilhado pelo processo: só o primeiro livro paga a inicialização
+                    pool = get_pool()
+                    stats["browser_launch"] = pool.launch_time if pool.books == 0 else 0.0
+                    stats["concurrency"] = pool.pages
+                    pool.books += 1
+
+                start = time.time()
+                rendered = pool.run(_render_targets(pool, misses, url_for, cache, stats, pkg=source))
+                stats["render_seconds"] += time.time() - start
+                stats["screenshots"] += sum(1 for _, png in rendered if png)
+                captures.extend((candidate, png) for candidate, png in rendered if png)
+        cache.evict()
+
+        stats["cache_hits"] = cache.stats["hits"]
+        if stats["render_seconds"]:
+            stats["screenshots_per_second"] = stats["screenshots"] / stats["render_seconds"]
+        if pool is None:
+            print(f"{Fore.CYAN}    [ INFO ] {len(captures)} capturas reaproveitadas do cache; navegador não foi aberto.")
+        else:
+            print(f"{Fore.CYAN}    [ INFO ] {stats['screenshots']} capturas de {stats['pages']} páginas em {stats['render_seconds']:.2f}s "
+                  f"({stats['screenshots_per_second']:.1f} capturas/s, {pool.pages} páginas simultâneas); "
+                  f"{stats['cache_hits']} do cache.")
+            if source is not None:
+                print(f"{Fore.CYAN}    [ INFO ] {stats['members_served']} membros servidos do ZIP "
+                      f"({stats['bytes_served'] / 1024:.1f} KB), sem extração em disco.")
+
+        # Análise pela IA, do maior para o menor risco
+        captures.sort(key=lambda c: c[0]["rank"])
+        responses = VisionCache(enabled=use_cache)
+        analyzed = [] # (prompt, hash perceptual, item) das capturas enviadas ou vindas do cache
+        pending = [] # (item, original ou None, função que espera a resposta)
+        start = time.time()
+        for candidate, png in captures:
+            name = PurePosixPath(candidate["file"]).name
+            general = candidate["tag"] is None
+            prompt = load_prompt("GENERAL_LAYOUT" if general else "COMPLEX_STRUCTURE")
+            image_hash = perceptual_hash(png)
+            item = {
+                "location": name if general else f"{name} (Elemento {candidate['index'] + 1})",
+                "type": "General Layout" if general else "Complex Structure",
+                # O relatório aponta para o PNG do cache (sem cópias por execução)
+                "image_url": Path(os.path.relpath(png, "reports")).as_posix(),
+                "risk": "" if general else f"Risco {candidate['score']:.1f}: {', '.join(candidate['reasons'])}",
+            }
+            # Tabelas repetidas (quadros de dosagem, grades de respostas) vão uma só vez ao modelo
+            original = next((i for p, h, i in analyzed if p == prompt and is_near_duplicate(h, image_hash)), None)
+            if original is not None:
+                print(f"{Fore.CYAN}    [ INFO ] Captura de {name} quase idêntica a {original['location']}; sem novo envio à IA.")
+                pending.append((item, original, None))
+            else:
+                # Todas as capturas do livro seguem juntas para o gateway (limitado às vagas do servidor)
+                pending.append((item, None, submit_image_analysis(png, prompt, cache=responses)))
+                analyzed.append((prompt, image_hash, item))
+
+        for item, original, collect in pending:
+            if original is not None:
+                item.update({"content": original["content"], "model": original["model"], "usage": NO_USAGE,
+                             "note": f"Captura quase idêntica a {original['location']}; análise reaproveitada.",
+                             "saved_tokens": original["usage"]["total_tokens"] + original.get("saved_tokens", 0),
+                             "timing": None})
+                stats["ai_duplicates"] += 1
+            else:
+                item.update(collect())
+                if item.get("saved_tokens") is not None:
+                    stats["ai_cache_hits"] += 1
+                else:
+                    stats["ai_requests"] += 1
+                if item["timing"]:
+                    stats["ai_queue_wait"] += item["timing"]["queue_wait"]
+                    stats["ai_inference"] += item["timing"]["inference"]
+            stats["tokens_saved"] += item.get("saved_tokens", 0)
+            results.append(item)
+        stats["ai_seconds"] = time.time() - start
         
         if not results:
-             return [{"analysis": "Nenhuma estrutura complexa relevante encontrada para análise.", "image_url": None}]
+             return [{"analysis": "Nenhuma estrutura complexa relevante encontrada para análise.", "image_url": None}], stats
 
-        return results
+        return results, stats
 
     except Exception as e:
         print(f"{Fore.RED}    [!] Erro na visão: {e}")
-        return [{"analysis": f"Erro técnico: {str(e)}", "image_url": None}]
+        return [{"analysis": f"Erro técnico: {str(e)}", "image_url": None}], stats
+
+def _ai_error(content, unavailable=False):
+    return {
+        "content": content,
+        "model": "Erro/Desconhecido",
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        "timing": None,
+        "unavailable": unavailable
+    }
 
-def analyze_image_with_ai(img_path, prompt):
+def _usage(response):
+    return {
+        "prompt_tokens": response.usage.prompt_tokens,
+        "completion_tokens": response.usage.completion_tokens,
+        "total_tokens": response.usage.total_tokens
+    }
+
+def submit_image_analysis(img_path, prompt, cache=None):
+    """
+    Agenda a análise da captura no gateway de IA sem bloquear e retorna uma função que espera
+    o resultado {content, model, usage, timing}. Com `cache` (VisionCache), respostas anteriores
+    para a mesma imagem, prompt e modelo são reaproveitadas sem envio: usage zerado e `saved_tokens`.
+    """
     try:
         with open(img_path, "rb") as image_file:
-            img_b64 = base64.b64encode(image_file.read()).decode('utf-8')
+            img_bytes = image_file.read()
+
+        key = cache.key_for(img_bytes, prompt) if cache is not None and cache.enabled else None
+        stored = cache.load(key) if key else None
+        if stored:
+            print(f"{Fore.CYAN}    [ INFO ] Análise visual reaproveitada do cache.")
+            result = {
+                "content": stored["content"],
+                "model": stored["model"],
+                "usage": NO_USAGE,
+                "note": "Resposta da IA reaproveitada do cache.",
+                "saved_tokens": stored["usage"].get("total_tokens", 0),
+                "timing": None
+            }
+            return lambda: result
+        img_b64 = base64.b64encode(img_bytes).decode('utf-8')
 
         print(f"{Fore.BLUE}    [IA] Enviando captura para análise visual...")
-        response = client.chat.completions.create(
-            model=Config.AI_MODEL, 
-            messages=[{
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_b64}"}}
-                ]
-            }]
-        )
-        
-        content = response.choices[0].message.content
-        usage = {
-            "prompt_tokens": response.usage.prompt_tokens,
-            "completion_tokens": response.usage.completion_tokens,
-            "total_tokens": response.usage.total_tokens
-        }
-        
+        future = get_gateway().submit([{
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_b64}"}}
+            ]
+        }])
+    except Exception as e:
+        print(f"{Fore.RED}    [DEBUG] Erro na API de IA (Visual): {e}")
+        error = _ai_error(f"Erro na API de IA: {e}")
+        return lambda: error
+
+    def collect():
+        try:
+            response, timing = future.result()
+            content = response.choices[0].message.content
+            usage = _usage(response)
+        except AIUnavailable as e:
+            print(f"{Fore.YELLOW}    [      AVISO       ] IA indisponível; captura não analisada ({e}).")
+            return _ai_error(f"IA indisponível: {e}", unavailable=True)
+        except Exception as e:
+            e = str(e) or type(e).__name__
+            print(f"{Fore.RED}    [DEBUG] Erro na API de IA (Visual): {e}")
+            return _ai_error(f"Erro na API de IA: {e}")
+
         if not content:
             print(f"{Fore.RED}    [DEBUG] Resposta da IA vazia para análise visual.")
         else:
-            print(f"{Fore.GREEN}    [OK] Análise visual concluída. Uso: {usage['prompt_tokens']} prompt, {usage['completion_tokens']} resposta.")
-            
-        return {
+            print(f"{Fore.GREEN}    [OK] Análise visual concluída. Uso: {usage['prompt_tokens']} prompt, {usage['completion_tokens']} resposta "
+                  f"(fila {timing['queue_wait']:.2f}s, inferência {timing['inference']:.2f}s).")
+
+        result = {
             "content": content,
             "model": response.model,
             "usage": usage
         }
-    except Exception as e:
-        print(f"{Fore.RED}    [DEBUG] Erro na API de IA (Visual): {e}")
-        return {
-            "content": f"Erro na API de IA: {e}",
-            "model": "Erro/Desconhecido",
-            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
-        }
+        # Respostas vazias não entram no cache (o próximo envio tenta de novo)
+        if key and content:
+            cache.store(key, result)
+        return {**result, "timing": timing}
+    return collect
+
+def analyze_image_with_ai(img_path, prompt, cache=None):
+    """Versão bloqueante de submit_image_analysis, para uma captura."""
+    return submit_image_analysis(img_path, prompt, cache)()
 
 def get_ai_tech_advice(errors):
     """
@@ -206,35 +382,38 @@ def get_ai_tech_advice(errors):
     try:
         print(f"{Fore.BLUE}    [IA] Enviando logs para conselhos técnicos...")
         
-        response = client.chat.completions.create(
-            model=Config.AI_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_content}
-            ],
-            temperature=0.3
-        )
+        response, timing = get_gateway().chat([
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content}
+        ], temperature=0.3)
         
         content = response.choices[0].message.content
-        usage = {
-            "prompt_tokens": response.usage.prompt_tokens,
-            "completion_tokens": response.usage.completion_tokens,
-            "total_tokens": response.usage.total_tokens
-        }
+        usage = _usage(response)
 
         if not content:
             print(f"{Fore.RED}    [DEBUG] Resposta da IA vazia para conselhos técnicos.")
             # Se a resposta vier vazia mas houver erros, algo no modelo local falhou ou o prompt barrou tudo.
             content = "A IA não retornou sugestões para os erros fornecidos. Verifique se o modelo está carregado corretamente ou se os logs contêm caracteres que impedem a análise."
         else:
-            print(f"{Fore.GREEN}    [OK] Conselhos técnicos recebidos. Uso: {usage['prompt_tokens']} prompt, {usage['completion_tokens']} resposta.")
+            print(f"{Fore.GREEN}    [OK] Conselhos técnicos recebidos. Uso: {usage['prompt_tokens']} prompt, {usage['completion_tokens']} resposta "
+                  f"(fila {timing['queue_wait']:.2f}s, inferência {timing['inference']:.2f}s).")
 
         return {
             "content": content,
             "model": response.model,
-            "usage": usage
+            "usage": usage,
+            "timing": timing
+        }
+    except AIUnavailable as ex:
+        print(f"{Fore.YELLOW}    [      AVISO       ] IA indisponível; conselhos técnicos pulados ({ex}).")
+        return {
+            "content": "",
+            "model": "Erro/Desconhecido",
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            "unavailable": True
         }
     except Exception as ex:
+        ex = str(ex) or type(ex).__name__
         print(f"{Fore.RED}    [DEBUG] Erro na API de IA (Conselhos): {ex}")
         return {
             "content": "",
@@ -0,0 +1,123 @@
+import os
+import json
+import hashlib
+import threading
+from pathlib import Path
+from PIL import Image
+from config import Config
+
+# dHash horizontal + vertical de HASH_SIZE x HASH_SIZE bits cada (512 no total):
+# resistente a diferenças de compressão e antialiasing
+HASH_SIZE = 16
+# Diferença máxima de largura/altura (proporção) para duas capturas serem comparadas
+SIZE_TOLERANCE = 0.02
+
+
+def perceptual_hash(path, size=HASH_SIZE):
+    """
+    dHash da captura: compara o brilho de pixels vizinhos numa miniatura em tons de cinza,
+    na horizontal e na vertical (linhas de tabela só aparecem no gradiente vertical).
+    Retorna (hash hexadecimal, largura, altura) ou None se a imagem não puder ser lida.
+    """
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+            gray = img.convert("L").resize((size + 1, size + 1), Image.LANCZOS)
+    except (OSError, ValueError):
+        return None
+    pixels = list(gray.getdata())
+    at = lambda row, col: pixels[row * (size + 1) + col]
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            bits = (bits << 1) | (at(row, col) > at(row, col + 1))
+            bits = (bits << 1) | (at(row, col) > at(row + 1, col))
+    return f"{bits:0{size * size // 2}x}", width, height
+
+
+def is_near_duplicate(a, b, max_distance=None):
+    """Capturas quase idênticas: mesmas dimensões (com tolerância) e distância de Hamming pequena."""
+    if a is None or b is None:
+        return False
+    max_distance = Config.VISION_DEDUPE_DISTANCE if max_distance is None else max_distance
+    (hash_a, width_a, height_a), (hash_b, width_b, height_b) = a, b
+    if abs(width_a - width_b) > SIZE_TOLERANCE * max(width_a, width_b):
+        return False
+    if abs(height_a - height_b) > SIZE_TOLERANCE * max(height_a, height_b):
+        return False
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1") <= max_distance
+
+
+class VisionCache:
+    """
+    Cache em disco das respostas do modelo de visão, um JSON por chave
+    (SHA-256 da captura + texto do prompt + Config.AI_MODEL).
+    Livros de uma mesma série com tabelas idênticas reaproveitam a análise sem novo envio.
+    O tamanho total é limitado com descarte LRU pela data de último acesso (mtime).
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None, enabled=True):
+        self.cache_dir = Path(cache_dir or Config.VISION_CACHE_DIR)
+        self.max_bytes = max_bytes if max_bytes is not None else Config.VISION_CACHE_MAX_MB * 1024 * 1024
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+        if self.enabled:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def key_for(self, image_bytes, prompt, model=None):
+        parts = [hashlib.sha256(image_bytes).hexdigest(),
+                 hashlib.sha256(prompt.encode('utf-8')).hexdigest(),
+                 model or Config.AI_MODEL]
+        return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def load(self, key):
+        """Resposta em cache ({content, model, usage}) ou None."""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                response = json.load(f)
+            # Marca o acesso para a política LRU
+            os.utime(path, None)
+        except (OSError, ValueError):
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return response
+
+    def store(self, key, response):
+        if not self.enabled:
+            return
+        path = self._path(key)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(response, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError):
+            tmp.unlink(missing_ok=True)
+            return
+        self.evict()
+
+    def evict(self):
+        """Remove as respostas menos usadas até o cache caber no limite configurado."""
+        with self._lock:
+            entries = []
+            for p in self.cache_dir.glob("*/*.json"):
+                try:
+                    st = p.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, p))
+            total = sum(size for _, size, _ in entries)
+            for _, size, p in sorted(entries, key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                p.unlink(missing_ok=True)
+                total -= size
@@ -0,0 +1,151 @@
+function openModal(src) {
+    var modal = document.getElementById("myModal");
+    var modalImg = document.getElementById("img01");
+    modal.style.display = "block";
+    modalImg.src = src;
+}
+function closeModal() {
+    document.getElementById("myModal").style.display = "none";
+}
+
+(function () {
+    var LOG_ROW_HEIGHT = 26;
+    var SEVERITY_COLORS = { FATAL: "var(--error)", ERROR: "var(--error)", WARNING: "var(--warning)" };
+
+    function escapeHtml(text) {
+        return text.replace(/&/g, "&amp;").replace(/</g, "&lt;").replace(/>/g, "&gt;");
+    }
+
+    // Dados embutidos: {"rows": [[índices]], "strings": [...]}; textos repetidos aparecem uma vez só
+    function loadData(id) {
+        var data = JSON.parse(document.getElementById(id).textContent);
+        var strings = data.strings;
+        data.rows = data.rows.map(function (row) {
+            return row.map(function (i) { return strings[i]; });
+        });
+        return data;
+    }
+
+    // Uma função por tabela: recebe a linha (lista de textos) e devolve o <tr>
+    var renderers = {
+        epubcheck: function (r) {
+            var color = SEVERITY_COLORS[r[0]] || "var(--info)";
+            var snippet = r[3] ? "<div class='snippet'><code>" + escapeHtml(r[3]) + "</code></div>" : "";
+            return "<tr><td><span class='badge' style='background:" + color + "'>" + r[0] + "</span></td><td>" +
+                r[1] + "</td><td>" + r[2] + snippet + "</td></tr>";
+        },
+        links: function (r) {
+            var color = r[4] === "OK" ? "green" : "red";
+            var locations = r[3] ? "<div style='font-size:0.8rem; color:var(--text-muted)'>" + r[3] + "</div>" : "";
+            return "<tr><td>" + r[0] + locations + "</td><td style='color:" + color + "'>" + r[1] +
+                "</td><td style='font-size:0.85rem'>" + r[2] + "</td></tr>";
+        }
+    };
+
+    function DataTable(root) {
+        var data = loadData(root.dataset.source);
+        var render = renderers[root.dataset.render];
+        var tbody = root.querySelector("tbody");
+        var search = root.querySelector(".dt-search");
+        var facet = root.querySelector(".dt-facet");
+        var size = root.querySelector(".dt-size");
+        var info = root.querySelector(".dt-info");
+        var prev = root.querySelector(".dt-prev");
+        var next = root.querySelector(".dt-next");
+        var columns = root.querySelectorAll("th").length;
+        var filtered = data.rows;
+        var page = 0;
+        var timer = null;
+
+        if (data.facet === null) {
+            facet.style.display = "none";
+        } else {
+            var seen = {};
+            data.rows.forEach(function (r) { seen[r[data.facet]] = (seen[r[data.facet]] || 0) + 1; });
+            Object.keys(seen).sort().forEach(function (value) {
+                var option = document.createElement("option");
+                option.value = value;
+                option.textContent = value + " (" + seen[value] + ")";
+                facet.appendChild(option);
+            });
+        }
+
+        function searchable(r) {
+            if (r.text === undefined) r.text = r.join(" ").replace(/<[^>]*>/g, "").toLowerCase();
+            return r.text;
+        }
+
+        function apply() {
+            var query = search.value.trim().toLowerCase();
+            var value = facet.value;
+            filtered = data.rows.filter(function (r) {
+                if (value && r[data.facet] !== value) return false;
+                return !query || searchable(r).indexOf(query) !== -1;
+            });
+            page = 0;
+            draw();
+        }
+
+        function draw() {
+            var perPage = parseInt(size.value, 10);
+            var pages = Math.max(1, Math.ceil(filtered.length / perPage));
+            page = Math.min(page, pages - 1);
+            var slice = filtered.slice(page * perPage, (page + 1) * perPage);
+            if (slice.length) {
+                tbody.innerHTML = slice.map(render).join("");
+            } else {
+                var empty = data.rows.length ? "Nenhum resultado para o filtro." : root.dataset.empty;
+                tbody.innerHTML = "<tr><td colspan='" + columns + "'>" + empty + "</td></tr>";
+            }
+            info.textContent = filtered.length
+                ? (page * perPage + 1) + "–" + (page * perPage + slice.length) + " de " + filtered.length
+                : "0 de " + data.rows.length;
+            prev.disabled = page === 0;
+            next.disabled = page >= pages - 1;
+        }
+
+        search.addEventListener("input", function () {
+            clearTimeout(timer);
+            timer = setTimeout(apply, 150);
+        });
+        facet.addEventListener("change", apply);
+        size.addEventListener("change", draw);
+        prev.addEventListener("click", function () { page--; draw(); });
+        next.addEventListener("click", function () { page++; draw(); });
+        draw();
+    }
+
+    function VirtualLog(root) {
+        var lines = loadData(root.dataset.source).rows;
+        var spacer = root.querySelector(".vlog-spacer");
+        var view = root.querySelector(".vlog-window");
+        var pending = false;
+        spacer.style.height = lines.length * LOG_ROW_HEIGHT + "px";
+
+        function draw() {
+            pending = false;
+            var first = Math.max(0, Math.floor(root.scrollTop / LOG_ROW_HEIGHT) - 10);
+            var last = Math.min(lines.length, first + Math.ceil(root.clientHeight / LOG_ROW_HEIGHT) + 20);
+            view.style.transform = "translateY(" + first * LOG_ROW_HEIGHT + "px)";
+            view.innerHTML = lines.slice(first, last).map(function (r) {
+                return "<div class='log-line'>" + r[0] + "</div>";
+            }).join("");
+            view.querySelectorAll(".log-line").forEach(function (el) {
+                if (el.scrollWidth > el.clientWidth) el.title = el.textContent.trim();
+            });
+        }
+
+        root.addEventListener("scroll", function () {
+            if (!pending) {
+                pending = true;
+                requestAnimationFrame(draw);
+            }
+        });
+        draw();
+    }
+
+    document.addEventListener("DOMContentLoaded", function () {
+        document.querySelectorAll(".data-table").forEach(DataTable);
+        document.querySelectorAll(".vlog").forEach(VirtualLog);
+    });
+})();